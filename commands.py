@@ -0,0 +1,97 @@
+"""
+Flask CLI commands for one-off setup. Nothing here runs on import or app creation.
+
+    flask --app app init-db     create tables in the main and logs databases
+    flask --app app seed        create the super admin, default site and branding
+    flask --app app build-indexes [--site N]
+                                write compiled intent index snapshots
+    flask --app app cluster-questions [--rebuild] [--threshold 0.5]
+                                group new unanswered questions with similar ones
+"""
+import click
+from flask import current_app
+from database import db, init_db
+from models import Admin, BrandingSettings, Site
+from config import ADMIN_USERNAME, ADMIN_PASSWORD, DEFAULT_BRANDING
+
+
+def seed_defaults():
+    """Create the super admin, default site (ID 1) and default branding if missing. Idempotent."""
+    # 1. Super Admin
+    super_admin = Admin.query.filter_by(username=ADMIN_USERNAME).first()
+    if not super_admin:
+        print(f"Creating Super Admin: {ADMIN_USERNAME}")
+        super_admin = Admin(username=ADMIN_USERNAME, is_super=True)
+        super_admin.set_password(ADMIN_PASSWORD)
+        db.session.add(super_admin)
+        db.session.commit()
+
+    # 2. Default Site (ID: 1)
+    default_site = db.session.get(Site, 1)
+    if not default_site:
+        print("Creating Default Site (ID: 1)...")
+        default_site = Site(
+            name="Platform Demo",
+            domain="localhost",
+            bot_name="Demo Bot"
+        )
+        db.session.add(default_site)
+        db.session.commit()
+
+        # Link Super Admin to this site
+        super_admin.site_id = default_site.id
+        db.session.commit()
+
+    # 3. Default Branding
+    if BrandingSettings.query.count() == 0:
+        db.session.add(BrandingSettings(**DEFAULT_BRANDING))
+        db.session.commit()
+
+
+@click.command('init-db')
+def init_db_command():
+    """Create all tables (safe to re-run)."""
+    init_db(current_app)
+
+
+@click.command('build-indexes')
+@click.option('--site', 'site_id', type=int, default=None, help='Only this site')
+def build_indexes_command(site_id):
+    """Compile intent indexes and write their snapshots (e.g. after a deploy or restore)."""
+    from core.tenant_index import write_site_snapshot
+    site_ids = [site_id] if site_id is not None else [0] + [s.id for s in Site.query.order_by(Site.id)]
+    for sid in site_ids:
+        index = write_site_snapshot(sid)
+        print(f'  site {sid}: {index.phrase_count} phrases, {len(index.tokens)} tokens, version {index.version}')
+
+
+@click.command('cluster-questions')
+@click.option('--rebuild', is_flag=True, help='Drop existing clusters and cluster every question again')
+@click.option('--threshold', type=float, default=None, help='Similarity needed to join a cluster (0-1)')
+@click.option('--chunk-size', type=int, default=None, help='Questions read and committed at a time')
+@click.option('--top', type=int, default=10, help='Print this many of the most asked clusters')
+def cluster_questions_command(rebuild, threshold, chunk_size, top):
+    """Cluster unanswered questions that have no cluster yet (MinHash/LSH)."""
+    from models import QuestionCluster
+    from services.question_clusters import cluster_new_questions, reset_clusters
+    if rebuild:
+        reset_clusters()
+    stats = cluster_new_questions(threshold=threshold, chunk_size=chunk_size)
+    print(f"Clustered {stats['questions']} questions in {stats['seconds']}s: "
+          f"{stats['joined']} joined a cluster, {stats['new_clusters']} new clusters")
+    for cluster in QuestionCluster.query.order_by(QuestionCluster.times_asked.desc()).limit(top):
+        print(f'  #{cluster.id}  {cluster.size:>6} questions  {cluster.times_asked:>7} asks  {cluster.representative[:80]}')
+
+
+@click.command('seed')
+def seed_command():
+    """Create the super admin, default site and branding."""
+    seed_defaults()
+    print('Seed complete.')
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(build_indexes_command)
+    app.cli.add_command(cluster_questions_command)
@@ -7,6 +7,8 @@ from datetime import timedelta
 # Flask app configuration
 SECRET_KEY = 'your-secret-key-change-in-production'
 DEBUG = True
+# Budget for `from app import create_app; create_app()` (scripts/check_import_time.py)
+STARTUP_IMPORT_BUDGET_MS = int(os.getenv('STARTUP_IMPORT_BUDGET_MS', '1500'))
 
 # Get absolute path to database
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -16,9 +18,48 @@ DATABASE_PATH = os.path.join(BASE_DIR, 'instance', 'chatbot.db')
 SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH.replace(chr(92), "/")}'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Chat logs (and their rollups) live in their own SQLite file so the hot
+# intent/config database stays small; see services/chat_archive.py
+CHAT_LOG_DATABASE_PATH = os.getenv('CHAT_LOG_DATABASE_PATH', os.path.join(BASE_DIR, 'instance', 'chat_logs.db'))
+SQLALCHEMY_BINDS = {
+    'logs': f'sqlite:///{CHAT_LOG_DATABASE_PATH.replace(chr(92), "/")}'
+}
+
+# ChatLog retention: rows older than the site's chat_retention_days (default
+# below) are moved to compressed monthly NDJSON archives under CHAT_ARCHIVE_DIR
+CHAT_LOG_HOT_DAYS = int(os.getenv('CHAT_LOG_HOT_DAYS', '90'))
+CHAT_ARCHIVE_DIR = os.getenv('CHAT_ARCHIVE_DIR', os.path.join(BASE_DIR, 'instance', 'archive', 'chat_logs'))
+# Archived partitions older than this are deleted (0 = keep forever)
+CHAT_ARCHIVE_RETENTION_DAYS = int(os.getenv('CHAT_ARCHIVE_RETENTION_DAYS', '0'))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv('CHAT_ARCHIVE_BATCH_SIZE', '5000'))
+
 # AI Service configuration
 CONFIDENCE_THRESHOLD = 0.7  # Only answer if confidence >= 0.7
 
+# Bounded-cost scoring (core/intent_engine.py): messages are cut to this many characters and
+# distinct tokens, and scoring degrades embedding -> token -> exact within the budget
+SCORING_MAX_CHARS = int(os.getenv('SCORING_MAX_CHARS', '2000'))
+SCORING_MAX_TOKENS = int(os.getenv('SCORING_MAX_TOKENS', '64'))
+SCORING_EMBED_MAX_CHARS = int(os.getenv('SCORING_EMBED_MAX_CHARS', '1000'))  # ~ what the model reads anyway
+# Covers the embedding batch window plus a queued MiniLM batch on CPU; check the encode
+# latency scripts/bench_embeddings.py reports on the host and keep this above its p95
+SCORING_BUDGET_MS = float(os.getenv('SCORING_BUDGET_MS', '150'))
+SCORING_RESERVE_MS = float(os.getenv('SCORING_RESERVE_MS', '10'))  # kept for the phrase loop after embedding
+
+# Embedding model (optional, used when sentence-transformers is installed)
+EMBEDDING_MODEL_NAME = os.getenv('EMBEDDING_MODEL_NAME', 'all-MiniLM-L6-v2')
+# torch (default), onnx (exported model, CPU) or quantized (int8 dynamic quantization, CPU)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch').lower()
+# Directory written by scripts/export_embedding_model.py, used by the onnx backend
+EMBEDDING_MODEL_PATH = os.getenv('EMBEDDING_MODEL_PATH', os.path.join(BASE_DIR, 'instance', 'models', 'embeddings-onnx'))
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', 'onnx/model.onnx')
+# Micro-batching: wait up to this many ms for concurrent messages to join a batch
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_WAIT_MS', '4'))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', '32'))
+EMBEDDING_ENCODE_TIMEOUT = float(os.getenv('EMBEDDING_ENCODE_TIMEOUT', '5'))
+# LRU of recently encoded texts (messages and phrases)
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '4096'))
+
 # Session configuration
 PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
 
@@ -37,6 +78,70 @@ FALLBACK_MESSAGES = [
 CRM_WEBHOOK_URL = os.getenv('CRM_WEBHOOK_URL', 'http://localhost:5001/api/webhook/handoff')
 CRM_WEBHOOK_KEY = os.getenv('CRM_WEBHOOK_KEY', 'your-webhook-key-here')
 
+# Compiled intent indexes (core/tenant_index.py), persisted as mmap-able snapshots
+INDEX_SNAPSHOT_DIR = os.getenv('INDEX_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'instance', 'indexes'))
+# Patched indexes are written back once their site has had no edit for this long (in the background)
+INDEX_SNAPSHOT_DEBOUNCE_SECONDS = float(os.getenv('INDEX_SNAPSHOT_DEBOUNCE_SECONDS', '5'))
+# Per-worker memory budget for resident indexes; least recently used sites are evicted beyond it
+TENANT_CACHE_MAX_BYTES = int(os.getenv('TENANT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Load the busiest sites (by chats in the last TENANT_PREWARM_DAYS) when a worker starts
+TENANT_PREWARM_COUNT = int(os.getenv('TENANT_PREWARM_COUNT', '200'))
+TENANT_PREWARM_DAYS = int(os.getenv('TENANT_PREWARM_DAYS', '1'))
+
+# Cross-worker invalidation (services/tenant_changes.py)
+TENANT_POLL_INTERVAL = float(os.getenv('TENANT_POLL_INTERVAL', '2'))  # max staleness, seconds
+# Optional pub/sub to push changes instead of waiting for the next poll, e.g. redis://localhost:6379/0
+TENANT_PUBSUB_URL = os.getenv('TENANT_PUBSUB_URL', '')
+TENANT_PUBSUB_CHANNEL = os.getenv('TENANT_PUBSUB_CHANNEL', 'chatbot:tenant-changes')
+
+# Workflow execution (workflows/executor.py)
+# Shared thread pool size; raised to the sum of the workflows' max_concurrency if smaller
+WORKFLOW_MAX_WORKERS = int(os.getenv('WORKFLOW_MAX_WORKERS', '24'))
+WORKFLOW_DEFAULT_TIMEOUT = float(os.getenv('WORKFLOW_DEFAULT_TIMEOUT', '2.0'))  # seconds
+WORKFLOW_DEFAULT_CONCURRENCY = int(os.getenv('WORKFLOW_DEFAULT_CONCURRENCY', '8'))  # in-flight calls per workflow
+WORKFLOW_CACHE_MAX_ENTRIES = int(os.getenv('WORKFLOW_CACHE_MAX_ENTRIES', '10000'))
+WORKFLOW_HTTP_POOL_SIZE = int(os.getenv('WORKFLOW_HTTP_POOL_SIZE', '32'))  # keep-alive connections per host
+# External order status API used by track_order (overridable per site with ClientConfig 'order_api_url')
+ORDER_API_URL = os.getenv('ORDER_API_URL', '')
+# Per-site URLs must be https on a public address; hosts listed here (comma-separated) are trusted as they are
+ORDER_API_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv('ORDER_API_ALLOWED_HOSTS', '').split(',') if h.strip()}
+
+# Per-request SQL accounting (services/query_stats.py); off unless QUERY_STATS=true (tests and local profiling)
+QUERY_STATS = os.getenv('QUERY_STATS', 'false').lower() == 'true'
+QUERY_STATS_LOG_QUERIES = int(os.getenv('QUERY_STATS_LOG_QUERIES', '15'))  # log requests with this many statements
+QUERY_STATS_LOG_MS = float(os.getenv('QUERY_STATS_LOG_MS', '100'))  # ... or this much time in SQL
+
+# Widget WebSocket channel (routes/chat_socket.py, needs flask-sock). Under gthread every open
+# socket holds a worker thread, so by default half of GUNICORN_THREADS is left for plain HTTP
+# and idle sockets are closed quickly (the widget reopens one with its next message).
+CHAT_SOCKET_MAX_CONNECTIONS = int(os.getenv('CHAT_SOCKET_MAX_CONNECTIONS', str(max(1, int(os.getenv('GUNICORN_THREADS', '8')) // 2))))
+CHAT_SOCKET_MAX_PER_SITE = int(os.getenv('CHAT_SOCKET_MAX_PER_SITE', str(CHAT_SOCKET_MAX_CONNECTIONS)))
+CHAT_SOCKET_IDLE_SECONDS = int(os.getenv('CHAT_SOCKET_IDLE_SECONDS', '15'))  # close sockets with no message for this long
+
+# Admission control for the chat endpoints (services/admission.py). Per-site token buckets are
+# per worker unless ADMISSION_BACKEND_URL (redis) shares them across workers and nodes.
+ADMISSION_RATE = float(os.getenv('ADMISSION_RATE', '10'))  # messages/sec per site, refilled continuously
+ADMISSION_BURST = int(os.getenv('ADMISSION_BURST', '40'))  # bucket size
+ADMISSION_BACKEND_URL = os.getenv('ADMISSION_BACKEND_URL', '')
+# Chat requests a worker serves at once; one thread is kept for admin, history and assets
+ADMISSION_MAX_INFLIGHT = int(os.getenv('ADMISSION_MAX_INFLIGHT', str(max(1, int(os.getenv('GUNICORN_THREADS', '8')) - 1))))
+# One site's share of those; lower it on shared (multi-tenant) hosts so one site cannot take them all
+ADMISSION_MAX_PER_SITE = int(os.getenv('ADMISSION_MAX_PER_SITE', str(ADMISSION_MAX_INFLIGHT)))
+# Shedding steps, as the busy share of ADMISSION_MAX_INFLIGHT (at 1.0 requests get 429)
+ADMISSION_SKIP_EMBEDDINGS_AT = float(os.getenv('ADMISSION_SKIP_EMBEDDINGS_AT', '0.5'))
+ADMISSION_DEFER_LOGGING_AT = float(os.getenv('ADMISSION_DEFER_LOGGING_AT', '0.75'))
+ADMISSION_MIN_LEVEL = int(os.getenv('ADMISSION_MIN_LEVEL', '0'))  # force a degraded mode, e.g. 1 = never embed
+ADMISSION_DEFERRED_MAX = int(os.getenv('ADMISSION_DEFERRED_MAX', '5000'))  # held chat logs; beyond, they are written at once
+ADMISSION_DEFERRED_FLUSH_SECONDS = float(os.getenv('ADMISSION_DEFERRED_FLUSH_SECONDS', '2'))
+
+# FAQ full-text fallback (services/faq_search.py)
+FAQ_SEARCH_CANDIDATES = int(os.getenv('FAQ_SEARCH_CANDIDATES', '5'))  # best-ranked FAQs checked per message
+FAQ_SEARCH_MIN_COVERAGE = float(os.getenv('FAQ_SEARCH_MIN_COVERAGE', '0.5'))  # share of message words an FAQ must contain
+
+# Clustering of unanswered questions (services/question_clusters.py, flask cluster-questions)
+QUESTION_CLUSTER_THRESHOLD = float(os.getenv('QUESTION_CLUSTER_THRESHOLD', '0.5'))  # estimated Jaccard of word sets
+QUESTION_CLUSTER_CHUNK_SIZE = int(os.getenv('QUESTION_CLUSTER_CHUNK_SIZE', '5000'))  # rows read and committed at a time
+
 # Handoff Keywords - trigger CRM webhook if user mentions these
 HANDOFF_KEYWORDS = [
     'agent', 'human', 'representative', 'help', 'support',
@@ -47,6 +152,12 @@ HANDOFF_KEYWORDS = [
 
 # Session configuration for conversation history
 SESSION_HISTORY_MAX = 10  # Store last 10 messages per session
+# In-process session store (services/session_store.py)
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', str(30 * 60)))  # seconds without activity before eviction
+SESSION_STORE_MAX_SESSIONS = int(os.getenv('SESSION_STORE_MAX_SESSIONS', '20000'))
+SESSION_STORE_MAX_BYTES = int(os.getenv('SESSION_STORE_MAX_BYTES', str(64 * 1024 * 1024)))
+# A "yes" only confirms the intent the bot asked about this recently (the store is per worker)
+SESSION_PENDING_INTENT_TTL = int(os.getenv('SESSION_PENDING_INTENT_TTL', '120'))
 
 # ===== WIDGET & BRANDING CONFIGURATION =====
 
@@ -54,6 +165,23 @@ SESSION_HISTORY_MAX = 10  # Store last 10 messages per session
 WIDGET_EMBED_URL = os.getenv('WIDGET_EMBED_URL', 'http://localhost:5000')
 WIDGET_ENABLE_CORS = os.getenv('WIDGET_ENABLE_CORS', 'true').lower() == 'true'
 
+# HTTP caching for widget bootstrap traffic
+WIDGET_SETTINGS_CACHE_TTL = int(os.getenv('WIDGET_SETTINGS_CACHE_TTL', '60'))  # in-process cache, seconds
+WIDGET_SETTINGS_CACHE_MAX_SITES = int(os.getenv('WIDGET_SETTINGS_CACHE_MAX_SITES', '10000'))  # LRU bound, site ids
+WIDGET_SETTINGS_MAX_AGE = int(os.getenv('WIDGET_SETTINGS_MAX_AGE', '300'))  # browser/CDN Cache-Control
+WIDGET_LOADER_MAX_AGE = int(os.getenv('WIDGET_LOADER_MAX_AGE', '300'))  # /widget.js loader
+ASSET_MAX_AGE = 365 * 24 * 3600  # content-hashed /assets/<digest>/... URLs are immutable
+# Re-read widget files when they change on disk (widget development); off, they are read once per process
+ASSETS_RELOAD = os.getenv('ASSETS_RELOAD', 'false').lower() == 'true'
+
+# Edge bundle: top static intents answered inside the widget (services/edge_bundle.py)
+EDGE_BUNDLE_MAX_INTENTS = int(os.getenv('EDGE_BUNDLE_MAX_INTENTS', '20'))
+EDGE_BUNDLE_DAYS = int(os.getenv('EDGE_BUNDLE_DAYS', '7'))  # traffic window used to rank intents
+EDGE_BUNDLE_MIN_CONFIDENCE = float(os.getenv('EDGE_BUNDLE_MIN_CONFIDENCE', '0.8'))  # server confidence a phrase must reach
+EDGE_BUNDLE_CACHE_TTL = int(os.getenv('EDGE_BUNDLE_CACHE_TTL', '600'))  # in-process cache; rankings drift slowly
+EDGE_BUNDLE_MAX_AGE = int(os.getenv('EDGE_BUNDLE_MAX_AGE', '300'))  # browser/CDN Cache-Control
+EDGE_HITS_MAX_BATCH = int(os.getenv('EDGE_HITS_MAX_BATCH', '50'))  # locally answered messages per report
+
 # Default Branding Settings
 DEFAULT_BRANDING = {
     'bot_name': 'AlinaX ChatBot',
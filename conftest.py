@@ -0,0 +1,75 @@
+"""
+Shared pytest fixtures.
+
+app     create_app() on throwaway SQLite files (main and logs), tables created
+        and seeded, with per-request SQL accounting on (services/query_stats.py)
+client  the app's test client; the test fails if any request it made went over
+        its view's @query_budget, listing the statements that request issued
+db_session  the app's db.session inside an app context
+
+Process-wide caches (compiled indexes, widget settings, workflow results,
+sessions, the tenant version watcher) are reset around every test so
+nothing leaks between databases.
+"""
+import pytest
+
+
+def _reset_process_state():
+    from core import tenant_index
+    from services import widget_settings
+    from services.session_store import session_store
+    from services.tenant_changes import watcher
+    from workflows.executor import invalidate_cache
+
+    tenant_index.invalidate()
+    widget_settings.invalidate()
+    invalidate_cache()
+    session_store.clear()
+    watcher.last_seq = None
+    watcher.versions.clear()
+    watcher.poke()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from app import create_app
+    from commands import seed_defaults
+    from database import db
+    import core.tenant_index
+
+    monkeypatch.setattr(core.tenant_index, 'INDEX_SNAPSHOT_DIR', str(tmp_path / 'indexes'))
+    app = create_app({
+        'TESTING': True,
+        'QUERY_STATS': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "chatbot.db"}',
+        'SQLALCHEMY_BINDS': {'logs': f'sqlite:///{tmp_path / "chat_logs.db"}'},
+    })
+    _reset_process_state()
+    with app.app_context():
+        db.create_all()
+        seed_defaults()
+    yield app
+    _reset_process_state()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    violations = app.extensions['query_stats'].violations
+    yield app.test_client()
+    if violations:
+        report = []
+        for endpoint, stats, budget in violations:
+            report.append(f'{endpoint}: {stats.queries} queries, budget {budget}')
+            report.extend(f'    {statement}' for statement in stats.statements)
+        pytest.fail('Query budget exceeded:\n' + '\n'.join(report), pytrace=False)
+
+
+@pytest.fixture
+def db_session(app):
+    from database import db
+
+    with app.app_context():
+        yield db.session
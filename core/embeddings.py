@@ -0,0 +1,265 @@
+"""Sentence embedding support for the intent engine.
+
+sentence-transformers is optional. When it is installed the model is loaded
+lazily (once per process) and every chat message is encoded through a shared
+EmbeddingBatcher: concurrent requests are queued, coalesced into one
+MODEL.encode() call within a short wait window and handed their own row
+back. Recently encoded texts are kept in an LRU so repeated messages and
+phrases are never encoded twice.
+
+Backends (config.EMBEDDING_BACKEND):
+- torch:     the stock SentenceTransformer model
+- onnx:      a model exported by scripts/export_embedding_model.py (CPU hosts)
+- quantized: the torch model with int8 dynamic quantization of Linear layers
+"""
+import importlib.util
+import os
+import queue
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_MODEL_PATH, EMBEDDING_ONNX_FILE,
+    EMBEDDING_BATCH_WAIT_MS, EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_ENCODE_TIMEOUT,
+    EMBEDDING_CACHE_SIZE
+)
+
+# Importing sentence-transformers pulls in torch (seconds of CPU), so only
+# check that it is installed here and import it with the model on first use.
+USE_EMBEDDINGS = importlib.util.find_spec('sentence_transformers') is not None
+SentenceTransformer = None
+st_util = None
+torch = None
+
+MODEL = None
+_model_lock = threading.Lock()
+_model_failed = False
+
+
+def _import_backend():
+    global SentenceTransformer, st_util, torch
+    if SentenceTransformer is None:
+        from sentence_transformers import SentenceTransformer as _st, util as _util
+        import torch as _torch
+        SentenceTransformer, st_util, torch = _st, _util, _torch
+
+
+def load_model(backend: str = EMBEDDING_BACKEND):
+    """Build a SentenceTransformer for the configured backend."""
+    _import_backend()
+    if backend == 'onnx':
+        model_kwargs = {'file_name': EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+        source = EMBEDDING_MODEL_PATH if os.path.isdir(EMBEDDING_MODEL_PATH) else EMBEDDING_MODEL_NAME
+        return SentenceTransformer(source, backend='onnx', model_kwargs=model_kwargs)
+
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu' if backend == 'quantized' else None)
+    if backend == 'quantized':
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def get_model():
+    """Return the process-wide model, loading it on first use. None if unavailable."""
+    global MODEL, USE_EMBEDDINGS, _model_failed
+    if MODEL is not None or not USE_EMBEDDINGS or _model_failed:
+        return MODEL
+    with _model_lock:
+        if MODEL is None and not _model_failed:
+            try:
+                MODEL = load_model()
+            except Exception as e:
+                print(f"Embedding model unavailable ({EMBEDDING_BACKEND}): {e}")
+                _model_failed = True
+                USE_EMBEDDINGS = False
+    return MODEL
+
+
+def embeddings_available() -> bool:
+    return get_model() is not None
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent single-text encodes into small batches.
+
+    encode() blocks the calling request until its batch has been encoded.
+    A single daemon worker thread drains the queue: it takes the first
+    pending text, waits at most `wait_ms` for more to arrive (up to
+    `max_batch_size`) and encodes them together.
+    """
+
+    def __init__(self, model=None, wait_ms: float = EMBEDDING_BATCH_WAIT_MS,
+                 max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE, cache_size: int = EMBEDDING_CACHE_SIZE):
+        self._model = model
+        self.wait = max(0.0, wait_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.stats = {'requests': 0, 'cache_hits': 0, 'cancelled': 0, 'batches': 0, 'batched_items': 0, 'max_batch': 0}
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else get_model()
+
+    # --- cache ---
+
+    def _cache_get(self, text):
+        with self._cache_lock:
+            emb = self._cache.get(text)
+            if emb is not None:
+                self._cache.move_to_end(text)
+            return emb
+
+    def _cache_put(self, text, emb):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[text] = emb
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- worker ---
+
+    def _ensure_worker(self):
+        # Threads do not survive fork (gunicorn preload), so restart per pid
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        # Requests that timed out cancelled their future: nobody is waiting for those rows
+        live = [(text, fut) for text, fut in batch if fut.set_running_or_notify_cancel()]
+        self.stats['cancelled'] += len(batch) - len(live)
+        batch = live
+        if not batch:
+            return
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embs = self.model.encode(texts, convert_to_tensor=True, batch_size=len(texts))
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        rows = {text: embs[i] for i, text in enumerate(texts)}
+        for text, emb in rows.items():
+            self._cache_put(text, emb)
+        for text, fut in batch:
+            fut.set_result(rows[text])
+        self.stats['batches'] += 1
+        self.stats['batched_items'] += len(batch)
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+
+    # --- public API ---
+
+    def encode(self, text: str, timeout: float = EMBEDDING_ENCODE_TIMEOUT):
+        """Return the embedding (1-D tensor) for a single text.
+
+        Raises concurrent.futures.TimeoutError after `timeout` seconds; the
+        request is then cancelled and left out of its batch if not yet encoded.
+        """
+        self.stats['requests'] += 1
+        emb = self._cache_get(text)
+        if emb is not None:
+            self.stats['cache_hits'] += 1
+            return emb
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((text, fut))
+        try:
+            return fut.result(timeout=timeout)
+        except TimeoutError:
+            fut.cancel()
+            raise
+
+    def encode_many(self, texts):
+        """Encode a list of texts in one call, reusing cached rows. Returns a list of rows."""
+        out = [self._cache_get(t) for t in texts]
+        missing = list(dict.fromkeys(t for t, emb in zip(texts, out) if emb is None))
+        if missing:
+            embs = self.model.encode(missing, convert_to_tensor=True)
+            fresh = {t: embs[i] for i, t in enumerate(missing)}
+            for t, emb in fresh.items():
+                self._cache_put(t, emb)
+            out = [emb if emb is not None else fresh[t] for t, emb in zip(texts, out)]
+        return out
+
+
+_batcher = None
+
+
+def get_batcher() -> EmbeddingBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = EmbeddingBatcher()
+    return _batcher
+
+
+def cosine_scores(msg_emb, rows):
+    """Cosine similarity of one embedding against a list of rows (or a stacked matrix), as floats."""
+    if rows is None or len(rows) == 0:
+        return []
+    matrix = rows if torch.is_tensor(rows) else torch.stack(rows)
+    # Phrase matrices live on the CPU (snapshots, mmap); the message row may come from a GPU model
+    sims = st_util.cos_sim(msg_emb.to(device=matrix.device, dtype=matrix.dtype), matrix)
+    return [float(s) for s in sims.cpu().numpy().flatten()]
+
+
+def stack_embeddings(rows):
+    """One float32 CPU matrix from a list of encoded rows."""
+    return torch.stack(rows).to(device='cpu', dtype=torch.float32)
+
+
+def append_row(matrix, row):
+    """The matrix with one encoded row added at the bottom."""
+    return torch.cat([matrix, row.to(device='cpu', dtype=torch.float32).reshape(1, -1)])
+
+
+def select_rows(matrix, positions):
+    """A new matrix made of the given rows, in order."""
+    return matrix.index_select(0, torch.tensor(positions, dtype=torch.long))
+
+
+def matrix_to_bytes(matrix) -> bytes:
+    return matrix.to(device='cpu', dtype=torch.float32).contiguous().numpy().tobytes()
+
+
+def matrix_from_buffer(buffer, rows: int, dim: int):
+    """float32 matrix viewing raw bytes, not copying them: a read-only mmap stays shared between workers.
+
+    The matrix is never written to (append_row and select_rows build new ones).
+    """
+    _import_backend()
+    if rows == 0 or dim == 0:
+        return torch.zeros((rows, dim), dtype=torch.float32)
+    with warnings.catch_warnings():
+        # torch warns that the tensor views a non-writable buffer
+        warnings.simplefilter('ignore', UserWarning)
+        return torch.frombuffer(buffer, dtype=torch.float32).reshape(rows, dim)
@@ -0,0 +1,145 @@
+"""
+Symmetric-delete lookup of fuzzy token neighbours.
+
+detect_intent treats a phrase token as matched when fuzz.ratio against a
+message token reaches FUZZY_TOKEN_THRESHOLD. Instead of calling fuzz.ratio
+for every (phrase token, message token) pair, FuzzyVocabulary precomputes
+the strings reachable from each vocabulary token by deleting characters
+(SymSpell), so the candidates for a message token are found by looking up
+its own deletes, and only those candidates are scored with fuzz.ratio.
+
+The delete depth is chosen so no pair above the threshold can be missed.
+fuzz.ratio is at most 2*LCS/(la+lb) (difflib's matching blocks, and
+Levenshtein's indel ratio, are both bounded by the longest common
+subsequence), so a pair scoring at least t needs no more than
+floor(len * 2(1-t)/(2-t)) deletions from either token to reach a common
+string: 1 for 3-5 characters, 2 for 6-8, 3 for 9-11. Tokens that would need
+more than MAX_DELETES are kept in per-length lists and compared directly,
+after a length check. Scores are still fuzz.ratio's own, so results are
+identical to the pairwise loop.
+
+Deletes are stored as one sorted int64 array of (hash << ID_BITS | token id)
+rather than a dict, about 8 bytes per entry. Hash collisions only add
+candidates, which fuzz.ratio then rejects.
+"""
+import sys
+from array import array
+from bisect import bisect_left
+from thefuzz import fuzz
+
+MAX_DELETES = 3
+ID_BITS = 22
+ID_MASK = (1 << ID_BITS) - 1
+HASH_MASK = (1 << (63 - ID_BITS)) - 1
+# Neighbour sets cached per message token, reset when the vocabulary grows
+MEMO_SIZE = 4096
+
+
+def max_deletes(length: int, threshold: int) -> int:
+    # fuzz.ratio rounds, so t is the lowest raw ratio that still reaches the threshold
+    t = (threshold - 0.5) / 100.0 - 1e-9
+    return int(length * 2 * (1 - t) / (2 - t))
+
+
+def length_feasible(la: int, lb: int, threshold: int) -> bool:
+    """Whether tokens of these lengths can reach the threshold at all."""
+    t = (threshold - 0.5) / 100.0 - 1e-9
+    return 2 * min(la, lb) >= t * (la + lb)
+
+
+def deletes(token: str, depth: int) -> set:
+    """The token and every string made by deleting up to `depth` characters from it."""
+    variants = {token}
+    level = variants
+    for _ in range(depth):
+        level = {w[:i] + w[i + 1:] for w in level for i in range(len(w))}
+        variants |= level
+    return variants
+
+
+class FuzzyVocabulary:
+    """Fuzzy neighbours of arbitrary tokens among a list of vocabulary tokens.
+
+    `tokens` is shared with the owner (TenantIndex.tokens); tokens appended
+    to it later are registered with add().
+    """
+
+    def __init__(self, tokens, threshold: int):
+        self.tokens = tokens
+        self.threshold = threshold
+        self._by_length = {}   # length -> token ids, for direct comparison
+        self._long = {}        # length -> ids of tokens deeper than MAX_DELETES
+        self._extra = {}       # delete hash -> ids added after the build
+        self._memo = {}
+        keys = []
+        for tid, tok in enumerate(tokens):
+            for key in self._register(tid, tok):
+                keys.append(key)
+        self._keys = array('q', sorted(keys))
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._by_length.values())
+
+    def _register(self, tid, tok):
+        length = len(tok)
+        self._by_length.setdefault(length, array('i')).append(tid)
+        depth = max_deletes(length, self.threshold)
+        if depth > MAX_DELETES or tid > ID_MASK:
+            self._long.setdefault(length, array('i')).append(tid)
+            return
+        for variant in deletes(tok, depth):
+            yield ((hash(variant) & HASH_MASK) << ID_BITS) | tid
+
+    def add(self, tid):
+        """Register tokens[tid], appended after the vocabulary was built."""
+        for key in self._register(tid, self.tokens[tid]):
+            self._extra.setdefault(key >> ID_BITS, []).append(tid)
+        # Readers that captured the old memo write into it, not into this one
+        self._memo = {}
+
+    def _candidates(self, token) -> set:
+        length = len(token)
+        threshold = self.threshold
+        depth = max_deletes(length, threshold)
+        if depth > MAX_DELETES:
+            return {tid for other, ids in self._by_length.items()
+                    if length_feasible(length, other, threshold) for tid in ids}
+
+        keys, extra = self._keys, self._extra
+        candidates = set()
+        for variant in deletes(token, depth):
+            h = hash(variant) & HASH_MASK
+            lo = bisect_left(keys, h << ID_BITS)
+            hi = bisect_left(keys, (h + 1) << ID_BITS, lo)
+            for i in range(lo, hi):
+                candidates.add(keys[i] & ID_MASK)
+            candidates.update(extra.get(h, ()))
+        for other, ids in self._long.items():
+            if length_feasible(length, other, threshold):
+                candidates.update(ids)
+        return candidates
+
+    def neighbours(self, token) -> dict:
+        """{token id: fuzz.ratio / 100} for vocabulary tokens at or above the threshold."""
+        memo = self._memo
+        found = memo.get(token)
+        if found is not None:
+            return found
+        tokens, threshold = self.tokens, self.threshold
+        found = {}
+        for tid in self._candidates(token):
+            # same argument order as the pairwise loop: difflib's ratio is not symmetric
+            score = fuzz.ratio(tokens[tid], token) / 100.0
+            if score * 100 >= threshold:
+                found[tid] = score
+        if len(memo) >= MEMO_SIZE:
+            memo.clear()
+        memo[token] = found
+        return found
+
+    def memory_bytes(self) -> int:
+        size = sys.getsizeof(self._keys) + sys.getsizeof(self._by_length) + sys.getsizeof(self._long)
+        size += sum(sys.getsizeof(ids) for ids in self._by_length.values())
+        size += sum(sys.getsizeof(ids) for ids in self._long.values())
+        size += sys.getsizeof(self._extra) + sum(sys.getsizeof(ids) for ids in self._extra.values())
+        return size
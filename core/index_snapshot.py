@@ -0,0 +1,195 @@
+"""
+Binary snapshot format for compiled tenant indexes.
+
+One file per site (INDEX_SNAPSHOT_DIR/site_<id>.idx), little-endian:
+
+    header   magic 'CBTIDX\\0\\1', format version, flags, site_id,
+             intents_version, element counts
+    table    (offset, length) of each section below
+    sections 8-byte aligned:
+             token_blob      utf-8 tokens, concatenated
+             token_offsets   uint32[n_tokens + 1] into token_blob
+             canon           int32[n_tokens]
+             intents         utf-8 JSON, one IntentRecord field list per intent
+             phrase_intent   int32[n_phrases]
+             phrase_offsets  uint32[n_phrases + 1] into phrase_tokens
+             phrase_tokens   int32[n_phrase_tokens]
+             phrase_weights  uint8[n_phrase_tokens] weight classes
+             phrase_totals   float64[n_phrases]
+             phrase_ids      int32[n_phrases] IntentPhrase ids
+             embeddings      float32[n_phrases * emb_dim] (FLAG_EMBEDDINGS only)
+
+FLAG_EMBEDDINGS_FAILED marks an index whose phrases could not be encoded.
+A snapshot with embeddings read where the embedding backend is not
+installed is loaded without them (token scoring only). Unknown flags,
+both flags at once, or an embeddings section whose size does not match
+the flags and dimension make the snapshot unreadable, like a wrong
+magic or FORMAT_VERSION: the caller rebuilds it.
+
+read_snapshot() maps the file read-only and hands the numeric sections to
+TenantIndex as memoryviews (the embeddings as a tensor viewing the mapped
+bytes), so they are shared between workers through the page cache and
+usable without parsing. Only the token table and the intent
+metadata are decoded. The version stamp is compared with tenant_versions
+by the caller (core.tenant_index.is_current) before the index is used.
+
+Files are written to a temporary name and renamed into place, so readers
+never see a partial file and workers that still map the old one keep a
+consistent view until they drop it.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from core.tenant_index import TenantIndex, IntentRecord
+
+MAGIC = b'CBTIDX\x00\x01'
+# 2: uint8 weight classes and IntentRecord field lists
+# 3: phrase_ids, so a loaded index can be patched in place
+# 4: one layer per file (site_0.idx holds the global intents), no global version
+FORMAT_VERSION = 4
+FLAG_EMBEDDINGS = 1
+FLAG_EMBEDDINGS_FAILED = 2
+
+HEADER = struct.Struct('<8sHHiqIIIII')
+SECTION = struct.Struct('<QQ')
+SECTIONS = ('token_blob', 'token_offsets', 'canon', 'intents', 'phrase_intent', 'phrase_offsets',
+            'phrase_tokens', 'phrase_weights', 'phrase_totals', 'phrase_ids', 'embeddings')
+TYPECODES = {
+    'token_offsets': 'I', 'canon': 'i', 'phrase_intent': 'i', 'phrase_offsets': 'I',
+    'phrase_tokens': 'i', 'phrase_weights': 'B', 'phrase_totals': 'd', 'phrase_ids': 'i'
+}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def write_snapshot(index: TenantIndex, path: str):
+    """Serialise an index to `path` atomically. Patched indexes are written compacted."""
+    if index.tombstones or index.deleted_intents:
+        index = index.compacted()
+    blobs = [tok.encode('utf-8') for tok in index.tokens]
+    token_offsets = array('I', [0])
+    for blob in blobs:
+        token_offsets.append(token_offsets[-1] + len(blob))
+
+    emb_dim = 0
+    emb_bytes = b''
+    if index.embeddings is not None and index.phrase_count:
+        from core.embeddings import matrix_to_bytes
+        emb_dim = int(index.embeddings.shape[1])
+        emb_bytes = matrix_to_bytes(index.embeddings)
+
+    payload = {
+        'token_blob': b''.join(blobs),
+        'token_offsets': token_offsets.tobytes(),
+        'intents': json.dumps([r.to_list() for r in index.intents], ensure_ascii=False).encode('utf-8'),
+        'embeddings': emb_bytes,
+    }
+    for name, code in TYPECODES.items():
+        if name != 'token_offsets':
+            payload[name] = array(code, getattr(index, name)).tobytes()
+
+    flags = (FLAG_EMBEDDINGS if emb_dim else 0) | (FLAG_EMBEDDINGS_FAILED if index.embeddings_failed else 0)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, flags, index.site_id,
+        index.version, len(index.tokens), len(index.intents),
+        index.phrase_count, len(index.phrase_tokens), emb_dim
+    )
+    offset = _align(HEADER.size + SECTION.size * len(SECTIONS))
+    table, layout = [], []
+    for name in SECTIONS:
+        data = payload[name]
+        table.append(SECTION.pack(offset, len(data)))
+        layout.append((offset, data))
+        offset = _align(offset + len(data))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(table))
+        for start, data in layout:
+            f.seek(start)
+            f.write(data)
+        f.truncate(offset)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: str):
+    """Map a snapshot and return a TenantIndex, or None if it is missing or unreadable."""
+    if sys.byteorder != 'little' or not os.path.exists(path):
+        return None
+    try:
+        return _read(path)
+    except (SnapshotError, ValueError, struct.error, OSError) as e:
+        print(f"Ignoring index snapshot {path}: {e}")
+        return None
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buffer)
+    if len(view) < HEADER.size:
+        raise SnapshotError('truncated header')
+    (magic, fmt, flags, site_id, version,
+     n_tokens, n_intents, n_phrases, n_phrase_tokens, emb_dim) = HEADER.unpack_from(view, 0)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        raise SnapshotError(f'unsupported format {magic!r} v{fmt}')
+
+    if flags & ~(FLAG_EMBEDDINGS | FLAG_EMBEDDINGS_FAILED):
+        raise SnapshotError(f'unknown flags {flags:#x}')
+    if flags & FLAG_EMBEDDINGS and flags & FLAG_EMBEDDINGS_FAILED:
+        raise SnapshotError('embeddings flagged both present and failed')
+
+    sections = {}
+    for i, name in enumerate(SECTIONS):
+        start, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+        if start + length > len(view):
+            raise SnapshotError(f'section {name} out of bounds')
+        sections[name] = view[start:start + length]
+    emb_bytes = n_phrases * emb_dim * 4 if flags & FLAG_EMBEDDINGS else 0
+    if (flags & FLAG_EMBEDDINGS and not emb_dim) or len(sections['embeddings']) != emb_bytes:
+        raise SnapshotError(f'embeddings section does not match flags {flags:#x} and dimension {emb_dim}')
+
+    arrays = {name: sections[name].cast(code) for name, code in TYPECODES.items()}
+    expected = {
+        'token_offsets': n_tokens + 1, 'canon': n_tokens, 'phrase_intent': n_phrases,
+        'phrase_offsets': n_phrases + 1, 'phrase_tokens': n_phrase_tokens,
+        'phrase_weights': n_phrase_tokens, 'phrase_totals': n_phrases, 'phrase_ids': n_phrases
+    }
+    for name, count in expected.items():
+        if len(arrays[name]) != count:
+            raise SnapshotError(f'section {name} has {len(arrays[name])} items, expected {count}')
+
+    blob = sections['token_blob']
+    offsets = arrays['token_offsets']
+    tokens = [str(blob[offsets[i]:offsets[i + 1]], 'utf-8') for i in range(n_tokens)]
+    intents = [IntentRecord(*fields) for fields in json.loads(str(sections['intents'], 'utf-8'))]
+    if len(intents) != n_intents:
+        raise SnapshotError('intent count mismatch')
+
+    embeddings = None
+    if flags & FLAG_EMBEDDINGS:
+        from core.embeddings import matrix_from_buffer
+        try:
+            embeddings = matrix_from_buffer(sections['embeddings'], n_phrases, emb_dim)
+        except ImportError:
+            # Written by a host with the embedding backend; this one scores tokens only
+            embeddings = None
+
+    index = TenantIndex(
+        site_id, version, tokens, arrays['canon'], intents,
+        arrays['phrase_intent'], arrays['phrase_offsets'], arrays['phrase_tokens'],
+        arrays['phrase_weights'], arrays['phrase_totals'], arrays['phrase_ids'], embeddings, buffer=buffer
+    )
+    index.embeddings_failed = bool(flags & FLAG_EMBEDDINGS_FAILED)
+    return index
@@ -1,43 +1,149 @@
-from collections import defaultdict
+from collections import Counter
 from datetime import datetime
+import time
 from database import db
 from config import CONFIDENCE_THRESHOLD, FALLBACK_MESSAGES
-from core.tokenizer import tokenize, STOP_WORDS
-from core.synonyms import canonical
-from models.intent import Intent, IntentPhrase
+from config import SCORING_MAX_CHARS, SCORING_MAX_TOKENS, SCORING_EMBED_MAX_CHARS, SCORING_BUDGET_MS, SCORING_RESERVE_MS
+from core.tokenizer import tokenize
+from core.tenant_index import tenant_layers
 from models import UnansweredQuestion
-from sqlalchemy import or_
-from thefuzz import fuzz
 import random
 import requests
-from config import CRM_WEBHOOK_URL, CRM_WEBHOOK_KEY, HANDOFF_KEYWORDS
+from config import CRM_WEBHOOK_URL, CRM_WEBHOOK_KEY
 
-# Fuzzy match threshold for token-level fuzzy matching (0-100)
-FUZZY_TOKEN_THRESHOLD = 80
 # Tiered confidence cutoff
 HIGH_CONFIDENCE = 0.85
 
 # Optional sentence-transformers support (used if installed). Falls back gracefully.
-USE_EMBEDDINGS = False
-MODEL = None
-try:
-    from sentence_transformers import SentenceTransformer, util as st_util
-    MODEL = SentenceTransformer('all-MiniLM-L6-v2')
-    USE_EMBEDDINGS = True
-except Exception:
-    USE_EMBEDDINGS = False
+# Messages are encoded through a shared micro-batcher, see core/embeddings.py
+from core.embeddings import embeddings_available, get_batcher, cosine_scores
 
+# Scoring tiers, best first; detect_intent results say which one answered.
+# Cost model: tokenize is linear in SCORING_MAX_CHARS; each of at most
+# SCORING_MAX_TOKENS distinct tokens costs one fuzzy lookup per layer (the only
+# per-token cost that is not a dict lookup); the phrase loop is linear in the
+# site's phrase tokens, memoised per distinct token; an embedding costs one
+# encode of at most SCORING_EMBED_MAX_CHARS. Fuzzy lookups stop at the
+# deadline (-> exact), the encode waits at most the remaining budget (-> token).
+TIER_EMBEDDING, TIER_TOKEN, TIER_EXACT = 'embedding', 'token', 'exact'
+tier_counts = Counter()
 
-def detect_intent(message: str, site_id: int) -> dict:
+
+def scaled_confidence(intent, score: float) -> float:
+    """A phrase score scaled by the intent's stored confidence (0.8 if unset)."""
+    intent_confidence = getattr(intent, 'confidence', 0.8) or 0.8
+    return round(min(1.0, score * intent_confidence), 3)
+
+
+def bounded_tokens(message: str, layers) -> list:
+    """The message's distinct tokens, from its first SCORING_MAX_CHARS characters, at most SCORING_MAX_TOKENS.
+
+    Scores only depend on which tokens occur, so repeats are dropped first;
+    past the cap, tokens some layer knows (exact matches) are kept before
+    the rest, in message order.
+    """
+    tokens = list(dict.fromkeys(tokenize(message[:SCORING_MAX_CHARS])))
+    if len(tokens) <= SCORING_MAX_TOKENS:
+        return tokens
+    known = [t for t in tokens if any(index.knows(t) for index, _ in layers)]
+    if len(known) >= SCORING_MAX_TOKENS:
+        return known[:SCORING_MAX_TOKENS]
+    known_set = set(known)
+    rest = [t for t in tokens if t not in known_set]
+    keep = known_set.union(rest[:SCORING_MAX_TOKENS - len(known)])
+    return [t for t in tokens if t in keep]
+
+
+def best_phrase_match(tokens, layers, message_embedding=None, fuzzy_maps=None) -> dict:
+    """{'intent', 'key', 'score', 'embedded'} of the best scoring phrase across tenant layers (intent None if nothing matched).
+
+    fuzzy_maps: per layer, the index's fuzzy_scores() of the tokens ({} for exact matching only).
+    embedded: the message embedding was scored against at least one layer's phrases.
+    """
+    best = {
+        'intent': None,
+        'key': None,
+        'score': 0.0,
+        'embedded': False
+    }
+
+    for layer, (index, hidden) in enumerate(layers):
+        embedding_scores = []
+        if message_embedding is not None and index.embeddings is not None:
+            try:
+                embedding_scores = cosine_scores(message_embedding, index.embeddings)
+                best['embedded'] = True
+            except Exception as e:
+                print(f"Embedding scoring failed for site {index.site_id}, using token scores: {e}")
+                embedding_scores = []
+
+        # Score each phrase using weighted token matching, synonyms and fuzzy matching
+        phrase_scores = index.phrase_scores(tokens, hidden, fuzzy_maps[layer] if fuzzy_maps else None)
+        for p, phrase_score in enumerate(phrase_scores):
+            position = index.phrase_intent[p]
+            if position < 0 or position in hidden:
+                # removed by an admin edit (TenantIndex.remove_phrase) or overridden by the site
+                continue
+            record = index.intents[position]
+            if record is None:
+                # its intent is being removed (TenantIndex.remove_intent) right now
+                continue
+            # A phrase added after the message was embedded has no embedding score yet
+            embedding_score = max(0.0, embedding_scores[p]) if p < len(embedding_scores) else 0.0
+
+            # Combine token-based phrase_score with semantic embedding_score
+            combined_score = phrase_score
+            if embedding_score:
+                combined_score = max(phrase_score, round(0.75 * embedding_score + 0.25 * phrase_score, 3))
+
+            if combined_score < best['score'] or combined_score == 0.0:
+                continue
+            # Ties go to the first phrase in canonical order, whichever layer or patch added it
+            key = index.phrase_key(p, record)
+            if combined_score > best['score'] or key < best['key']:
+                best['score'] = combined_score
+                best['intent'] = record
+                best['key'] = key
+    return best
+
+
+def score_message(message: str, tokens, layers, use_embeddings: bool = True):
+    """(best_phrase_match result, tier) within SCORING_BUDGET_MS of scoring time."""
+    deadline = time.perf_counter() + SCORING_BUDGET_MS / 1000.0
+
+    # Token tier: fuzzy lookups for every layer, or none at all if the budget runs out
+    fuzzy_maps = [index.fuzzy_scores(tokens, deadline) for index, _ in layers]
+    if any(fuzzy is None for fuzzy in fuzzy_maps):
+        return best_phrase_match(tokens, layers, fuzzy_maps=[{} for _ in layers]), TIER_EXACT
+
+    # The message is embedded once and compared with each layer's phrase embeddings, if available;
+    # the encode may take what is left of the budget, minus the phrase loop's reserve
+    message_embedding = None
+    timeout = deadline - time.perf_counter() - SCORING_RESERVE_MS / 1000.0
+    if use_embeddings and timeout > 0 and embeddings_available() \
+            and any(layer.embeddings is not None for layer, _ in layers):
+        try:
+            message_embedding = get_batcher().encode(message[:SCORING_EMBED_MAX_CHARS], timeout=timeout)
+        except Exception:
+            message_embedding = None
+
+    best = best_phrase_match(tokens, layers, message_embedding, fuzzy_maps)
+    return best, TIER_EMBEDDING if best['embedded'] else TIER_TOKEN
+
+
+def detect_intent(message: str, site_id: int, use_embeddings: bool = True) -> dict:
     """
     Detect intent for a given site_id and message.
+    use_embeddings=False scores tokens only (the worker is shedding load).
 
     Returns:
     {
       intent_name,
       intent_type,
       response,
-      confidence
+      confidence,
+      tier          (once scored: embedding, token or exact, see score_message)
+      unanswered    (True when scored and unmatched: log_unanswered() it if no FAQ answers)
     }
     """
     # Basic guard
@@ -49,7 +155,9 @@ def detect_intent(message: str, site_id: int) -> dict:
             'confidence': 0.0
         }
 
-    tokens = tokenize(message)
+    # Compiled global intents (site_id = 0) overlaid by the site's own, see core/tenant_index.py
+    layers = tenant_layers(int(site_id))
+    tokens = bounded_tokens(message, layers)
     if not tokens:
         return {
             'intent_name': 'UNKNOWN',
@@ -57,108 +165,13 @@ def detect_intent(message: str, site_id: int) -> dict:
             'response': random.choice(FALLBACK_MESSAGES),
             'confidence': 0.0
         }
-    # Load intents for the site and global (site_id = 0)
-    intents = Intent.query.filter(or_(Intent.site_id == 0, Intent.site_id == site_id)).all()
-
-    best = {
-        'intent': None,
-        'phrase': None,
-        'score': 0.0
-    }
 
-    # Prepare semantic embeddings for phrases and message if available
-    phrase_items = []
-    phrase_embeddings = None
-    msg_emb = None
-    if USE_EMBEDDINGS:
-        for intent in intents:
-            for phrase_obj in intent.phrases:
-                text = (phrase_obj.phrase or '').strip()
-                phrase_items.append((intent, phrase_obj, text))
-        try:
-            texts = [p[2] for p in phrase_items if p[2]]
-            if texts:
-                phrase_embeddings = MODEL.encode(texts, convert_to_tensor=True)
-                msg_emb = MODEL.encode(message, convert_to_tensor=True)
-        except Exception:
-            phrase_embeddings = None
-            msg_emb = None
-
-    # Score each phrase using weighted token matching, synonyms and fuzzy matching
-    for intent in intents:
-        for phrase_obj in intent.phrases:
-            phrase = phrase_obj.phrase or ''
-            p_tokens = tokenize(phrase)
-            if not p_tokens:
-                continue
-
-            # Compute token weights (heuristic): stop-words low weight, others higher
-            token_weights = []
-            for t in p_tokens:
-                if t in STOP_WORDS:
-                    token_weights.append(0.2)
-                elif len(t) <= 3:
-                    token_weights.append(0.6)
-                else:
-                    token_weights.append(1.0)
-
-            total_weight = sum(token_weights) or 1.0
-            matched_weight = 0.0
-
-            for idx, p_tok in enumerate(p_tokens):
-                best_tok_score = 0.0
-                p_can = canonical(p_tok)
-                for u_tok in tokens:
-                    u_can = canonical(u_tok)
-                    # exact or canonical synonym match
-                    if p_can == u_can:
-                        best_tok_score = 1.0
-                        break
-                    # fuzzy match on raw tokens
-                    score = fuzz.ratio(p_tok, u_tok) / 100.0
-                    if score > best_tok_score:
-                        best_tok_score = score
-                # apply threshold: treat very low fuzzy matches as zero
-                if best_tok_score * 100 < FUZZY_TOKEN_THRESHOLD:
-                    best_tok_score = 0.0
-
-                matched_weight += token_weights[idx] * best_tok_score
-
-            phrase_score = matched_weight / total_weight
-
-            # Compute embedding similarity if available
-            embedding_score = 0.0
-            if USE_EMBEDDINGS and phrase_embeddings is not None and msg_emb is not None:
-                try:
-                    # find index for this phrase in phrase_items
-                    idx = None
-                    for i, it in enumerate(phrase_items):
-                        if it[0].id == intent.id and it[1].id == phrase_obj.id:
-                            idx = i
-                            break
-                    if idx is not None and idx < len(phrase_embeddings):
-                        sim = st_util.pytorch_cos_sim(msg_emb, phrase_embeddings[idx])
-                        embedding_score = float(sim.cpu().numpy().flatten()[0])
-                        if embedding_score < 0:
-                            embedding_score = 0.0
-                except Exception:
-                    embedding_score = 0.0
-
-            # Combine token-based phrase_score with semantic embedding_score
-            combined_score = phrase_score
-            if embedding_score:
-                combined_score = max(phrase_score, round(0.75 * embedding_score + 0.25 * phrase_score, 3))
-
-            if combined_score > best['score']:
-                best['score'] = combined_score
-                best['intent'] = intent
-                best['phrase'] = phrase_obj
+    best, tier = score_message(message, tokens, layers, use_embeddings)
+    tier_counts[tier] += 1
 
     # If we found a candidate, scale by intent's configured confidence
     if best['intent']:
-        # use intent's stored confidence if present, otherwise default
-        intent_confidence = getattr(best['intent'], 'confidence', 0.8) or 0.8
-        confidence = round(min(1.0, best['score'] * intent_confidence), 3)
+        confidence = scaled_confidence(best['intent'], best['score'])
 
         # High confidence -> direct answer
         if confidence >= HIGH_CONFIDENCE:
@@ -178,47 +191,53 @@ def detect_intent(message: str, site_id: int) -> dict:
                     pass
 
             return {
+                'intent_id': best['intent'].id,
                 'intent_name': best['intent'].intent_name,
                 'intent_type': best['intent'].intent_type,
                 'response': best['intent'].response or random.choice(FALLBACK_MESSAGES),
                 'handoff': best['intent'].intent_type if best['intent'].intent_type in ('LEAD', 'HUMAN') else None,
-                'confidence': confidence
+                'confidence': confidence,
+                'tier': tier
             }
 
         # Medium confidence -> confirm intent with user
         if confidence >= CONFIDENCE_THRESHOLD:
             return {
+                'intent_id': best['intent'].id,
                 'intent_name': best['intent'].intent_name,
                 'intent_type': best['intent'].intent_type,
                 'response': f"I think you're asking about {best['intent'].intent_name}. Is that right?",
                 'handoff': best['intent'].intent_type if best['intent'].intent_type in ('LEAD', 'HUMAN') else None,
-                'confidence': confidence
+                'confidence': confidence,
+                'confirm': True,
+                'tier': tier
             }
 
-        # Below threshold -> log unanswered for training and fallback
-        try:
-            # find existing unanswered record
-            q = UnansweredQuestion.query.filter_by(question=message).first()
-            if q:
-                q.times_asked = (q.times_asked or 1) + 1
-                q.last_asked = datetime.utcnow()
-            else:
-                q = UnansweredQuestion(question=message)
-                db.session.add(q)
-            db.session.commit()
-        except Exception:
-            # Logging should not break runtime
-            db.session.rollback()
-
+        # Below threshold -> fallback; logged as unanswered if the FAQs miss too (intent_service.respond)
         return {
             'intent_name': 'UNKNOWN',
             'intent_type': 'UNKNOWN',
             'response': random.choice(FALLBACK_MESSAGES),
-            'confidence': confidence
+            'confidence': confidence,
+            'tier': tier,
+            'unanswered': True
         }
 
     # No candidate found at all
+    return {
+        'intent_name': 'UNKNOWN',
+        'intent_type': 'UNKNOWN',
+        'response': random.choice(FALLBACK_MESSAGES),
+        'confidence': 0.0,
+        'tier': tier,
+        'unanswered': True
+    }
+
+
+def log_unanswered(message: str):
+    """Count a message nothing answered (UnansweredQuestion), for training. Commits."""
     try:
+        # find existing unanswered record
         q = UnansweredQuestion.query.filter_by(question=message).first()
         if q:
             q.times_asked = (q.times_asked or 1) + 1
@@ -228,11 +247,5 @@ def detect_intent(message: str, site_id: int) -> dict:
             db.session.add(q)
         db.session.commit()
     except Exception:
+        # Logging should not break runtime
         db.session.rollback()
-
-    return {
-        'intent_name': 'UNKNOWN',
-        'intent_type': 'UNKNOWN',
-        'response': random.choice(FALLBACK_MESSAGES),
-        'confidence': 0.0
-    }
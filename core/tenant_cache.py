@@ -0,0 +1,134 @@
+"""
+Memory-budgeted LRU of compiled tenant indexes.
+
+Only a few hundred of our sites are active in any hour, so a worker keeps
+just the recently used indexes resident. Each entry is charged its heap
+size (TenantIndex.memory_usage()['heap_bytes']; pages mapped from a
+snapshot live in the shared page cache and are not charged). When the total
+exceeds the budget, least recently used sites are evicted; they are
+rebuilt lazily (usually by re-mapping their snapshot) on next access.
+
+Concurrent misses for the same site wait for a single load instead of
+loading in parallel. stats() exposes hits, misses, loads, evictions and
+residency for capacity planning.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TenantCacheManager:
+
+    def __init__(self, loader, max_bytes):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # site_id -> (index, charged bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # site_id -> Event set when the load finishes
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, site_id):
+        return site_id in self._entries
+
+    @property
+    def resident_bytes(self):
+        return self._bytes
+
+    def get(self, site_id):
+        with self._lock:
+            entry = self._entries.get(site_id)
+            if entry is not None:
+                self._entries.move_to_end(site_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            waiter = self._loading.get(site_id)
+            if waiter is None:
+                self._loading[site_id] = threading.Event()
+        if waiter is not None:
+            # another thread is loading this site
+            waiter.wait()
+            with self._lock:
+                entry = self._entries.get(site_id)
+            if entry is not None:
+                return entry[0]
+            return self.get(site_id)
+
+        try:
+            started = time.perf_counter()
+            index = self.loader(site_id)
+            elapsed = time.perf_counter() - started
+            self.put(site_id, index)
+            with self._lock:
+                self.loads += 1
+                self.load_seconds += elapsed
+            return index
+        finally:
+            with self._lock:
+                self._loading.pop(site_id).set()
+
+    def peek(self, site_id):
+        """The resident index for a site, or None. Does not load, count or touch the LRU order."""
+        with self._lock:
+            entry = self._entries.get(site_id)
+            return entry[0] if entry is not None else None
+
+    def put(self, site_id, index):
+        size = index.memory_usage()['heap_bytes']
+        with self._lock:
+            old = self._entries.pop(site_id, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[site_id] = (index, size)
+            self._bytes += size
+            self._evict(keep=site_id)
+
+    def _evict(self, keep):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            site_id = next(iter(self._entries))
+            if site_id == keep:
+                break
+            _, size = self._entries.pop(site_id)
+            self._bytes -= size
+            self.evictions += 1
+            self.evicted_bytes += size
+
+    def discard(self, site_id=None):
+        """Drop one site, or everything when site_id is None."""
+        with self._lock:
+            if site_id is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            entry = self._entries.pop(site_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def indexes(self) -> list:
+        with self._lock:
+            return [index for index, _ in self._entries.values()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'resident_sites': len(self._entries),
+                'resident_bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'loads': self.loads,
+                'avg_load_ms': round(1000 * self.load_seconds / self.loads, 2) if self.loads else 0.0,
+                'evictions': self.evictions,
+                'evicted_bytes': self.evicted_bytes
+            }
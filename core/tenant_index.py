@@ -0,0 +1,726 @@
+"""
+Compiled per-site intent index.
+
+detect_intent used to load a site's Intent/IntentPhrase rows and tokenize
+every phrase on every request. A TenantIndex holds the same data already
+compiled for scoring, in flat typed arrays rather than per-phrase objects:
+
+- tokens:          token table (phrase tokens plus their canonical forms)
+- canon:           int32, token id -> token id of its canonical form (core/synonyms)
+- intents:         IntentRecord per intent, by id
+- phrase_intent:   int32, phrase -> index into intents
+- phrase_offsets:  uint32, phrase p owns phrase_tokens[phrase_offsets[p]:phrase_offsets[p + 1]]
+- phrase_tokens:   int32, token ids of every phrase, concatenated
+- phrase_weights:  uint8 weight class of each phrase token (WEIGHT_VALUES)
+- phrase_totals:   float64, sum of each phrase's weights (or 1.0)
+- phrase_ids:      int32, IntentPhrase.id of each phrase
+- embeddings:      optional float32 matrix, one row per phrase; embeddings_failed
+                   records that encoding them failed, so the index is not rebuilt
+                   on every load to retry
+
+A phrase costs a few dozen bytes plus five per token, instead of an ORM
+object and a list of token strings; memory_usage() reports the split.
+
+Scoring gives exactly the results of the original loop: same weights and
+arithmetic, ties go to the phrase that comes first in (global intents
+first, intent id, phrase id) order, and each distinct phrase token is
+scored against the message once instead of once per phrase that contains it.
+Fuzzy matches come from a symmetric-delete FuzzyVocabulary over the token
+table (core/fuzzy_index.py) instead of fuzz.ratio over every token pair.
+
+Admin edits patch a resident index in place (add_phrase, remove_phrase,
+upsert_intent, remove_intent): new phrases and tokens are appended, only
+the new phrase is embedded, and removed phrases become tombstones
+(phrase_intent = -1) until compacted() rewrites the arrays.
+
+The global intents (site_id 0) are compiled once per process into their
+own index, which every site overlays (tenant_layers): a site index holds
+only the site's intents, and global intents whose intent_name the site
+also defines are hidden, so the site's version wins. Nothing global is
+copied per tenant, and editing a site never recompiles the global layer.
+
+Indexes are versioned by their site's intents_version. They are persisted by core/index_snapshot.py so workers
+can map them at startup instead of rebuilding from SQLite, and kept in a
+memory-budgeted LRU (core/tenant_cache.py) so cold sites do not stay
+resident in every worker.
+"""
+import os
+import sys
+import threading
+import time
+from array import array
+from config import INDEX_SNAPSHOT_DIR, INDEX_SNAPSHOT_DEBOUNCE_SECONDS, TENANT_CACHE_MAX_BYTES, TENANT_PREWARM_COUNT, TENANT_PREWARM_DAYS
+from core.tenant_cache import TenantCacheManager
+from core.fuzzy_index import FuzzyVocabulary
+from core.tokenizer import tokenize, STOP_WORDS
+from core.synonyms import canonical
+from core.embeddings import embeddings_available, get_batcher, stack_embeddings, append_row, select_rows
+from models.intent import Intent, IntentPhrase
+from services.tenant_version import get_versions
+from services.tenant_changes import on_tenant_change
+
+# Fuzzy match threshold for token-level fuzzy matching (0-100)
+FUZZY_TOKEN_THRESHOLD = 80
+
+GLOBAL_SITE_ID = 0
+
+# Compact once this share of phrases are tombstones (and at least COMPACT_MIN_TOMBSTONES)
+COMPACT_TOMBSTONE_RATIO = 0.2
+COMPACT_MIN_TOMBSTONES = 64
+
+# Token weights are stored as a class index so scores use the exact float64 values
+WEIGHT_VALUES = (0.2, 0.6, 1.0)
+WEIGHT_STOP_WORD, WEIGHT_SHORT, WEIGHT_FULL = range(3)
+
+
+def weight_class(token: str) -> int:
+    # Heuristic: stop-words low weight, short tokens medium, others full
+    if token in STOP_WORDS:
+        return WEIGHT_STOP_WORD
+    if len(token) <= 3:
+        return WEIGHT_SHORT
+    return WEIGHT_FULL
+
+
+class IntentRecord:
+    """The intent fields scoring and routing need, without ORM state."""
+    __slots__ = ('id', 'site_id', 'intent_name', 'intent_type', 'response', 'confidence', 'confidence_threshold')
+
+    def __init__(self, id, site_id, intent_name, intent_type, response, confidence, confidence_threshold):
+        self.id = id
+        self.site_id = site_id
+        self.intent_name = intent_name
+        self.intent_type = intent_type
+        self.response = response
+        self.confidence = confidence
+        self.confidence_threshold = confidence_threshold
+
+    @classmethod
+    def from_model(cls, intent):
+        return cls(intent.id, intent.site_id, intent.intent_name, intent.intent_type,
+                   intent.response, intent.confidence, intent.confidence_threshold)
+
+    def to_list(self) -> list:
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __repr__(self):
+        return f'<IntentRecord {self.intent_name} ({self.id})>'
+
+
+def _sizeof_strings(strings) -> int:
+    return sum(sys.getsizeof(s) for s in strings if s is not None)
+
+
+class TenantIndex:
+    """Scoring data for one site (its intents plus the global ones)."""
+
+    def __init__(self, site_id, version, tokens, canon, intents,
+                 phrase_intent, phrase_offsets, phrase_tokens, phrase_weights, phrase_totals,
+                 phrase_ids, embeddings=None, buffer=None):
+        self.site_id = site_id
+        self.version = version
+        self.tokens = tokens
+        self.token_ids = {tok: i for i, tok in enumerate(tokens)}
+        self.canon = canon
+        self.intents = intents
+        self.phrase_intent = phrase_intent
+        self.phrase_offsets = phrase_offsets
+        self.phrase_tokens = phrase_tokens
+        self.phrase_weights = phrase_weights
+        self.phrase_totals = phrase_totals
+        self.phrase_ids = phrase_ids
+        self.embeddings = embeddings
+        self.embeddings_failed = False
+        # Keeps a memory-mapped snapshot alive while its views are in use
+        self._buffer = buffer
+        self.tombstones = 0
+        self.deleted_intents = 0
+        self._intent_positions = None
+        self._phrase_positions = None
+        self._fuzzy = None
+        # (global layer, positions of its intents this site overrides), see overridden_in()
+        self._shadow = None
+
+    @property
+    def phrase_count(self):
+        return len(self.phrase_intent)
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by this index.
+
+        heap_bytes is private to the worker; mapped_bytes are snapshot pages
+        shared through the page cache with every worker mapping the file.
+        """
+        arrays = [self.canon, self.phrase_intent, self.phrase_offsets,
+                  self.phrase_tokens, self.phrase_weights, self.phrase_totals, self.phrase_ids]
+        array_bytes = sum(a.nbytes if isinstance(a, memoryview) else a.itemsize * len(a) for a in arrays)
+        mapped = self._buffer is not None
+
+        token_bytes = sys.getsizeof(self.tokens) + sys.getsizeof(self.token_ids) + _sizeof_strings(self.tokens)
+        intent_bytes = sys.getsizeof(self.intents) + sum(
+            sys.getsizeof(r) + _sizeof_strings((r.intent_name, r.intent_type, r.response))
+            for r in self.intents if r is not None
+        )
+        embedding_bytes = 0
+        if self.embeddings is not None:
+            embedding_bytes = self.embeddings.numel() * self.embeddings.element_size()
+        fuzzy_bytes = self._fuzzy.memory_bytes() if self._fuzzy is not None else 0
+
+        heap = token_bytes + intent_bytes + fuzzy_bytes + (0 if mapped else array_bytes + embedding_bytes)
+        return {
+            'site_id': self.site_id,
+            'version': self.version,
+            'phrases': self.phrase_count,
+            'tokens': len(self.tokens),
+            'intents': len(self.intents) - self.deleted_intents,
+            'tombstones': self.tombstones,
+            'token_table_bytes': token_bytes,
+            'intent_bytes': intent_bytes,
+            'array_bytes': array_bytes,
+            'embedding_bytes': embedding_bytes,
+            'fuzzy_bytes': fuzzy_bytes,
+            'heap_bytes': heap,
+            'mapped_bytes': array_bytes + embedding_bytes if mapped else 0,
+            'bytes_per_phrase': round(heap / self.phrase_count, 1) if self.phrase_count else 0.0
+        }
+
+    def fuzzy_vocabulary(self) -> FuzzyVocabulary:
+        """Symmetric-delete lookup over the token table, built on first use."""
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyVocabulary(self.tokens, FUZZY_TOKEN_THRESHOLD)
+        return self._fuzzy
+
+    def knows(self, token) -> bool:
+        """True if the token, or its canonical form, is in the token table (an exact match is possible)."""
+        return token in self.token_ids or canonical(token) in self.token_ids
+
+    def fuzzy_scores(self, message_tokens, deadline=None) -> dict:
+        """{token id: best fuzz.ratio / 100 against any message token}, above the fuzzy threshold only.
+
+        None if time.perf_counter() passes `deadline` before every token was looked up.
+        """
+        fuzzy = self.fuzzy_vocabulary()
+        best = {}
+        for u_tok in set(message_tokens):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            for token_id, score in fuzzy.neighbours(u_tok).items():
+                if score > best.get(token_id, 0.0):
+                    best[token_id] = score
+        return best
+
+    def token_score(self, token_id, message_canon_ids, fuzzy_scores) -> float:
+        """Best match of one phrase token against the message tokens (0 below the fuzzy threshold)."""
+        # exact or canonical synonym match
+        if self.canon[token_id] in message_canon_ids:
+            return 1.0
+        # fuzzy match on raw tokens; pairs below the threshold are absent
+        return fuzzy_scores.get(token_id, 0.0)
+
+    def phrase_scores(self, message_tokens, hidden=frozenset(), fuzzy_scores=None) -> list:
+        """Weighted token-match score of every phrase, in phrase order.
+
+        Phrases of removed intents and of intent positions in `hidden` score 0.
+        fuzzy_scores: precomputed fuzzy_scores() of the message; {} scores exact
+        and synonym matches only.
+        """
+        message_canon_ids = {self.token_ids.get(canonical(u), -1) for u in message_tokens}
+        if fuzzy_scores is None:
+            fuzzy_scores = self.fuzzy_scores(message_tokens)
+        offsets, phrase_tokens, weights, totals = \
+            self.phrase_offsets, self.phrase_tokens, self.phrase_weights, self.phrase_totals
+        phrase_intent = self.phrase_intent
+        memo = {}
+        scores = []
+        for p in range(len(phrase_intent)):
+            if phrase_intent[p] < 0 or phrase_intent[p] in hidden:
+                scores.append(0.0)
+                continue
+            matched_weight = 0.0
+            for i in range(offsets[p], offsets[p + 1]):
+                token_id = phrase_tokens[i]
+                score = memo.get(token_id)
+                if score is None:
+                    score = memo[token_id] = self.token_score(token_id, message_canon_ids, fuzzy_scores)
+                matched_weight += WEIGHT_VALUES[weights[i]] * score
+            scores.append(matched_weight / totals[p])
+        return scores
+
+    def find_intent(self, intent_name):
+        for record in self.intents:
+            if record is not None and record.intent_name == intent_name:
+                return record
+        return None
+
+    def overridden_in(self, base: 'TenantIndex') -> frozenset:
+        """Positions of `base`'s intents that share an intent_name with one of ours."""
+        shadow = self._shadow
+        if shadow is None or shadow[0] is not base:
+            names = {r.intent_name for r in self.intents if r is not None}
+            positions = frozenset(i for i, r in enumerate(base.intents) if r is not None and r.intent_name in names)
+            shadow = self._shadow = (base, positions)
+        return shadow[1]
+
+    def phrase_words(self, p) -> list:
+        """The tokens of phrase p, as tokenize() produced them."""
+        return [self.tokens[self.phrase_tokens[i]] for i in range(self.phrase_offsets[p], self.phrase_offsets[p + 1])]
+
+    def phrase_key(self, p, record=None):
+        """Canonical order of phrase p: global intents first, then intent id, then phrase id.
+
+        record: phrase p's intent, when the caller already read it (the phrase may be removed meanwhile).
+        """
+        record = record or self.intents[self.phrase_intent[p]]
+        return (0 if record.site_id == GLOBAL_SITE_ID else 1, record.id, self.phrase_ids[p])
+
+    # --- incremental patching ---
+
+    def _make_mutable(self):
+        # Views into a mapped snapshot are read-only; copy them once before the first edit
+        if self._buffer is None:
+            return
+        for name, code in (('canon', 'i'), ('phrase_intent', 'i'), ('phrase_offsets', 'I'),
+                           ('phrase_tokens', 'i'), ('phrase_weights', 'B'), ('phrase_totals', 'd'),
+                           ('phrase_ids', 'i')):
+            setattr(self, name, array(code, getattr(self, name)))
+        self._buffer = None
+
+    def _positions(self):
+        if self._intent_positions is None:
+            self._intent_positions = {r.id: i for i, r in enumerate(self.intents) if r is not None}
+            self._phrase_positions = {
+                self.phrase_ids[p]: p for p in range(len(self.phrase_intent)) if self.phrase_intent[p] >= 0
+            }
+        return self._intent_positions, self._phrase_positions
+
+    def _token_id(self, tok):
+        tid = self.token_ids.get(tok)
+        if tid is not None:
+            return tid
+        canon_tok = canonical(tok)
+        canon_id = self._token_id(canon_tok) if canon_tok != tok else None
+        tid = len(self.tokens)
+        # Publish the id last: readers look tokens up through token_ids
+        self.tokens.append(tok)
+        self.canon.append(tid if canon_id is None else canon_id)
+        if self._fuzzy is not None:
+            self._fuzzy.add(tid)
+        self.token_ids[tok] = tid
+        return tid
+
+    def upsert_intent(self, record: IntentRecord):
+        """Add an intent or replace its metadata (response, type, thresholds...)."""
+        intents, _ = self._positions()
+        position = intents.get(record.id)
+        if position is None:
+            intents[record.id] = len(self.intents)
+            self.intents.append(record)
+        else:
+            self.intents[position] = record
+        self._shadow = None
+
+    def remove_intent(self, intent_id) -> bool:
+        intents, phrases = self._positions()
+        position = intents.pop(intent_id, None)
+        if position is None:
+            return False
+        # Phrases first: a scorer that already read a phrase's position may still find the record None
+        for phrase_id in [pid for pid, p in phrases.items() if self.phrase_intent[p] == position]:
+            self.remove_phrase(phrase_id)
+        self.intents[position] = None
+        self.deleted_intents += 1
+        self._shadow = None
+        return True
+
+    def _check_embedding(self, embedding):
+        # Raised before any array is touched, so the index stays aligned
+        if self.embeddings is not None and embedding is None:
+            raise ValueError('this index has phrase embeddings: pass the new phrase\'s (encode_phrases)')
+
+    def add_phrase(self, intent_id, phrase_id, text, embedding=None) -> bool:
+        """Append one phrase; only this phrase is tokenized.
+
+        embedding: the phrase's row, required when the index has embeddings.
+        Encode it before patching (encode_phrases), not under the patch lock.
+        """
+        intents, phrases = self._positions()
+        position = intents.get(intent_id)
+        p_tokens = tokenize(text or '')
+        if position is None or not p_tokens:
+            return False
+        self._check_embedding(embedding)
+        self._make_mutable()
+        classes = [weight_class(t) for t in p_tokens]
+        for tok, cls in zip(p_tokens, classes):
+            self.phrase_tokens.append(self._token_id(tok))
+            self.phrase_weights.append(cls)
+        self.phrase_offsets.append(len(self.phrase_tokens))
+        self.phrase_totals.append(sum(WEIGHT_VALUES[c] for c in classes) or 1.0)
+        self.phrase_ids.append(phrase_id)
+        if self.embeddings is not None:
+            self.embeddings = append_row(self.embeddings, embedding)
+        # Appending to phrase_intent publishes the phrase to concurrent scorers
+        phrases[phrase_id] = len(self.phrase_intent)
+        self.phrase_intent.append(position)
+        return True
+
+    def remove_phrase(self, phrase_id) -> bool:
+        _, phrases = self._positions()
+        p = phrases.pop(phrase_id, None)
+        if p is None:
+            return False
+        self._make_mutable()
+        self.phrase_intent[p] = -1
+        self.tombstones += 1
+        return True
+
+    def update_phrase(self, intent_id, phrase_id, text, embedding=None) -> bool:
+        self._check_embedding(embedding)
+        self.remove_phrase(phrase_id)
+        return self.add_phrase(intent_id, phrase_id, text, embedding)
+
+    def needs_compaction(self) -> bool:
+        return self.tombstones >= max(COMPACT_MIN_TOMBSTONES, COMPACT_TOMBSTONE_RATIO * len(self.phrase_intent))
+
+    def compacted(self) -> 'TenantIndex':
+        """A new index without tombstones or unused tokens, in canonical phrase order. No DB access or re-encoding."""
+        live = sorted((p for p in range(len(self.phrase_intent)) if self.phrase_intent[p] >= 0), key=self.phrase_key)
+        records = sorted((r for r in self.intents if r is not None),
+                         key=lambda r: (0 if r.site_id == GLOBAL_SITE_ID else 1, r.id))
+        positions = {r.id: i for i, r in enumerate(records)}
+
+        tokens, token_ids, canon = [], {}, array('i')
+
+        def token_id(old_id):
+            tok = self.tokens[old_id]
+            tid = token_ids.get(tok)
+            if tid is None:
+                tid = token_ids[tok] = len(tokens)
+                tokens.append(tok)
+                canon.append(tid)
+                canon_old = self.canon[old_id]
+                if canon_old != old_id:
+                    canon[tid] = token_id(canon_old)
+            return tid
+
+        phrase_intent, phrase_offsets = array('i'), array('I', [0])
+        phrase_tokens, phrase_weights, phrase_totals, phrase_ids = array('i'), array('B'), array('d'), array('i')
+        for p in live:
+            for i in range(self.phrase_offsets[p], self.phrase_offsets[p + 1]):
+                phrase_tokens.append(token_id(self.phrase_tokens[i]))
+                phrase_weights.append(self.phrase_weights[i])
+            phrase_offsets.append(len(phrase_tokens))
+            phrase_totals.append(self.phrase_totals[p])
+            phrase_ids.append(self.phrase_ids[p])
+            phrase_intent.append(positions[self.intents[self.phrase_intent[p]].id])
+
+        embeddings = select_rows(self.embeddings, live) if self.embeddings is not None else None
+        index = TenantIndex(
+            self.site_id, self.version, tokens, canon, records,
+            phrase_intent, phrase_offsets, phrase_tokens, phrase_weights, phrase_totals, phrase_ids, embeddings
+        )
+        index.embeddings_failed = self.embeddings_failed
+        return index
+
+
+def compile_index(site_id, version, intents, phrases_by_intent, with_embeddings=True) -> TenantIndex:
+    """Compile intents (ordered) and {intent_id: [(phrase_id, text)]} into a TenantIndex."""
+    tokens, token_ids = [], {}
+    canon = array('i')
+
+    def token_id(tok):
+        tid = token_ids.get(tok)
+        if tid is None:
+            tid = token_ids[tok] = len(tokens)
+            tokens.append(tok)
+            canon.append(-1)
+        return tid
+
+    phrase_intent, phrase_offsets = array('i'), array('I', [0])
+    phrase_tokens, phrase_weights, phrase_totals, phrase_ids = array('i'), array('B'), array('d'), array('i')
+    texts = []
+    for position, intent in enumerate(intents):
+        for phrase_id, phrase in phrases_by_intent.get(intent.id, []):
+            p_tokens = tokenize(phrase or '')
+            if not p_tokens:
+                continue
+            classes = [weight_class(t) for t in p_tokens]
+            for tok, cls in zip(p_tokens, classes):
+                phrase_tokens.append(token_id(tok))
+                phrase_weights.append(cls)
+            phrase_intent.append(position)
+            phrase_offsets.append(len(phrase_tokens))
+            phrase_totals.append(sum(WEIGHT_VALUES[c] for c in classes) or 1.0)
+            phrase_ids.append(phrase_id)
+            texts.append(phrase.strip())
+
+    for tid in range(len(tokens)):
+        if canon[tid] == -1:
+            canon[tid] = token_id(canonical(tokens[tid]))
+    # canonical forms added by the loop above are their own canonical form
+    for tid in range(len(tokens)):
+        if canon[tid] == -1:
+            canon[tid] = tid
+
+    embeddings = None
+    embeddings_failed = False
+    if with_embeddings and texts and embeddings_available():
+        try:
+            embeddings = stack_embeddings(get_batcher().encode_many(texts))
+        except Exception as e:
+            print(f"Phrase embeddings unavailable for site {site_id}: {e}")
+            embeddings_failed = True
+
+    index = TenantIndex(
+        site_id, version, tokens, canon, [IntentRecord.from_model(i) for i in intents],
+        phrase_intent, phrase_offsets, phrase_tokens, phrase_weights, phrase_totals, phrase_ids, embeddings
+    )
+    index.embeddings_failed = embeddings_failed
+    return index
+
+
+def build_index(site_id: int) -> TenantIndex:
+    """Compile one site's intents from the database (site 0: the global layer)."""
+    # Read the stamp first: a concurrent change leaves the index older than the data, never newer
+    version = get_versions(site_id)[0]
+
+    intents = Intent.query.filter(Intent.site_id == site_id).order_by(Intent.id).all()
+    phrases_by_intent = {}
+    if intents:
+        rows = IntentPhrase.query.with_entities(IntentPhrase.intent_id, IntentPhrase.id, IntentPhrase.phrase) \
+            .filter(IntentPhrase.intent_id.in_([i.id for i in intents])).order_by(IntentPhrase.id).all()
+        for intent_id, phrase_id, phrase in rows:
+            phrases_by_intent.setdefault(intent_id, []).append((phrase_id, phrase))
+
+    return compile_index(site_id, version, intents, phrases_by_intent)
+
+
+# --- per-process cache ---
+
+
+def snapshot_path(site_id: int) -> str:
+    return os.path.join(INDEX_SNAPSHOT_DIR, f'site_{site_id}.idx')
+
+
+def is_current(index: TenantIndex) -> bool:
+    """True when the index matches its site's version stamp (one primary-key read)."""
+    # Built where the backend was missing: rebuild once to embed it. A recorded failure waits for
+    # the next intents change (or `flask build-indexes`) instead of re-encoding on every load
+    if index.embeddings is None and index.phrase_count and not index.embeddings_failed and embeddings_available():
+        return False
+    return index.version == get_versions(index.site_id)[0]
+
+
+def load_index(site_id: int) -> TenantIndex:
+    """Map the site's snapshot if it is current, otherwise rebuild from the DB and rewrite it."""
+    from core.index_snapshot import read_snapshot, write_snapshot
+
+    index = read_snapshot(snapshot_path(site_id))
+    if index is None or index.site_id != site_id or not is_current(index):
+        index = build_index(site_id)
+        try:
+            write_snapshot(index, snapshot_path(site_id))
+        except OSError as e:
+            print(f"Could not write index snapshot for site {site_id}: {e}")
+    # Built before caching so the budget charges it and the first message does not wait for it
+    index.fuzzy_vocabulary()
+    return index
+
+
+tenant_cache = TenantCacheManager(load_index, TENANT_CACHE_MAX_BYTES)
+
+
+def get_tenant_index(site_id: int) -> TenantIndex:
+    return tenant_cache.get(site_id)
+
+
+def tenant_layers(site_id: int) -> list:
+    """[(index, hidden intent positions)] to score for a site: the global layer, then the site's own."""
+    base = tenant_cache.get(GLOBAL_SITE_ID)
+    if site_id == GLOBAL_SITE_ID:
+        return [(base, frozenset())]
+    index = tenant_cache.get(site_id)
+    return [(base, index.overridden_in(base)), (index, frozenset())]
+
+
+def resolve_intent(site_id: int, intent_name: str):
+    """The IntentRecord a site answers `intent_name` with: its own, else the global one."""
+    for index, hidden in reversed(tenant_layers(site_id)):
+        record = index.find_intent(intent_name)
+        if record is not None:
+            return record
+    return None
+
+
+def write_site_snapshot(site_id: int) -> TenantIndex:
+    """Compile and persist a site's index. Call after committing intent changes."""
+    from core.index_snapshot import write_snapshot
+
+    index = build_index(site_id)
+    write_snapshot(index, snapshot_path(site_id))
+    if site_id in tenant_cache:
+        index.fuzzy_vocabulary()
+        tenant_cache.put(site_id, index)
+    return index
+
+
+_patch_lock = threading.Lock()
+
+
+class SnapshotWriter:
+    """
+    Writes patched indexes back to their snapshots off the request path.
+
+    A snapshot costs O(site size) to write (compacting first), so patch_index
+    only marks the site; a daemon thread, started per process on first use,
+    writes it once the site has had no edit for INDEX_SNAPSHOT_DEBOUNCE_SECONDS,
+    so a burst of edits costs one write. Until then the snapshot's version
+    stamp is behind, so a cold load rebuilds from the database as for any
+    stale snapshot.
+    """
+
+    def __init__(self, delay=INDEX_SNAPSHOT_DEBOUNCE_SECONDS):
+        self.delay = delay
+        self._pending = {}  # site_id -> monotonic time of its last patch
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def schedule(self, site_id: int):
+        self._pending[site_id] = time.monotonic()
+        self._ensure_thread()
+
+    def write_due(self, now=None) -> list:
+        """Write the snapshots of sites quiet for `delay` seconds. Returns their ids."""
+        from core.index_snapshot import write_snapshot
+
+        now = time.monotonic() if now is None else now
+        written = []
+        for site_id, patched_at in list(self._pending.items()):
+            if now - patched_at < self.delay:
+                continue
+            with _patch_lock:
+                if self._pending.get(site_id) != patched_at:
+                    continue  # edited again meanwhile
+                del self._pending[site_id]
+                index = tenant_cache.peek(site_id)
+                # A copy, so later patches cannot change it mid-write
+                snapshot = index.compacted() if index is not None else None
+            if snapshot is None:
+                continue  # evicted: the next load rebuilds and writes it
+            try:
+                write_snapshot(snapshot, snapshot_path(site_id))
+                written.append(site_id)
+            except OSError as e:
+                print(f"Could not write index snapshot for site {site_id}: {e}")
+        return written
+
+    def _ensure_thread(self):
+        # Threads do not survive fork, so start one per process on first use
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='index-snapshots', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(0.1, self.delay / 2))
+            if self._pending:
+                self.write_due()
+
+
+snapshot_writer = SnapshotWriter()
+
+
+def encode_phrases(site_id: int, texts) -> dict:
+    """{text: embedding} for phrases about to be patched into the site's resident index.
+
+    Call before patch_index: the encode can be slow and must not hold the
+    process-wide patch lock. Empty when the resident index (if any) has no embeddings.
+    """
+    index = tenant_cache.peek(site_id)
+    texts = [text for text in texts if text]
+    if index is None or index.embeddings is None or not texts:
+        return {}
+    return dict(zip(texts, get_batcher().encode_many([text.strip() for text in texts])))
+
+
+def patch_index(site_id: int, previous_version: int, new_version: int, apply) -> bool:
+    """Apply one committed intent edit to the site's resident index instead of rebuilding it.
+
+    `apply(index)` performs the edit (add_phrase, remove_intent, ...) with
+    any phrase embeddings already computed (encode_phrases). It only runs
+    when the cached index is exactly at `previous_version`; anything else
+    (another edit raced in, the index is stale) drops the index so the next
+    request loads it fresh, as does an edit that raises. Returns True when
+    the index was patched; its snapshot is rewritten later by snapshot_writer.
+    """
+    with _patch_lock:
+        index = tenant_cache.peek(site_id)
+        if index is None:
+            # Not resident here; the stale snapshot is rebuilt by whoever loads it next
+            return False
+        if index.version != previous_version:
+            tenant_cache.discard(site_id)
+            return False
+        try:
+            apply(index)
+        except Exception:
+            tenant_cache.discard(site_id)
+            raise
+        index.version = new_version
+        if index.needs_compaction():
+            index = index.compacted()
+            index.fuzzy_vocabulary()
+        # Re-charge the memory budget for the grown (or compacted) index
+        tenant_cache.put(site_id, index)
+    snapshot_writer.schedule(site_id)
+    return True
+
+
+def invalidate(site_id=None):
+    # Site indexes only reference the global layer, so dropping site 0 leaves them valid
+    tenant_cache.discard(site_id)
+
+
+def prewarm(limit: int = TENANT_PREWARM_COUNT, days: int = TENANT_PREWARM_DAYS) -> list:
+    """Load the busiest sites' indexes, stopping before the budget would force evictions."""
+    from services.analytics import site_volumes
+
+    tenant_cache.get(GLOBAL_SITE_ID)
+    loaded = []
+    for site_id, _ in site_volumes(days, limit):
+        if tenant_cache.resident_bytes >= 0.9 * tenant_cache.max_bytes:
+            break
+        tenant_cache.get(site_id)
+        loaded.append(site_id)
+    return loaded
+
+
+def memory_report() -> dict:
+    """Per-site memory usage of the indexes cached in this worker, with cache statistics."""
+    sites = [index.memory_usage() for index in tenant_cache.indexes()]
+    return {
+        'cache': tenant_cache.stats(),
+        'sites': sorted(sites, key=lambda u: u['heap_bytes'], reverse=True),
+        'heap_bytes': sum(u['heap_bytes'] for u in sites),
+        'mapped_bytes': sum(u['mapped_bytes'] for u in sites)
+    }
+
+
+@on_tenant_change
+def _on_tenant_change(site_id, intents_changed, config_changed):
+    if not intents_changed:
+        return
+    index = tenant_cache.peek(site_id)
+    if index is not None and index.version == get_versions(site_id)[0]:
+        # Already patched in place by the worker that made the edit
+        return
+    invalidate(site_id)
@@ -8,6 +8,8 @@ STOP_WORDS = {
     "on", "at", "by", "with", "from", "about", "as", "be"
 }
 
+STEM_SUFFIXES = ('ing', 'ies', 'es', 'ed', 's')
+
 
 def tokenize(text):
     """Tokenize text in a sector-agnostic way.
@@ -21,3 +23,15 @@ def tokenize(text):
         return []
     text = re.sub(r"[^\w\s]", " ", text.lower())
     return [w for w in text.split() if w and w not in STOP_WORDS]
+
+
+def stem(word):
+    """Strip one common English suffix, keeping at least three characters.
+
+    Much cruder than porter; enough to match 'orders' with 'order' when
+    comparing word sets.
+    """
+    for suffix in STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for wsgi:app.
+
+The app is imported once in the master (preload_app) and workers are
+forked from it, so code and read-only data are shared copy-on-write and a
+worker boots in milliseconds. Anything holding sockets or threads must not
+cross the fork: database pools are disposed in post_fork, and the
+embedding batcher, workflow pool and HTTP session are created lazily per
+process. Each worker then prewarms the busiest sites' intent indexes, and
+writes any chat logs it deferred under load before it exits (max_requests
+recycles workers regularly). Conversation state (services/session_store.py)
+is per worker, so with several workers put sticky sessions in front.
+
+Override any value with GUNICORN_CMD_ARGS, e.g. GUNICORN_CMD_ARGS="--workers 8".
+"""
+import multiprocessing
+import os
+import threading
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+preload_app = True
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+# Threads overlap I/O waits (SQLite, workflow HTTP calls, embedding batches)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Long enough for streaming exports; workflow calls have their own much shorter timeouts
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth from per-process caches
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = 500
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (if any) must not be shared with children
+    from database import db
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+    # Load the busiest sites' intent indexes in the background; requests are served meanwhile
+    threading.Thread(target=_prewarm, args=(app, worker), name='prewarm', daemon=True).start()
+
+
+def _prewarm(app, worker):
+    from core.tenant_index import prewarm
+    try:
+        with app.app_context():
+            loaded = prewarm()
+        worker.log.info('Prewarmed %d tenant indexes', len(loaded))
+    except Exception as e:
+        worker.log.warning('Tenant index prewarm failed: %s', e)
+
+
+def worker_exit(server, worker):
+    # Chat logs held back while shedding load live only in this process
+    from services.chat_service import deferred_logs
+    try:
+        written = deferred_logs.flush_at_exit(server.app.wsgi())
+        if written:
+            worker.log.info('Wrote %d deferred chat logs', written)
+    except Exception as e:
+        worker.log.warning('Writing deferred chat logs failed: %s', e)
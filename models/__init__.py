@@ -4,6 +4,7 @@ Moved from top-level models.py to package for multi-tenant refactor
 """
 from database import db
 from datetime import datetime
+from sqlalchemy import event, DDL
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class Admin(db.Model):
@@ -30,20 +31,32 @@ class Admin(db.Model):
         return f'<Admin {self.username}>'
 
 class FAQ(db.Model):
-    """FAQ model - stores question-answer pairs (Legacy/Optional)"""
+    """FAQ model - question-answer pairs, full-text searched as a fallback (services/faq_search.py)"""
     __tablename__ = 'faqs'
     
     id = db.Column(db.Integer, primary_key=True)
-    question = db.Column(db.String(500), nullable=False, unique=True)
+    # Site the FAQ belongs to; 0 = shared by every site (like global intents)
+    site_id = db.Column(db.Integer, nullable=False, default=0, index=True)
+    # Optional sector, matched against Intent.sector
+    sector = db.Column(db.String(50), nullable=True)
+    question = db.Column(db.String(500), nullable=False)
     answer = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(100), default='General')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Unique per site, so two sites can each answer the same question their own way.
+    # Existing databases: scripts/migrations/009_faq_unique_per_site.sql
+    __table_args__ = (
+        db.UniqueConstraint('site_id', 'question', name='uq_faqs_site_question'),
+    )
     
     def to_dict(self):
         """Convert FAQ to dictionary"""
         return {
             'id': self.id,
+            'site_id': self.site_id,
+            'sector': self.sector,
             'question': self.question,
             'answer': self.answer,
             'category': self.category,
@@ -54,6 +67,29 @@ class FAQ(db.Model):
     def __repr__(self):
         return f'<FAQ {self.question[:50]}>'
 
+
+# FTS5 index over faqs, kept in sync by triggers. Contentless (content=''): only
+# the postings are stored, searches join back to faqs by rowid. `scope` holds 'site<id>' so a search only walks the
+# posting lists of the asking site and the shared FAQs. Existing databases:
+# scripts/migrations/007_faq_fts.sql
+FAQ_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS faqs_fts USING fts5("
+    "question, answer, scope, content='', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS faqs_fts_ai AFTER INSERT ON faqs BEGIN "
+    "INSERT INTO faqs_fts (rowid, question, answer, scope) "
+    "VALUES (new.id, new.question, new.answer, 'site' || new.site_id); END",
+    "CREATE TRIGGER IF NOT EXISTS faqs_fts_ad AFTER DELETE ON faqs BEGIN "
+    "INSERT INTO faqs_fts (faqs_fts, rowid, question, answer, scope) "
+    "VALUES ('delete', old.id, old.question, old.answer, 'site' || old.site_id); END",
+    "CREATE TRIGGER IF NOT EXISTS faqs_fts_au AFTER UPDATE OF question, answer, site_id ON faqs BEGIN "
+    "INSERT INTO faqs_fts (faqs_fts, rowid, question, answer, scope) "
+    "VALUES ('delete', old.id, old.question, old.answer, 'site' || old.site_id); "
+    "INSERT INTO faqs_fts (rowid, question, answer, scope) "
+    "VALUES (new.id, new.question, new.answer, 'site' || new.site_id); END",
+)
+for _statement in FAQ_FTS_DDL:
+    event.listen(FAQ.__table__, 'after_create', DDL(_statement))
+
 class UnansweredQuestion(db.Model):
     """Unanswered question model - tracks questions bot couldn't answer"""
     __tablename__ = 'unanswered_questions'
@@ -67,6 +103,8 @@ class UnansweredQuestion(db.Model):
     user_email = db.Column(db.String(255), nullable=True)
     status = db.Column(db.String(50), default='pending')  # 'pending', 'contacted', 'resolved'
     contacted_at = db.Column(db.DateTime, nullable=True)
+    # Set by `flask cluster-questions` (services/question_clusters.py); NULL = not clustered yet
+    cluster_id = db.Column(db.Integer, nullable=True, index=True)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -79,12 +117,46 @@ class UnansweredQuestion(db.Model):
             'user_name': self.user_name,
             'user_email': self.user_email,
             'status': self.status,
-            'contacted_at': self.contacted_at.isoformat() if self.contacted_at else None
+            'contacted_at': self.contacted_at.isoformat() if self.contacted_at else None,
+            'cluster_id': self.cluster_id
         }
     
     def __repr__(self):
         return f'<UnansweredQuestion {self.question[:50]}>'
 
+
+class QuestionCluster(db.Model):
+    """A group of near-duplicate unanswered questions (services/question_clusters.py)"""
+    __tablename__ = 'question_clusters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Most asked member question, refreshed on every clustering run
+    representative = db.Column(db.Text, nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=1)
+    times_asked = db.Column(db.Integer, nullable=False, default=1, index=True)
+    # MinHash signature of the question that founded the cluster; new questions are compared to it
+    signature = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'representative': self.representative,
+            'size': self.size,
+            'times_asked': self.times_asked,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class QuestionClusterBand(db.Model):
+    """LSH band key of a cluster's signature, to find candidate clusters for a new question"""
+    __tablename__ = 'question_cluster_bands'
+
+    band_key = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    cluster_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
 class LeadCapture(db.Model):
     """Lead capture model - stores user info when confidence is low"""
     __tablename__ = 'lead_captures'
@@ -115,6 +187,8 @@ class BrandingSettings(db.Model):
     __tablename__ = 'branding_settings'
     
     id = db.Column(db.Integer, primary_key=True)
+    # Site this branding belongs to. Null = platform default used by sites without their own row.
+    site_id = db.Column(db.Integer, nullable=True, unique=True)
     bot_name = db.Column(db.String(255), default='ChatBot')
     bot_description = db.Column(db.String(500), default="We're here to help")
     primary_color = db.Column(db.String(7), default='#667eea')  # Hex color
@@ -132,6 +206,7 @@ class BrandingSettings(db.Model):
         """Convert to dictionary"""
         return {
             'id': self.id,
+            'site_id': self.site_id,
             'bot_name': self.bot_name,
             'bot_description': self.bot_description,
             'primary_color': self.primary_color,
@@ -152,4 +227,6 @@ class BrandingSettings(db.Model):
 # Import new models from package siblings so package exposes unified API
 from .site import Site  # noqa: F401
 from .intent import Intent, IntentPhrase, Workflow, ClientConfig  # noqa: F401
-from .chat_log import ChatLog  # noqa: F401
\ No newline at end of file
+from .chat_log import ChatLog  # noqa: F401
+from .analytics import ChatRollup  # noqa: F401
+from .tenant_version import TenantVersion  # noqa: F401
@@ -0,0 +1,63 @@
+"""
+Pre-aggregated chat analytics, maintained incrementally as ChatLog rows are written
+"""
+from database import db
+
+
+class ChatRollup(db.Model):
+    """Counters per (site, period, bucket, intent).
+
+    period is 'hour', 'day' or 'total' (lifetime, bucket_start = epoch).
+    intent_name '*' holds the site-wide totals for the bucket.
+    conf_bin_N counts messages with confidence in [N/10, (N+1)/10).
+    Lives next to chat_logs so both are written in one transaction.
+    """
+    __tablename__ = 'chat_rollups'
+    __bind_key__ = 'logs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, nullable=False)
+    period = db.Column(db.String(8), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    intent_name = db.Column(db.String(255), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    answered = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.Float, nullable=False, default=0.0)
+    conf_bin_0 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_1 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_2 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_3 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_4 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_5 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_6 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_7 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_8 = db.Column(db.Integer, nullable=False, default=0)
+    conf_bin_9 = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('site_id', 'period', 'bucket_start', 'intent_name', name='uq_chat_rollups_bucket'),
+    )
+
+    @property
+    def unanswered(self):
+        return self.total - self.answered
+
+    @property
+    def confidence_bins(self):
+        return [getattr(self, f'conf_bin_{i}') for i in range(10)]
+
+    def to_dict(self):
+        return {
+            'site_id': self.site_id,
+            'period': self.period,
+            'bucket_start': self.bucket_start.isoformat(),
+            'intent_name': self.intent_name,
+            'total': self.total,
+            'answered': self.answered,
+            'unanswered': self.unanswered,
+            'avg_confidence': round(self.confidence_sum / self.total, 3) if self.total else 0.0,
+            'confidence_bins': self.confidence_bins
+        }
+
+    def __repr__(self):
+        return f'<ChatRollup site={self.site_id} {self.period} {self.bucket_start} {self.intent_name}>'
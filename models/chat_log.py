@@ -6,11 +6,16 @@ from datetime import datetime
 
 
 class ChatLog(db.Model):
-    """Multi-tenant chat log with site_id scoping"""
+    """Multi-tenant chat log with site_id scoping.
+
+    Stored in the separate 'logs' database (config.SQLALCHEMY_BINDS), so
+    site_id is a plain column rather than a foreign key to sites.
+    """
     __tablename__ = 'chat_logs'
+    __bind_key__ = 'logs'
 
     id = db.Column(db.Integer, primary_key=True)
-    site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False)
+    site_id = db.Column(db.Integer, nullable=False)
     user_message = db.Column(db.Text, nullable=False)
     detected_intent = db.Column(db.String(255), nullable=True)
     confidence = db.Column(db.Float, nullable=False, default=0.0)
@@ -18,6 +23,14 @@ class ChatLog(db.Model):
     session_id = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_chat_logs_site_created', 'site_id', 'created_at'),
+        # Keyset pagination for exports: WHERE site_id = ? AND id > ? ORDER BY id
+        db.Index('ix_chat_logs_site_id_id', 'site_id', 'id'),
+        # Ids are never reused once a row is deleted, so archives can track rows by id
+        {'sqlite_autoincrement': True},
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -7,7 +7,7 @@ class Intent(db.Model):
     __tablename__ = 'intents'
 
     id = db.Column(db.Integer, primary_key=True)
-    site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False)
+    site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False, index=True)
     intent_name = db.Column(db.String(255), nullable=False)
     # intent_type: 'action' or 'info' (or 'LEAD'/'HUMAN' for handoff semantics)
     intent_type = db.Column(db.String(20), nullable=False, default='info')
@@ -21,7 +21,8 @@ class Intent(db.Model):
 
     phrases = db.relationship('IntentPhrase', backref='intent', lazy='dynamic', cascade='all, delete-orphan')
 
-    def to_dict(self):
+    def to_dict(self, phrases=None):
+        """phrases: pre-loaded phrase strings; avoids one query per intent when listing many"""
         return {
             'id': self.id,
             'site_id': self.site_id,
@@ -29,7 +30,7 @@ class Intent(db.Model):
             'intent_type': self.intent_type,
             'confidence': self.confidence,
             'response': self.response,
-            'phrases': [p.phrase for p in self.phrases]
+            'phrases': phrases if phrases is not None else [p.phrase for p in self.phrases]
         }
 
     def __repr__(self):
@@ -41,7 +42,7 @@ class IntentPhrase(db.Model):
     __tablename__ = 'intent_phrases'
 
     id = db.Column(db.Integer, primary_key=True)
-    intent_id = db.Column(db.Integer, db.ForeignKey('intents.id'), nullable=False)
+    intent_id = db.Column(db.Integer, db.ForeignKey('intents.id'), nullable=False, index=True)
     phrase = db.Column(db.String(500), nullable=False)
 
     def __repr__(self):
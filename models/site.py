@@ -12,6 +12,10 @@ class Site(db.Model):
     domain_whitelist = db.Column(db.Text, nullable=True)  # Comma-separated domains allowed
     theme = db.Column(db.String(50), nullable=True)
     bot_name = db.Column(db.String(255), nullable=True)
+    # Days chat logs stay in the live database before archival (None = CHAT_LOG_HOT_DAYS)
+    chat_retention_days = db.Column(db.Integer, nullable=True)
+    # Days archived chat logs are kept (None = CHAT_ARCHIVE_RETENTION_DAYS, 0 = forever)
+    archive_retention_days = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # relationships (backrefs kept minimal to avoid circular imports)
@@ -25,6 +29,8 @@ class Site(db.Model):
             'domain_whitelist': self.domain_whitelist,
             'theme': self.theme,
             'bot_name': self.bot_name,
+            'chat_retention_days': self.chat_retention_days,
+            'archive_retention_days': self.archive_retention_days,
             'created_at': self.created_at.isoformat()
         }
     
@@ -0,0 +1,34 @@
+from database import db
+from datetime import datetime
+
+
+class TenantVersion(db.Model):
+    """Per-site change counters.
+
+    Bumped in the same transaction as any change to a site's intents/phrases
+    (intents_version) or ClientConfig values (config_version), so caches and
+    ETags can be validated with a single primary-key read.
+
+    change_seq is a table-wide sequence: every bump moves the site's row to
+    MAX(change_seq) + 1, so workers find all changes since their last poll
+    with one indexed range read (see services/tenant_changes.py).
+    """
+    __tablename__ = 'tenant_versions'
+
+    site_id = db.Column(db.Integer, primary_key=True)
+    intents_version = db.Column(db.Integer, nullable=False, default=0)
+    config_version = db.Column(db.Integer, nullable=False, default=0)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'site_id': self.site_id,
+            'intents_version': self.intents_version,
+            'config_version': self.config_version,
+            'change_seq': self.change_seq,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<TenantVersion site={self.site_id} i={self.intents_version} c={self.config_version}>'
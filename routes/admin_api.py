@@ -1,7 +1,24 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 from database import db
-from models import Site, Admin, ClientConfig, Intent
+from models import Site, Admin, ClientConfig, Intent, IntentPhrase, FAQ, UnansweredQuestion, QuestionCluster
 from services.importer import import_sector_template
+from services import analytics
+from services.tenant_version import bump as bump_tenant_version, get_versions
+from services.chat_archive import iter_chat_logs
+from services.chat_export import export_ndjson, export_csv
+from services import intent_editor
+from services.chat_channel import channels
+from services.tenant_changes import watcher, RedisPubSub
+from services.rendered_responses import missing_keys
+from services.admission import admission
+from services.chat_service import deferred_logs
+from services.query_stats import query_budget
+from core.tenant_index import memory_report
+from core.intent_engine import tier_counts
+from itertools import islice
+import hashlib
+from datetime import datetime
+from config import CONFIDENCE_THRESHOLD
 from functools import wraps
 import traceback
 from sqlalchemy.exc import IntegrityError # Import specific DB error
@@ -21,6 +38,7 @@ def super_admin_required(func):
 # --- CLIENT ROUTES ---
 
 @admin_api.route('/client/config', methods=['GET'])
+@query_budget(3)
 def get_client_config():
     if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
     site_id = session.get('site_id')
@@ -42,18 +60,299 @@ def update_client_config():
                 conf.value = value
             else:
                 db.session.add(ClientConfig(client_id=site_id, key=key, value=value))
+        bump_tenant_version(site_id, config=True)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
         print("Config Update Error:", e)
         return jsonify({'error': str(e)}), 500
 
+@admin_api.route('/client/config/missing-keys', methods=['GET'])
+@query_budget(8)
+def get_missing_config_keys():
+    """Intents whose response templates reference config keys that are absent or empty"""
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    report = missing_keys(site_id)
+    keys = sorted({key for item in report for key in item['missing'] + item['empty']})
+    return jsonify({'intents': report, 'keys': keys})
+
 @admin_api.route('/client/intents', methods=['GET'])
+@query_budget(6)
 def get_client_intents():
+    """Paginated intent listing.
+    Query: ?page=1&per_page=50&q=<name contains>&type=<intent_type>&sector=<sector>
+    Answers 304 when If-None-Match matches the site's current intents version.
+    """
     if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
     site_id = session.get('site_id')
-    intents = Intent.query.filter_by(site_id=site_id).all()
-    return jsonify({'intents': [i.to_dict() for i in intents]})
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    q = (request.args.get('q') or '').strip()
+    itype = (request.args.get('type') or '').strip()
+    sector = (request.args.get('sector') or '').strip()
+
+    intents_version, _ = get_versions(site_id)
+    filters = hashlib.sha1(f'{page}|{per_page}|{q}|{itype}|{sector}'.encode('utf-8')).hexdigest()[:12]
+    etag = f'intents-{site_id}-{intents_version}-{filters}'
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = db.select(Intent).filter_by(site_id=site_id)
+    if q:
+        query = query.filter(Intent.intent_name.ilike(f'%{q}%'))
+    if itype:
+        query = query.filter(Intent.intent_type == itype)
+    if sector:
+        query = query.filter(Intent.sector == sector)
+    pagination = db.paginate(query.order_by(Intent.id), page=page, per_page=per_page, error_out=False)
+
+    # One batched query for the page's phrases instead of one per intent
+    ids = [i.id for i in pagination.items]
+    phrases = {}
+    if ids:
+        rows = db.session.query(IntentPhrase.intent_id, IntentPhrase.phrase) \
+            .filter(IntentPhrase.intent_id.in_(ids)).order_by(IntentPhrase.id).all()
+        for intent_id, phrase in rows:
+            phrases.setdefault(intent_id, []).append(phrase)
+
+    response = jsonify({
+        'intents': [i.to_dict(phrases=phrases.get(i.id, [])) for i in pagination.items],
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'version': intents_version
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _owned_intent(intent_id):
+    intent = db.session.get(Intent, intent_id)
+    if not intent or intent.site_id != session.get('site_id'):
+        return None
+    return intent
+
+def _owned_phrase(phrase_id):
+    phrase = db.session.get(IntentPhrase, phrase_id)
+    if not phrase or phrase.intent.site_id != session.get('site_id'):
+        return None
+    return phrase
+
+# Single edits patch the site's compiled index in place, see services/intent_editor.py
+
+@admin_api.route('/client/intents', methods=['POST'])
+@query_budget(9)
+def create_client_intent():
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    data = request.json or {}
+    if not (data.get('intent_name') or '').strip():
+        return jsonify({'error': 'intent_name is required'}), 400
+    try:
+        intent = intent_editor.create_intent(site_id, data, data.get('phrases') or [])
+        return jsonify({'success': True, 'intent': intent.to_dict()}), 201
+    except Exception as e:
+        db.session.rollback()
+        print("Create Intent Error:", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_api.route('/client/intents/<int:intent_id>', methods=['PUT'])
+@query_budget(8)
+def update_client_intent(intent_id):
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    intent = _owned_intent(intent_id)
+    if not intent: return jsonify({'error': 'Intent not found'}), 404
+    try:
+        intent = intent_editor.update_intent(intent, request.json or {})
+        return jsonify({'success': True, 'intent': intent.to_dict()})
+    except Exception as e:
+        db.session.rollback()
+        print("Update Intent Error:", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_api.route('/client/intents/<int:intent_id>', methods=['DELETE'])
+@query_budget(12)
+def delete_client_intent(intent_id):
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    intent = _owned_intent(intent_id)
+    if not intent: return jsonify({'error': 'Intent not found'}), 404
+    try:
+        intent_editor.delete_intent(intent)
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        print("Delete Intent Error:", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_api.route('/client/intents/<int:intent_id>/phrases', methods=['POST'])
+@query_budget(7)
+def add_client_phrase(intent_id):
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    intent = _owned_intent(intent_id)
+    if not intent: return jsonify({'error': 'Intent not found'}), 404
+    text = ((request.json or {}).get('phrase') or '').strip()
+    if not text: return jsonify({'error': 'phrase is required'}), 400
+    try:
+        phrase = intent_editor.add_phrase(intent, text)
+        return jsonify({'success': True, 'phrase': {'id': phrase.id, 'intent_id': intent_id, 'phrase': text}}), 201
+    except Exception as e:
+        db.session.rollback()
+        print("Add Phrase Error:", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_api.route('/client/phrases/<int:phrase_id>', methods=['PUT'])
+@query_budget(8)
+def update_client_phrase(phrase_id):
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    phrase = _owned_phrase(phrase_id)
+    if not phrase: return jsonify({'error': 'Phrase not found'}), 404
+    text = ((request.json or {}).get('phrase') or '').strip()
+    if not text: return jsonify({'error': 'phrase is required'}), 400
+    try:
+        intent_id = phrase.intent_id
+        intent_editor.update_phrase(phrase, text)
+        return jsonify({'success': True, 'phrase': {'id': phrase_id, 'intent_id': intent_id, 'phrase': text}})
+    except Exception as e:
+        db.session.rollback()
+        print("Update Phrase Error:", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_api.route('/client/phrases/<int:phrase_id>', methods=['DELETE'])
+@query_budget(8)
+def delete_client_phrase(phrase_id):
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    phrase = _owned_phrase(phrase_id)
+    if not phrase: return jsonify({'error': 'Phrase not found'}), 404
+    try:
+        intent_editor.delete_phrase(phrase)
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        print("Delete Phrase Error:", e)
+        return jsonify({'error': str(e)}), 500
+
+# --- LIVE SESSIONS (widget sockets) ---
+
+@admin_api.route('/client/sessions/<session_id>/push', methods=['POST'])
+@query_budget(2)
+def push_to_session_route(session_id):
+    """
+    Push an event to a visitor's open widget socket, e.g. from the CRM on handoff:
+    { "event": "handoff", "data": {"status": "agent_joined", "message": "An agent has joined"} }
+    `delivered` counts the sockets of this worker that got it. With TENANT_PUBSUB_URL the event
+    is also published to every other worker and node (`published`); without it, only this
+    worker's sockets are reached, so use a single worker.
+    """
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+    data = request.get_json(silent=True) or {}
+    event = data.get('event')
+    if not event:
+        return jsonify({'error': 'event is required'}), 400
+    delivered = channels.push(site_id, session_id, event, data.get('data'))
+    return jsonify({'delivered': delivered, 'published': isinstance(watcher.pubsub, RedisPubSub)})
+
+# --- ANALYTICS (reads pre-aggregated rollups only) ---
+
+@admin_api.route('/stats', methods=['GET'])
+@query_budget(4)
+def get_dashboard_stats():
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    totals = analytics.lifetime_totals(site_id)
+    return jsonify({
+        'total_chats': totals['total_chats'],
+        'answer_rate': totals['answer_rate'],
+        'unanswered_questions': totals['unanswered'],
+        'total_faqs': FAQ.query.count(),
+        'confidence_threshold': CONFIDENCE_THRESHOLD
+    })
+
+@admin_api.route('/client/analytics/summary', methods=['GET'])
+@query_budget(4)
+def get_analytics_summary():
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    days = min(max(request.args.get('days', 7, type=int), 1), 366)
+    top = min(max(request.args.get('top', 10, type=int), 1), 100)
+    return jsonify(analytics.site_summary(site_id, days=days, top=top))
+
+@admin_api.route('/client/analytics/timeseries', methods=['GET'])
+@query_budget(5)
+def get_analytics_timeseries():
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    period = request.args.get('period', 'day')
+    if period not in ('hour', 'day'):
+        return jsonify({'error': 'period must be hour or day'}), 400
+    max_days = 31 if period == 'hour' else 366
+    days = min(max(request.args.get('days', 7, type=int), 1), max_days)
+    intent_name = request.args.get('intent') or analytics.ALL_INTENTS
+    points = analytics.timeseries(site_id, period=period, days=days, intent_name=intent_name)
+    return jsonify({'period': period, 'days': days, 'intent': intent_name, 'points': points})
+
+@admin_api.route('/client/chat-logs', methods=['GET'])
+@query_budget(4)
+def get_chat_logs():
+    """Chat logs for a date range, read from live and archived partitions alike.
+    Query: ?start=2026-01-01&end=2026-02-01&limit=200&after_id=<last id seen>
+    """
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start/end must be ISO dates'}), 400
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 1000)
+    after_id = request.args.get('after_id', 0, type=int)
+
+    logs = list(islice(iter_chat_logs(site_id, start=start, end=end, after_id=after_id), limit))
+    next_after_id = logs[-1]['id'] if len(logs) == limit else None
+    return jsonify({'logs': logs, 'next_after_id': next_after_id})
+
+@admin_api.route('/client/chat-logs/export', methods=['GET'])
+def export_chat_logs():
+    """Stream every chat log of the site as NDJSON (default) or CSV.
+    Query: ?format=ndjson|csv&cursor=<last id received, to resume>
+    """
+    if 'admin_id' not in session: return jsonify({'error': 'Unauthorized'}), 401
+    site_id = session.get('site_id')
+    if not site_id: return jsonify({'error': 'No site linked'}), 400
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+
+    if fmt == 'csv':
+        body, mimetype = export_csv(site_id, cursor), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(site_id, cursor), 'application/x-ndjson'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    suffix = f'-from-{cursor}' if cursor else ''
+    response.headers['Content-Disposition'] = f'attachment; filename=chat-logs-site-{site_id}{suffix}.{fmt}'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+    return response
 
 # --- SUPER ADMIN ROUTES ---
 
@@ -112,6 +411,47 @@ def list_sites_route():
     sites = Site.query.all()
     return jsonify({'sites': [s.to_dict() for s in sites]})
 
+@admin_api.route('/super/indexes', methods=['GET'])
+@super_admin_required
+def index_memory_route():
+    """Memory held by the compiled intent indexes cached in this worker, per site."""
+    return jsonify(memory_report())
+
+@admin_api.route('/super/sockets', methods=['GET'])
+@super_admin_required
+def socket_stats_route():
+    """Widget WebSocket connections open on this worker."""
+    return jsonify(channels.stats())
+
+@admin_api.route('/super/admission', methods=['GET'])
+@super_admin_required
+def admission_stats_route():
+    """Load level, chat requests in flight, refusals and scoring tiers used on this worker."""
+    return jsonify({**admission.stats(), 'deferred_logs': len(deferred_logs), 'scoring_tiers': dict(tier_counts)})
+
+@admin_api.route('/super/question-clusters', methods=['GET'])
+@super_admin_required
+@query_budget(4)
+def list_question_clusters_route():
+    """Most asked clusters of unanswered questions (built by `flask cluster-questions`)."""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    min_size = request.args.get('min_size', 1, type=int)
+    clusters = QuestionCluster.query.filter(QuestionCluster.size >= min_size) \
+        .order_by(QuestionCluster.times_asked.desc(), QuestionCluster.id).limit(limit).all()
+    return jsonify({'clusters': [c.to_dict() for c in clusters]})
+
+@admin_api.route('/super/question-clusters/<int:cluster_id>', methods=['GET'])
+@super_admin_required
+@query_budget(5)
+def question_cluster_route(cluster_id):
+    cluster = db.session.get(QuestionCluster, cluster_id)
+    if not cluster:
+        return jsonify({'error': 'Cluster not found'}), 404
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    questions = UnansweredQuestion.query.filter_by(cluster_id=cluster_id) \
+        .order_by(UnansweredQuestion.times_asked.desc(), UnansweredQuestion.id).limit(limit).all()
+    return jsonify({'cluster': cluster.to_dict(), 'questions': [q.to_dict() for q in questions]})
+
 @admin_api.route('/super/import_template', methods=['POST'])
 @super_admin_required
 def upload_template_route():
@@ -2,10 +2,14 @@
 Multi-tenant chat routes for SaaS
 Handles all chat API endpoints with site_id scoping and domain whitelisting
 """
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from models.site import Site
-from services.chat_service import process_message
-from database import db
+from services.chat_service import process_message, stream_message, get_session_history, record_edge_hits
+from services.edge_bundle import edge_replies
+from services.admission import admission, retry_after_header
+from config import EDGE_HITS_MAX_BATCH
+from services.query_stats import query_budget
 
 # Define Blueprint
 chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
@@ -20,7 +24,21 @@ def get_request_domain():
         return domain
     return request.headers.get('Host', '').split(':')[0]
 
+def _admit(site_id):
+    """(ticket, None) or (None, error response): 429 when the site or the worker is over its limits."""
+    try:
+        site_id = int(site_id)
+    except (TypeError, ValueError):
+        return None, (jsonify({'error': 'site_id must be an integer'}), 400)
+    ticket = admission.admit(site_id)
+    if ticket.admitted:
+        return ticket, None
+    response = jsonify({'error': 'Too many requests, please retry shortly', 'reason': ticket.reason})
+    response.headers['Retry-After'] = retry_after_header(ticket)
+    return None, (response, 429)
+
 @chat_bp.route('', methods=['POST'])
+@query_budget(14)
 def send_message():
     """
     Post a message and get bot response
@@ -42,23 +60,147 @@ def send_message():
     if not message:
         return jsonify({'error': 'Message cannot be empty'}), 400
 
-    # 3. Validate Site
-    site = Site.query.filter_by(id=site_id).first()
-    if not site:
-        return jsonify({'error': f'Site ID {site_id} not found'}), 404
-
-    # 4. Domain Whitelisting (Security)
-    # request_domain = get_request_domain()
-    # if not site.is_domain_allowed(request_domain):
-    #     return jsonify({'error': f'Domain {request_domain} is not whitelisted for this site'}), 403
-    
-    # 5. Process message
+    # 3. Admission: per-site rate and concurrency, worker load (services/admission.py)
+    ticket, refused = _admit(site_id)
+    if refused:
+        return refused
     try:
-        response = process_message(site_id, message, session_id)
+        # 4. Validate Site
+        site = Site.query.filter_by(id=site_id).first()
+        if not site:
+            return jsonify({'error': f'Site ID {site_id} not found'}), 404
+
+        # 5. Domain Whitelisting (Security)
+        # request_domain = get_request_domain()
+        # if not site.is_domain_allowed(request_domain):
+        #     return jsonify({'error': f'Domain {request_domain} is not whitelisted for this site'}), 403
+
+        # 6. Process message
+        response = process_message(site_id, message, session_id, ticket)
         # Handle response object or dict
         if hasattr(response, 'to_dict'):
             return jsonify(response.to_dict()), 200
         return jsonify(response), 200
     except Exception as e:
         print(f"Error processing message: {e}")
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+    finally:
+        admission.release(ticket)
+
+@chat_bp.route('/stream', methods=['POST'])
+@query_budget(2)
+def stream_chat():
+    """
+    Same as POST /api/chat, answered as Server-Sent Events so the widget can
+    show progress: `ack` at once, `intent` when detected, `reply` when the
+    reply is rendered (after the workflow, for action intents), or `error`.
+    Required JSON: { "site_id": 1, "message": "Hello" }
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    site_id = data.get('site_id')
+    message = data.get('message')
+    if not site_id:
+        return jsonify({'error': 'Missing site_id parameter. Frontend must send site_id.'}), 400
+    if not message:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    ticket, refused = _admit(site_id)
+    if refused:
+        return refused
+    try:
+        if not Site.query.filter_by(id=site_id).first():
+            admission.release(ticket)
+            return jsonify({'error': f'Site ID {site_id} not found'}), 404
+
+        def events():
+            try:
+                for event, payload in stream_message(site_id, message, data.get('session_id'), ticket):
+                    yield f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+            except Exception as e:
+                print(f"Error streaming message: {e}")
+                yield f'event: error\ndata: {json.dumps({"error": "Internal server error"})}\n\n'
+
+        response = Response(stream_with_context(events()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Keep nginx from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        # Also runs when the client goes away before the generator started
+        response.call_on_close(lambda: admission.release(ticket))
+        return response
+    except Exception:
+        # Until the response owns the ticket it is ours to give back (release is idempotent)
+        admission.release(ticket)
+        raise
+
+@chat_bp.route('/edge-hits', methods=['POST'])
+@query_budget(8)
+def log_edge_hits():
+    """
+    Messages the widget answered locally from its edge bundle, reported in batches
+    JSON: { "site_id": 1, "hits": [{ "session_id", "message", "intent_id", "confidence", "age_ms" }] }
+    Sent as text/plain (no CORS preflight), hence force=True.
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No JSON data provided'}), 400
+    site_id = data.get('site_id')
+    hits = data.get('hits')
+    if not site_id:
+        return jsonify({'error': 'Missing site_id parameter. Frontend must send site_id.'}), 400
+    if not isinstance(hits, list) or not hits:
+        return jsonify({'error': 'No hits provided'}), 400
+    if len(hits) > EDGE_HITS_MAX_BATCH:
+        return jsonify({'error': f'At most {EDGE_HITS_MAX_BATCH} hits per batch'}), 400
+    ticket, refused = _admit(site_id)
+    if refused:
+        return refused
+    try:
+        return _log_edge_hits(site_id, hits, ticket)
+    finally:
+        admission.release(ticket)
+
+
+def _log_edge_hits(site_id, hits, ticket):
+    if not Site.query.filter_by(id=site_id).first():
+        return jsonify({'error': f'Site ID {site_id} not found'}), 404
+
+    valid, skipped = [], 0
+    for hit in hits:
+        try:
+            valid.append({
+                'intent_id': int(hit.get('intent_id')),
+                'message': str(hit.get('message') or '').strip(),
+                'session_id': str(hit.get('session_id') or ''),
+                'confidence': min(max(float(hit.get('confidence') or 0.0), 0.0), 1.0),
+                'age_ms': min(max(int(hit.get('age_ms') or 0), 0), 86400000)
+            })
+        except (AttributeError, TypeError, ValueError):
+            skipped += 1
+
+    # Only intents the bundle could have shipped are logged as edge answers
+    replies = edge_replies(site_id, [hit['intent_id'] for hit in valid])
+    accepted = []
+    for hit in valid:
+        if hit['intent_id'] not in replies or not hit['message'] or len(hit['message']) > 2000 \
+                or not hit['session_id'] or len(hit['session_id']) > 100:
+            skipped += 1
+            continue
+        hit['intent_name'], hit['reply'] = replies[hit['intent_id']]
+        accepted.append(hit)
+
+    logged = record_edge_hits(site_id, accepted, defer=ticket.defer_logging) if accepted else 0
+    return jsonify({'logged': logged, 'skipped': skipped}), 200
+
+@chat_bp.route('/history', methods=['GET'])
+@query_budget(3)
+def session_history():
+    """
+    Recent turns for a session, served from the in-process session store
+    Query: ?site_id=1&session_id=<id>
+    """
+    site_id = request.args.get('site_id', type=int)
+    session_id = request.args.get('session_id')
+    if not site_id or not session_id:
+        return jsonify({'error': 'site_id and session_id are required'}), 400
+    return jsonify({'session_id': session_id, 'history': get_session_history(site_id, session_id)}), 200
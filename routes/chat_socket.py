@@ -0,0 +1,128 @@
+"""
+WebSocket channel for the embedded widget: /ws/chat?site_id=1[&session_id=...]
+
+The site is checked and the chat session fixed once, when the socket opens,
+so a message costs no preflight, no site lookup and no session handling.
+All frames are JSON objects with a `type`:
+
+    server -> client   ready {session_id}        after the socket is accepted
+    client -> server   message {id, message}     id is echoed on every frame it causes
+    server -> client   ack / intent / reply {id, ...}
+                                                 the events of services.chat_service.stream_message
+    client -> server   ping {id}                 answered with pong {id}
+    server -> client   push {event, data}        out-of-band, e.g. handoff status
+    server -> client   error {id?, error}        a bad frame, a failed message or a refused socket;
+                                                 {reason, retry_after} when admission control refused it
+
+Messages of one socket are answered in order; pushes from other threads are
+interleaved between frames. Sockets are refused (error, then close 1013)
+beyond CHAT_SOCKET_MAX_CONNECTIONS / CHAT_SOCKET_MAX_PER_SITE and closed
+after CHAT_SOCKET_IDLE_SECONDS without a message; the widget then falls
+back to HTTP, or reopens the socket with its next message. Each open socket
+holds a gthread thread, so the idle timeout is kept short; in admission
+control a socket only counts while one of its messages is being answered.
+
+flask-sock is optional: without it the route is not registered.
+"""
+import json
+import socket
+import uuid
+from flask import request, g
+from database import db
+from models.site import Site
+from services.chat_channel import channels, Connection
+from services.chat_service import stream_message
+from services.admission import admission
+from services.tenant_changes import watcher
+from config import CHAT_SOCKET_IDLE_SECONDS
+
+# Close codes (RFC 6455)
+POLICY_VIOLATION = 1008
+TRY_AGAIN_LATER = 1013
+
+
+def chat_socket(ws):
+    site_id = request.args.get('site_id', type=int)
+    if not site_id or not db.session.get(Site, site_id):
+        ws.send(json.dumps({'type': 'error', 'error': f'Site ID {site_id} not found'}))
+        ws.close(POLICY_VIOLATION)
+        return
+    session_id = request.args.get('session_id') or str(uuid.uuid4())
+    # Nothing below needs the connection between messages
+    db.session.remove()
+    # The socket outlives the request; per-request SQL accounting would add up every message
+    g.pop('query_stats', None)
+
+    # ack, intent and reply go out as separate small frames; don't let Nagle hold them back
+    sock = getattr(ws, 'sock', None)
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+
+    connection = Connection(ws, site_id, session_id)
+    if not channels.register(connection):
+        connection.send('error', error='Too many open connections')
+        ws.close(TRY_AGAIN_LATER)
+        return
+    # Reported by the admission stats; only its messages count towards the load level
+    admission.open_socket()
+    # flask-sock closes the socket when this returns and ignores ConnectionClosed
+    try:
+        connection.send('ready', session_id=session_id)
+        while True:
+            raw = ws.receive(timeout=CHAT_SOCKET_IDLE_SECONDS)
+            if raw is None:
+                break
+            _handle_frame(connection, raw)
+    finally:
+        admission.close_socket()
+        channels.unregister(connection)
+
+
+def _handle_frame(connection, raw):
+    try:
+        frame = json.loads(raw)
+        frame_type = frame.get('type')
+    except (ValueError, AttributeError):
+        connection.send('error', error='Frames must be JSON objects')
+        return
+    frame_id = frame.get('id')
+    if frame_type == 'ping':
+        connection.send('pong', id=frame_id)
+        return
+    message = (frame.get('message') or '').strip() if frame_type == 'message' else ''
+    if not message:
+        connection.send('error', id=frame_id, error='Message cannot be empty')
+        return
+
+    # Same per-site rate, concurrency and load shedding as the HTTP endpoints
+    ticket = admission.admit(connection.site_id)
+    if not ticket.admitted:
+        connection.send('error', id=frame_id, error='Too many requests, please retry shortly',
+                        reason=ticket.reason, retry_after=round(ticket.retry_after, 1))
+        return
+
+    # What before_request does for HTTP: notice intent/config changes from other workers
+    watcher.maybe_poll()
+    try:
+        for event, data in stream_message(connection.site_id, message, connection.session_id, ticket):
+            connection.send(event, id=frame_id, **data)
+    except Exception as e:
+        print(f"Error processing message: {e}")
+        connection.send('error', id=frame_id, error='Internal server error')
+    finally:
+        admission.release(ticket)
+        db.session.remove()
+
+
+def init_chat_socket(app):
+    """Register /ws/chat when flask-sock is installed."""
+    try:
+        from flask_sock import Sock
+    except ImportError:
+        return None
+    sock = Sock(app)
+    sock.route('/ws/chat')(chat_socket)
+    return sock
@@ -0,0 +1,73 @@
+"""
+Server-rendered pages: landing page, admin login and dashboards
+"""
+from flask import Blueprint, render_template, request, session, redirect, url_for
+from functools import wraps
+from models import Admin
+
+pages_bp = Blueprint('pages', __name__)
+
+# --- HELPER FUNCTIONS ---
+def login_required(f):
+    """
+    Decorator to require admin login for routes
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'admin_id' not in session:
+            return redirect(url_for('pages.admin_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# --- PUBLIC ROUTES ---
+
+@pages_bp.route('/')
+def index():
+    """
+    Main Landing Page for the SaaS Platform
+    """
+    return render_template('landing.html')
+
+# --- AUTHENTICATION ---
+
+@pages_bp.route('/admin/login', methods=['GET', 'POST'])
+def admin_login():
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        
+        admin = Admin.query.filter_by(username=username).first()
+        
+        if admin and admin.check_password(password):
+            session['admin_id'] = admin.id
+            session['site_id'] = getattr(admin, 'site_id', None)
+            session.permanent = True
+            
+            if getattr(admin, 'is_super', False):
+                return redirect(url_for('pages.super_dashboard'))
+            return redirect(url_for('pages.admin_dashboard'))
+        else:
+            return render_template('admin_login.html', error='Invalid credentials')
+    
+    return render_template('admin_login.html')
+
+@pages_bp.route('/admin/logout')
+def admin_logout():
+    session.clear()
+    return redirect(url_for('pages.index'))
+
+# --- DASHBOARDS ---
+
+@pages_bp.route('/super/dashboard')
+@login_required
+def super_dashboard():
+    user_id = session.get('admin_id')
+    admin = Admin.query.get(user_id)
+    if not admin or not getattr(admin, 'is_super', False):
+        return "Access Denied: Super Admin rights required", 403
+    return render_template('super_dashboard.html')
+
+@pages_bp.route('/admin/dashboard')
+@login_required
+def admin_dashboard():
+    return render_template('admin_dashboard.html', site_id=session.get('site_id'))
@@ -0,0 +1,68 @@
+"""
+Public widget endpoints: embed loader, hashed assets, per-site settings
+"""
+from flask import Blueprint, request, jsonify, redirect, render_template, current_app
+from models import BrandingSettings, Site
+from services import widget_settings
+from services.edge_bundle import get_edge_bundle
+from services.static_assets import get_asset, asset_response, loader_response
+from services.query_stats import query_budget
+from config import WIDGET_SETTINGS_MAX_AGE, WIDGET_LOADER_MAX_AGE, ASSET_MAX_AGE, EDGE_BUNDLE_MAX_AGE
+
+widget_bp = Blueprint('widget', __name__)
+
+
+@widget_bp.route('/widget.js')
+def widget_embed():
+    """Stable embed URL: a small loader (short cache) that injects the versioned widget bundle"""
+    return loader_response()
+
+
+@widget_bp.route('/assets/<digest>/<name>')
+def widget_asset(digest, name):
+    """Content-hashed widget assets, cached forever"""
+    asset = get_asset(name)
+    if not asset:
+        return jsonify({'error': 'Not found'}), 404
+    if asset.digest != digest:
+        # Old fingerprint: point at the current one without caching the redirect for long
+        response = redirect(asset.url)
+        response.headers['Cache-Control'] = f'public, max-age={WIDGET_LOADER_MAX_AGE}'
+        return response
+    return asset_response(asset, ASSET_MAX_AGE, immutable=True)
+
+
+@widget_bp.route('/api/widget-settings')
+@query_budget(4)
+def get_widget_settings():
+    site_id = request.args.get('site_id', type=int)
+    settings = widget_settings.get_widget_settings(site_id)
+    response = current_app.response_class(settings.body, mimetype='application/json')
+    response.set_etag(settings.etag)
+    if settings.last_modified:
+        response.last_modified = settings.last_modified
+    response.headers['Cache-Control'] = f'public, max-age={WIDGET_SETTINGS_MAX_AGE}'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response.make_conditional(request)
+
+
+@widget_bp.route('/api/edge-bundle')
+@query_budget(12)
+def get_edge_bundle_route():
+    """Top static intents for answering in the widget (services/edge_bundle.py)"""
+    site_id = request.args.get('site_id', type=int)
+    if not site_id or not Site.query.filter_by(id=site_id).first():
+        return jsonify({'error': f'Site ID {site_id} not found'}), 404
+    bundle = get_edge_bundle(site_id)
+    response = current_app.response_class(bundle.body, mimetype='application/json')
+    response.set_etag(bundle.etag)
+    response.headers['Cache-Control'] = f'public, max-age={EDGE_BUNDLE_MAX_AGE}'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response.make_conditional(request)
+
+
+@widget_bp.route('/widget/init.html')
+def widget_init():
+    branding = BrandingSettings.query.first()
+    api_url = request.args.get('api', 'http://localhost:5000')
+    return render_template('widget.html', api_url=api_url, branding=branding)
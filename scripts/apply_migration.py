@@ -2,8 +2,10 @@
 
 Usage:
     python scripts/apply_migration.py scripts/migrations/001_add_workflow_clientconfig.sql
+    python scripts/apply_migration.py scripts/migrations/003_chat_logs_keyset_index.sql --logs
 
-This reads the DB path from config.DATABASE_PATH and executes the SQL file.
+This reads the DB path from config.DATABASE_PATH (or config.CHAT_LOG_DATABASE_PATH
+with --logs) and executes the SQL file.
 """
 import sys
 from pathlib import Path
@@ -20,10 +22,10 @@ if __name__ == '__main__':
 
     # import config and sqlite3
     sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-    from config import DATABASE_PATH
+    from config import DATABASE_PATH, CHAT_LOG_DATABASE_PATH
     import sqlite3
 
-    db_path = DATABASE_PATH
+    db_path = CHAT_LOG_DATABASE_PATH if '--logs' in sys.argv else DATABASE_PATH
     print('Applying migration', sql_file, 'to', db_path)
 
     with open(sql_file, 'r', encoding='utf-8') as f:
@@ -0,0 +1,51 @@
+"""Apply chat log retention: archive old rows and purge expired archives.
+
+Usage:
+    python scripts/archive_chat_logs.py [--site <site_id>] [--vacuum]
+    python scripts/archive_chat_logs.py --move-hot-logs
+
+Rows older than each site's chat_retention_days (default CHAT_LOG_HOT_DAYS)
+move to gzip NDJSON partitions under CHAT_ARCHIVE_DIR; archived partitions
+older than archive_retention_days (default CHAT_ARCHIVE_RETENTION_DAYS) are
+deleted. --vacuum compacts the logs database afterwards. Run it daily (cron).
+
+--move-hot-logs is a one-off for databases created before chat logs had
+their own file: it moves chat_logs out of chatbot.db and rebuilds rollups.
+"""
+import sys
+from pathlib import Path
+
+if __name__ == '__main__':
+    site_id = None
+    if '--site' in sys.argv:
+        try:
+            site_id = int(sys.argv[sys.argv.index('--site') + 1])
+        except Exception:
+            print('Usage: python scripts/archive_chat_logs.py [--site <site_id>] [--vacuum]')
+            sys.exit(1)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from app import create_app
+    app = create_app()
+    from services.chat_archive import apply_retention, vacuum_logs_db, move_legacy_chat_logs
+    from services.analytics import backfill_rollups
+
+    with app.app_context():
+        if '--move-hot-logs' in sys.argv:
+            moved = move_legacy_chat_logs()
+            if moved:
+                print('Rebuilding rollups...')
+                backfill_rollups(verbose=True)
+            print('Done')
+            sys.exit(0)
+
+        print('Applying chat log retention')
+        report = apply_retention(site_id=site_id, verbose=True)
+        archived = sum(r['archived'] for r in report.values())
+        purged = sum(r['purged'] for r in report.values())
+        print(f'Archived {archived} rows, purged {purged} archived rows')
+
+        if '--vacuum' in sys.argv:
+            print('Vacuuming logs database...')
+            vacuum_logs_db()
+        print('Retention complete')
@@ -0,0 +1,35 @@
+"""Build chat analytics rollups from existing chat_logs.
+
+Usage:
+    python scripts/backfill_rollups.py [--site <site_id>] [--batch 50000]
+
+Deletes the existing rollups (for one site, or all sites) and re-aggregates
+chat_logs in id ranges of --batch rows. New chats keep updating the rollups
+incrementally while it runs. Safe to re-run, but note it only sees rows
+still in the live table: counts for logs already moved to the archive by
+scripts/archive_chat_logs.py are lost when their rollups are rebuilt.
+"""
+import sys
+from pathlib import Path
+
+if __name__ == '__main__':
+    site_id = None
+    batch_size = 50000
+    try:
+        if '--site' in sys.argv:
+            site_id = int(sys.argv[sys.argv.index('--site') + 1])
+        if '--batch' in sys.argv:
+            batch_size = int(sys.argv[sys.argv.index('--batch') + 1])
+    except Exception:
+        print('Usage: python scripts/backfill_rollups.py [--site <site_id>] [--batch 50000]')
+        sys.exit(1)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from app import create_app
+    app = create_app()
+    from services.analytics import backfill_rollups
+
+    with app.app_context():
+        print('Backfilling rollups for', f'site {site_id}' if site_id else 'all sites')
+        processed = backfill_rollups(site_id=site_id, batch_size=batch_size, verbose=True)
+        print(f'Backfill complete: {processed} chat logs rolled up')
@@ -0,0 +1,119 @@
+"""Compare chat messages/sec over HTTP (POST /api/chat) and the widget WebSocket (/ws/chat).
+
+Usage:
+    python scripts/bench_chat_socket.py [--site 1] [--clients 4] [--messages 200] [--url http://localhost:5000]
+
+`clients` threads each send `messages` messages one after another, first as
+HTTP requests (a keep-alive session per client, the way the widget's fetch
+calls reuse connections), then over one socket per client. Without --url
+the app is served in-process by werkzeug's threaded server, i.e. one
+worker; point --url at a single gunicorn worker (WEB_CONCURRENCY=1) for
+production numbers. Needs flask-sock on the server and initialised
+databases with the site present. Messages rotate over the intent template
+phrases, so most hit the same cached detection path either way.
+
+All messages come from one site, so per-site admission control
+(services/admission.py) would refuse most of them: the in-process server
+runs with it lifted; start an external server with ADMISSION_RATE,
+ADMISSION_BURST and ADMISSION_MAX_PER_SITE raised likewise.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+def make_messages(n):
+    root = Path(__file__).resolve().parents[1]
+    phrases = []
+    for path in sorted((root / 'intent_templates').glob('*.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            for it in json.load(f).get('intents', []):
+                phrases.extend(it.get('phrases', []))
+    phrases = phrases or ['hello']
+    return [phrases[i % len(phrases)] for i in range(n)]
+
+
+def serve_in_process():
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from app import create_app
+    # keep-alive for the HTTP run, as behind a real server
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def http_client(url, site_id, messages):
+    import requests
+    session = requests.Session()
+    session_id = None
+    for message in messages:
+        response = session.post(f'{url}/api/chat', json={'site_id': site_id, 'message': message,
+                                                         'session_id': session_id})
+        response.raise_for_status()
+        session_id = response.json().get('session_id')
+
+
+def socket_client(url, site_id, messages):
+    from simple_websocket import Client
+    ws = Client(f"{url.replace('http', 'ws', 1)}/ws/chat?site_id={site_id}")
+    try:
+        ready = json.loads(ws.receive(timeout=10))
+        if ready.get('type') != 'ready':
+            raise RuntimeError(f'socket refused: {ready}')
+        for i, message in enumerate(messages):
+            ws.send(json.dumps({'type': 'message', 'id': i, 'message': message}))
+            while True:
+                frame = json.loads(ws.receive(timeout=30))
+                if frame.get('type') == 'error':
+                    raise RuntimeError(frame.get('error'))
+                if frame.get('type') == 'reply':
+                    break
+    finally:
+        ws.close()
+
+
+def run(client, url, site_id, clients, messages):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(client, url, site_id, messages) for _ in range(clients)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return clients * len(messages) / elapsed
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    site_id = _arg('--site', 1)
+    clients = _arg('--clients', 4)
+    count = _arg('--messages', 200)
+    url = _arg('--url', '')
+
+    server = None
+    if not url:
+        for name, value in (('ADMISSION_RATE', '1000000'), ('ADMISSION_BURST', '1000000'),
+                            ('ADMISSION_MAX_PER_SITE', '1000')):
+            os.environ.setdefault(name, value)
+        server, url = serve_in_process()
+    messages = make_messages(count)
+    try:
+        # Warm up indexes and caches so neither run pays for them
+        http_client(url, site_id, messages[:5])
+        http_rate = run(http_client, url, site_id, clients, messages)
+        socket_rate = run(socket_client, url, site_id, clients, messages)
+    finally:
+        if server:
+            server.shutdown()
+    print(f'{clients} clients x {count} messages against {url}')
+    print(f'  HTTP POST /api/chat : {http_rate:8.1f} msg/s')
+    print(f'  WebSocket /ws/chat  : {socket_rate:8.1f} msg/s ({socket_rate / http_rate:.2f}x)')
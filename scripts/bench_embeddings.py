@@ -0,0 +1,89 @@
+"""Compare per-request embedding encodes with the micro-batcher.
+
+Usage:
+    python scripts/bench_embeddings.py [--concurrency 16] [--messages 512] [--wait-ms 4] [--batch 32]
+
+Simulates `concurrency` request threads each encoding unique chat messages,
+first with one MODEL.encode() call per message (the old behaviour), then
+through core.embeddings.EmbeddingBatcher, and reports how long one message
+waits for its row through the batcher (compare with SCORING_BUDGET_MS).
+Messages are unique so the LRU does not flatter the batched numbers. Uses config.EMBEDDING_BACKEND, so run
+it once per backend to compare torch / onnx / quantized.
+"""
+import sys
+import json
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+def make_messages(n):
+    root = Path(__file__).resolve().parents[1]
+    phrases = []
+    for path in sorted((root / 'intent_templates').glob('*.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            for it in json.load(f).get('intents', []):
+                phrases.extend(it.get('phrases', []))
+    phrases = phrases or ['hello']
+    return [f'{phrases[i % len(phrases)]} please {i}' for i in range(n)]
+
+
+def run(encode, messages, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(encode, messages))
+    elapsed = time.perf_counter() - start
+    return len(messages) / elapsed, elapsed
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from config import EMBEDDING_BACKEND, SCORING_BUDGET_MS, SCORING_RESERVE_MS
+    from core.embeddings import get_model, EmbeddingBatcher
+
+    concurrency = _arg('--concurrency', 16)
+    count = _arg('--messages', 512)
+    wait_ms = _arg('--wait-ms', 4.0)
+    max_batch = _arg('--batch', 32)
+
+    model = get_model()
+    if model is None:
+        print('Embedding model unavailable (is sentence-transformers installed?)')
+        sys.exit(1)
+
+    # Warm up kernels / lazy init so the first timed run is not penalised
+    model.encode(['warm up'] * 8)
+
+    messages = make_messages(count)
+    print(f'Backend: {EMBEDDING_BACKEND}  messages: {count}  concurrency: {concurrency}')
+
+    single_rate, single_time = run(lambda m: model.encode(m, convert_to_tensor=True), messages, concurrency)
+    print(f'Per-request encode: {single_rate:8.1f} msg/s  ({single_time:.2f}s)')
+
+    batcher = EmbeddingBatcher(model=model, wait_ms=wait_ms, max_batch_size=max_batch, cache_size=0)
+    latencies = []
+
+    def timed_encode(message):
+        start = time.perf_counter()
+        batcher.encode(message)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    batch_rate, batch_time = run(timed_encode, messages, concurrency)
+    stats = batcher.stats
+    avg = stats['batched_items'] / max(1, stats['batches'])
+    print(f'Micro-batched:      {batch_rate:8.1f} msg/s  ({batch_time:.2f}s)  '
+          f'batches={stats["batches"]} avg={avg:.1f} max={stats["max_batch"]}')
+    print(f'Speedup: {batch_rate / single_rate:.2f}x')
+
+    # What one message waits for its row (batch window + queueing + encode): the embedding
+    # tier only answers if SCORING_BUDGET_MS - SCORING_RESERVE_MS covers this
+    latencies.sort()
+    p50, p95, p99 = (latencies[min(len(latencies) - 1, int(len(latencies) * q))] for q in (0.5, 0.95, 0.99))
+    print(f'Encode latency: p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms  '
+          f'(SCORING_BUDGET_MS={SCORING_BUDGET_MS:g}, SCORING_RESERVE_MS={SCORING_RESERVE_MS:g})')
@@ -0,0 +1,95 @@
+"""Compare fuzzy token lookup: pairwise fuzz.ratio vs the symmetric-delete FuzzyVocabulary.
+
+Usage:
+    python scripts/bench_fuzzy_lookup.py [--sizes 1000,10000,100000] [--queries 50]
+
+For each vocabulary size, builds a synthetic vocabulary of 2-14 letter
+words (skewed towards 4-9 letters, like real phrase tokens) and a set of
+query tokens: vocabulary words with one or two typos, exact words, and
+unrelated words. Prints the build time and memory of the delete index,
+the time per query for both methods, and checks that both return the same
+neighbours with the same scores. Fresh queries are used for each method,
+so the per-message memo does not flatter the index.
+"""
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+
+def make_word(rng):
+    length = min(14, max(2, int(rng.gauss(6.5, 2.2))))
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def typo(rng, word):
+    chars = list(word)
+    for _ in range(rng.choice((1, 1, 2))):
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars[i] = rng.choice(string.ascii_lowercase)
+        elif op < 0.7 and len(chars) > 2:
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice(string.ascii_lowercase))
+    return ''.join(chars)
+
+
+def pairwise(tokens, query, threshold):
+    found = {}
+    for tid, tok in enumerate(tokens):
+        score = fuzz.ratio(tok, query) / 100.0
+        if score * 100 >= threshold:
+            found[tid] = score
+    return found
+
+
+if __name__ == '__main__':
+    sizes, n_queries = [1000, 10000, 100000], 50
+    try:
+        if '--sizes' in sys.argv:
+            sizes = [int(s) for s in sys.argv[sys.argv.index('--sizes') + 1].split(',')]
+        if '--queries' in sys.argv:
+            n_queries = int(sys.argv[sys.argv.index('--queries') + 1])
+    except Exception:
+        print('Usage: python scripts/bench_fuzzy_lookup.py [--sizes 1000,10000,100000] [--queries 50]')
+        sys.exit(1)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from thefuzz import fuzz
+    from core.fuzzy_index import FuzzyVocabulary
+    from core.tenant_index import FUZZY_TOKEN_THRESHOLD
+
+    for size in sizes:
+        rng = random.Random(size)
+        tokens = sorted({make_word(rng) for _ in range(size * 2)})[:size]
+        rng.shuffle(tokens)
+        queries = []
+        for i in range(n_queries):
+            word = rng.choice(tokens)
+            kind = i % 4
+            queries.append(word if kind == 0 else make_word(rng) if kind == 3 else typo(rng, word))
+
+        started = time.perf_counter()
+        vocabulary = FuzzyVocabulary(tokens, FUZZY_TOKEN_THRESHOLD)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexed = [vocabulary.neighbours(q) for q in queries]
+        indexed_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scanned = [pairwise(tokens, q, FUZZY_TOKEN_THRESHOLD) for q in queries]
+        scan_time = time.perf_counter() - started
+
+        mismatches = sum(a != b for a, b in zip(indexed, scanned))
+        matches = sum(len(found) for found in scanned)
+        print(f'{size:>7} tokens: build {build * 1000:8.1f} ms, {vocabulary.memory_bytes() / 1024:9.1f} KiB')
+        print(f'         per query: pairwise {scan_time / n_queries * 1000:9.3f} ms, '
+              f'symmetric-delete {indexed_time / n_queries * 1000:7.3f} ms '
+              f'({scan_time / max(indexed_time, 1e-9):.0f}x)')
+        print(f'         {n_queries} queries, {matches} neighbours, mismatches: {mismatches}')
+        if mismatches:
+            sys.exit(1)
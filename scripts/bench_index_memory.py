@@ -0,0 +1,99 @@
+"""Measure memory per phrase: ORM objects + token lists vs the compiled TenantIndex.
+
+Usage:
+    python scripts/bench_index_memory.py [--intents 200] [--phrases 25] [--vocab 5000]
+
+Builds a synthetic tenant (intents x phrases, 3-8 words per phrase drawn
+from a vocabulary of --vocab words) and uses tracemalloc to measure:
+
+- before: what detect_intent used to hold per request, i.e. Intent and
+  IntentPhrase ORM objects plus each phrase's token and weight lists
+- after:  the compiled TenantIndex for the same data (no embeddings)
+
+Phrase strings are created up front and shared by both, so neither side
+is charged for them. Also prints TenantIndex.memory_usage() for comparison
+with tracemalloc's numbers.
+"""
+import random
+import string
+import sys
+import tracemalloc
+from pathlib import Path
+
+
+def measure(build):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return result, size
+
+
+if __name__ == '__main__':
+    n_intents, n_phrases, vocab_size = 200, 25, 5000
+    try:
+        if '--intents' in sys.argv:
+            n_intents = int(sys.argv[sys.argv.index('--intents') + 1])
+        if '--phrases' in sys.argv:
+            n_phrases = int(sys.argv[sys.argv.index('--phrases') + 1])
+        if '--vocab' in sys.argv:
+            vocab_size = int(sys.argv[sys.argv.index('--vocab') + 1])
+    except Exception:
+        print('Usage: python scripts/bench_index_memory.py [--intents 200] [--phrases 25] [--vocab 5000]')
+        sys.exit(1)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from models.intent import Intent, IntentPhrase
+    from core.tokenizer import tokenize
+    from core.tenant_index import compile_index, weight_class, WEIGHT_VALUES
+
+    rng = random.Random(42)
+    vocab = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))) for _ in range(vocab_size)]
+    specs = []
+    for i in range(n_intents):
+        phrases = [' '.join(rng.choice(vocab) for _ in range(rng.randint(3, 8))) for _ in range(n_phrases)]
+        specs.append((i + 1, f'INTENT_{i}', phrases))
+    total_phrases = n_intents * n_phrases
+
+    def build_orm():
+        intents = []
+        for intent_id, name, phrases in specs:
+            intent = Intent(id=intent_id, site_id=1, intent_name=name, intent_type='info',
+                            response='Thanks for asking.', confidence=0.8, confidence_threshold=0.7)
+            rows = []
+            for phrase in phrases:
+                p_tokens = tokenize(phrase)
+                rows.append((IntentPhrase(intent_id=intent_id, phrase=phrase), p_tokens,
+                             [WEIGHT_VALUES[weight_class(t)] for t in p_tokens]))
+            intents.append((intent, rows))
+        return intents
+
+    class Row:
+        def __init__(self, intent_id):
+            self.id = intent_id
+            self.site_id = 1
+            self.intent_name = f'INTENT_{intent_id - 1}'
+            self.intent_type = 'info'
+            self.response = 'Thanks for asking.'
+            self.confidence = 0.8
+            self.confidence_threshold = 0.7
+
+    rows = [Row(intent_id) for intent_id, _, _ in specs]
+    phrases_by_intent = {
+        intent_id: [(intent_id * n_phrases + j, phrase) for j, phrase in enumerate(phrases)]
+        for intent_id, _, phrases in specs
+    }
+
+    orm, orm_bytes = measure(build_orm)
+    index, index_bytes = measure(lambda: compile_index(1, 0, rows, phrases_by_intent, with_embeddings=False))
+
+    print(f'{n_intents} intents x {n_phrases} phrases = {total_phrases} phrases, {len(index.tokens)} distinct tokens')
+    print(f'  ORM objects + token lists: {orm_bytes / 1024:10.1f} KiB  {orm_bytes / total_phrases:8.1f} B/phrase')
+    print(f'  compiled TenantIndex:      {index_bytes / 1024:10.1f} KiB  {index_bytes / total_phrases:8.1f} B/phrase')
+    print(f'  reduction: {orm_bytes / max(index_bytes, 1):.1f}x')
+    usage = index.memory_usage()
+    print(f'  memory_usage(): heap {usage["heap_bytes"] / 1024:.1f} KiB, {usage["bytes_per_phrase"]} B/phrase '
+          f'(tokens {usage["token_table_bytes"]}, intents {usage["intent_bytes"]}, arrays {usage["array_bytes"]})')
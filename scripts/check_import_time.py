@@ -0,0 +1,93 @@
+"""Check that building the app stays cheap and side-effect free.
+
+Usage:
+    python scripts/check_import_time.py [--runs 5] [--budget <ms>] [--top 10]
+
+Runs `from app import create_app; create_app()` in fresh interpreters with
+-X importtime, reports the median wall time and the slowest top-level
+imports, and exits non-zero when the median exceeds the budget
+(default STARTUP_IMPORT_BUDGET_MS) or when app creation created a database
+file. Run it in CI so a heavy import at module level (torch, numpy, ...)
+or a DB call at startup is caught before it reaches the workers.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+CHILD = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+t = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = (time.perf_counter() - t) * 1000
+from config import DATABASE_PATH, CHAT_LOG_DATABASE_PATH
+print(json.dumps({{'ms': elapsed, 'dbs': [p for p in (DATABASE_PATH, CHAT_LOG_DATABASE_PATH) if os.path.exists(p)]}}))
+"""
+
+
+def run_once(db_before):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(root=str(ROOT))],
+        capture_output=True, text=True, cwd=str(ROOT)
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        sys.exit(proc.returncode)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    created = [p for p in result['dbs'] if p not in db_before]
+
+    imports = []
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith(' ' * 2):  # top-level imports only
+            imports.append((int(cumulative), name.strip()))
+    return result['ms'], created, imports
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(ROOT))
+    from config import STARTUP_IMPORT_BUDGET_MS, DATABASE_PATH, CHAT_LOG_DATABASE_PATH
+
+    runs, budget, top = 5, STARTUP_IMPORT_BUDGET_MS, 10
+    try:
+        if '--runs' in sys.argv:
+            runs = int(sys.argv[sys.argv.index('--runs') + 1])
+        if '--budget' in sys.argv:
+            budget = int(sys.argv[sys.argv.index('--budget') + 1])
+        if '--top' in sys.argv:
+            top = int(sys.argv[sys.argv.index('--top') + 1])
+    except Exception:
+        print('Usage: python scripts/check_import_time.py [--runs 5] [--budget <ms>] [--top 10]')
+        sys.exit(1)
+
+    db_before = [p for p in (DATABASE_PATH, CHAT_LOG_DATABASE_PATH) if os.path.exists(p)]
+    timings, created, imports = [], [], []
+    for _ in range(runs):
+        ms, created, imports = run_once(db_before)
+        timings.append(ms)
+
+    median = statistics.median(timings)
+    print(f'create_app(): median {median:.0f} ms over {runs} runs (min {min(timings):.0f}, max {max(timings):.0f}), budget {budget} ms')
+    print('Slowest top-level imports (last run):')
+    for cumulative, name in sorted(imports, reverse=True)[:top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+    failed = False
+    if created:
+        print(f'FAIL: app creation created database files: {created}')
+        failed = True
+    if median > budget:
+        print(f'FAIL: median {median:.0f} ms exceeds budget {budget} ms')
+        failed = True
+    if not failed:
+        print('OK')
+    sys.exit(1 if failed else 0)
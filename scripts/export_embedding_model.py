@@ -0,0 +1,45 @@
+"""Export the embedding model for CPU-only hosts.
+
+Usage:
+    python scripts/export_embedding_model.py [--out <dir>] [--quantize avx512_vnni|avx512|avx2|arm64]
+
+Writes an ONNX copy of config.EMBEDDING_MODEL_NAME to --out (default
+config.EMBEDDING_MODEL_PATH). With --quantize an int8 dynamically quantized
+variant is written next to it. Point the app at the export with:
+    EMBEDDING_BACKEND=onnx
+    EMBEDDING_ONNX_FILE=onnx/model_qint8_<target>.onnx   (only when --quantize was used)
+
+Requires sentence-transformers>=3.2 with the onnx extra:
+    pip install "sentence-transformers[onnx]"
+"""
+import sys
+from pathlib import Path
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from config import EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_PATH
+
+    out_dir = EMBEDDING_MODEL_PATH
+    if '--out' in sys.argv:
+        out_dir = sys.argv[sys.argv.index('--out') + 1]
+    quantize = None
+    if '--quantize' in sys.argv:
+        quantize = sys.argv[sys.argv.index('--quantize') + 1]
+
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print('sentence-transformers is not installed')
+        sys.exit(1)
+
+    print(f'Exporting {EMBEDDING_MODEL_NAME} to ONNX at {out_dir}')
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, backend='onnx')
+    model.save_pretrained(out_dir)
+
+    if quantize:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f'Writing int8 quantized variant for {quantize}')
+        export_dynamic_quantized_onnx_model(model, quantize, out_dir)
+        print(f'Set EMBEDDING_ONNX_FILE=onnx/model_qint8_{quantize}.onnx to use it')
+
+    print('Export complete')
@@ -37,9 +37,12 @@ if __name__ == '__main__':
 
     # import project path and database
     sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-    from app import app
+    from app import create_app
+    app = create_app()
     from database import db
     from models import Intent, IntentPhrase, Workflow, ClientConfig
+    from services.tenant_version import bump as bump_tenant_version
+    from core.tenant_index import write_site_snapshot
 
     with open(json_path, 'r', encoding='utf-8') as f:
         payload = json.load(f)
@@ -109,8 +112,11 @@ if __name__ == '__main__':
                     print(f'  + client_config key: {key} (empty)')
 
         try:
+            bump_tenant_version(client_id, intents=True, config=True)
             db.session.commit()
             print('Import complete')
+            index = write_site_snapshot(client_id)
+            print(f'Index snapshot written: {index.phrase_count} phrases, version {index.version}')
         except Exception as e:
             print('Import failed:', e)
             db.session.rollback()
@@ -0,0 +1,13 @@
+-- Migration: per-site chat log retention settings
+-- Run with sqlite3 or the provided apply_migration.py script.
+-- Existing chat_logs rows can then be moved to the separate logs database with:
+--   python scripts/archive_chat_logs.py --move-hot-logs
+
+PRAGMA foreign_keys=OFF;
+BEGIN TRANSACTION;
+
+ALTER TABLE sites ADD COLUMN chat_retention_days INTEGER;
+ALTER TABLE sites ADD COLUMN archive_retention_days INTEGER;
+
+COMMIT;
+PRAGMA foreign_keys=ON;
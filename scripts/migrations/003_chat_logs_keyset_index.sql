@@ -0,0 +1,5 @@
+-- Migration: index for keyset pagination of chat log exports
+-- Targets the logs database: python scripts/apply_migration.py <this file> --logs
+
+CREATE INDEX IF NOT EXISTS ix_chat_logs_site_id_id ON chat_logs (site_id, id);
+CREATE INDEX IF NOT EXISTS ix_chat_logs_site_created ON chat_logs (site_id, created_at);
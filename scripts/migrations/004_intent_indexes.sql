@@ -0,0 +1,5 @@
+-- Migration: indexes for per-site intent listing and batched phrase loading
+-- Run with sqlite3 or the provided apply_migration.py script
+
+CREATE INDEX IF NOT EXISTS ix_intents_site_id ON intents (site_id);
+CREATE INDEX IF NOT EXISTS ix_intent_phrases_intent_id ON intent_phrases (intent_id);
@@ -0,0 +1,5 @@
+-- Migration: per-site branding (NULL site_id = platform default)
+-- Run with sqlite3 or the provided apply_migration.py script
+
+ALTER TABLE branding_settings ADD COLUMN site_id INTEGER;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_branding_settings_site_id ON branding_settings (site_id);
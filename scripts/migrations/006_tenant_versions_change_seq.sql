@@ -0,0 +1,6 @@
+-- Migration: table-wide change sequence for cross-worker cache invalidation
+-- Run with sqlite3 or the provided apply_migration.py script
+
+ALTER TABLE tenant_versions ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0;
+UPDATE tenant_versions SET change_seq = site_id;
+CREATE INDEX IF NOT EXISTS ix_tenant_versions_change_seq ON tenant_versions (change_seq);
@@ -0,0 +1,28 @@
+-- Migration: per-site FAQs and an FTS5 full-text index for the FAQ fallback
+-- Run with sqlite3 or the provided apply_migration.py script
+
+ALTER TABLE faqs ADD COLUMN site_id INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE faqs ADD COLUMN sector VARCHAR(50);
+CREATE INDEX IF NOT EXISTS ix_faqs_site_id ON faqs (site_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS faqs_fts USING fts5(question, answer, scope, content='', tokenize='porter unicode61');
+
+CREATE TRIGGER IF NOT EXISTS faqs_fts_ai AFTER INSERT ON faqs BEGIN
+    INSERT INTO faqs_fts (rowid, question, answer, scope)
+    VALUES (new.id, new.question, new.answer, 'site' || new.site_id);
+END;
+CREATE TRIGGER IF NOT EXISTS faqs_fts_ad AFTER DELETE ON faqs BEGIN
+    INSERT INTO faqs_fts (faqs_fts, rowid, question, answer, scope)
+    VALUES ('delete', old.id, old.question, old.answer, 'site' || old.site_id);
+END;
+CREATE TRIGGER IF NOT EXISTS faqs_fts_au AFTER UPDATE OF question, answer, site_id ON faqs BEGIN
+    INSERT INTO faqs_fts (faqs_fts, rowid, question, answer, scope)
+    VALUES ('delete', old.id, old.question, old.answer, 'site' || old.site_id);
+    INSERT INTO faqs_fts (rowid, question, answer, scope)
+    VALUES (new.id, new.question, new.answer, 'site' || new.site_id);
+END;
+
+-- Index the FAQs that already exist
+INSERT INTO faqs_fts (faqs_fts) VALUES ('delete-all');
+INSERT INTO faqs_fts (rowid, question, answer, scope)
+SELECT id, question, answer, 'site' || site_id FROM faqs;
@@ -0,0 +1,22 @@
+-- Migration: clusters of near-duplicate unanswered questions (flask cluster-questions)
+-- Run with sqlite3 or the provided apply_migration.py script
+
+ALTER TABLE unanswered_questions ADD COLUMN cluster_id INTEGER;
+CREATE INDEX IF NOT EXISTS ix_unanswered_questions_cluster_id ON unanswered_questions (cluster_id);
+
+CREATE TABLE IF NOT EXISTS question_clusters (
+    id INTEGER NOT NULL PRIMARY KEY,
+    representative TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    times_asked INTEGER NOT NULL,
+    signature BLOB NOT NULL,
+    created_at DATETIME,
+    updated_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS ix_question_clusters_times_asked ON question_clusters (times_asked);
+
+CREATE TABLE IF NOT EXISTS question_cluster_bands (
+    band_key BIGINT NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    PRIMARY KEY (band_key, cluster_id)
+);
@@ -0,0 +1,36 @@
+-- Migration: FAQ questions unique per site instead of across all sites
+-- Run with sqlite3 or the provided apply_migration.py script
+-- SQLite cannot drop a column constraint, so the table is rebuilt (ids are kept, so faqs_fts stays valid)
+
+CREATE TABLE faqs_new (
+    id INTEGER NOT NULL PRIMARY KEY,
+    site_id INTEGER NOT NULL DEFAULT 0,
+    sector VARCHAR(50),
+    question VARCHAR(500) NOT NULL,
+    answer TEXT NOT NULL,
+    category VARCHAR(100),
+    created_at DATETIME,
+    updated_at DATETIME,
+    CONSTRAINT uq_faqs_site_question UNIQUE (site_id, question)
+);
+INSERT INTO faqs_new (id, site_id, sector, question, answer, category, created_at, updated_at)
+SELECT id, site_id, sector, question, answer, category, created_at, updated_at FROM faqs;
+DROP TABLE faqs;
+ALTER TABLE faqs_new RENAME TO faqs;
+CREATE INDEX IF NOT EXISTS ix_faqs_site_id ON faqs (site_id);
+
+-- The triggers were dropped with the old table
+CREATE TRIGGER IF NOT EXISTS faqs_fts_ai AFTER INSERT ON faqs BEGIN
+    INSERT INTO faqs_fts (rowid, question, answer, scope)
+    VALUES (new.id, new.question, new.answer, 'site' || new.site_id);
+END;
+CREATE TRIGGER IF NOT EXISTS faqs_fts_ad AFTER DELETE ON faqs BEGIN
+    INSERT INTO faqs_fts (faqs_fts, rowid, question, answer, scope)
+    VALUES ('delete', old.id, old.question, old.answer, 'site' || old.site_id);
+END;
+CREATE TRIGGER IF NOT EXISTS faqs_fts_au AFTER UPDATE OF question, answer, site_id ON faqs BEGIN
+    INSERT INTO faqs_fts (faqs_fts, rowid, question, answer, scope)
+    VALUES ('delete', old.id, old.question, old.answer, 'site' || old.site_id);
+    INSERT INTO faqs_fts (rowid, question, answer, scope)
+    VALUES (new.id, new.question, new.answer, 'site' || new.site_id);
+END;
@@ -0,0 +1,20 @@
+-- Migration: chat log ids are never reused (archiving tracks rows by id)
+-- Targets the logs database: python scripts/apply_migration.py <this file> --logs
+-- SQLite cannot add AUTOINCREMENT to a table, so it is rebuilt with its ids kept
+
+CREATE TABLE chat_logs_new (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    site_id INTEGER NOT NULL,
+    user_message TEXT NOT NULL,
+    detected_intent VARCHAR(255),
+    confidence FLOAT NOT NULL,
+    bot_response TEXT NOT NULL,
+    session_id VARCHAR(100) NOT NULL,
+    created_at DATETIME
+);
+INSERT INTO chat_logs_new (id, site_id, user_message, detected_intent, confidence, bot_response, session_id, created_at)
+SELECT id, site_id, user_message, detected_intent, confidence, bot_response, session_id, created_at FROM chat_logs;
+DROP TABLE chat_logs;
+ALTER TABLE chat_logs_new RENAME TO chat_logs;
+CREATE INDEX IF NOT EXISTS ix_chat_logs_site_created ON chat_logs (site_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_chat_logs_site_id_id ON chat_logs (site_id, id);
@@ -0,0 +1,71 @@
+"""
+Local stand-in for a client's order status API, for exercising track_order.
+
+Usage:
+    python scripts/stub_order_service.py [--port 5055] [--delay 0.0]
+
+Then point a site at it:
+    ORDER_API_URL=http://127.0.0.1:5055 python app.py
+or store ClientConfig key 'order_api_url' for the site (a site's URL must be public
+https, so also set ORDER_API_ALLOWED_HOSTS=127.0.0.1).
+
+GET /orders/<order_id> returns {"order_id", "status", "eta"} after --delay
+seconds; ids starting with "MISSING" return 404. Use a delay larger than
+the workflow timeout to check that slow upstream calls time out and stay
+within track_order's concurrency limit.
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATUSES = ['processing', 'packed', 'shipped', 'out_for_delivery', 'delivered']
+
+
+def make_handler(delay):
+    class OrderHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so pooled connections are reused
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) != 2 or parts[0] != 'orders':
+                return self._send(404, {'error': 'not found'})
+            if delay:
+                time.sleep(delay)
+            order_id = parts[1]
+            if order_id.upper().startswith('MISSING'):
+                return self._send(404, {'error': 'unknown order'})
+            status = STATUSES[sum(map(ord, order_id)) % len(STATUSES)]
+            self._send(200, {'order_id': order_id, 'status': status, 'eta': '2 days'})
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            print(f'[stub] {self.address_string()} {fmt % args}')
+
+    return OrderHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub order status API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.delay))
+    print(f'Stub order API on http://{args.host}:{args.port} (delay {args.delay}s)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Admission control for the chat endpoints: per-site rate limits, concurrency
+caps and worker-wide load shedding.
+
+Every chat message (POST /api/chat, /api/chat/stream, /api/chat/edge-hits and
+WebSocket messages) asks for a Ticket before any other work. A slot is
+reserved first and the site's token taken second, so messages refused as
+busy or shed do not spend the site's rate budget:
+
+- Rate: a token bucket per site, ADMISSION_RATE tokens/sec up to
+  ADMISSION_BURST. An empty bucket means 429 with Retry-After, so a crawler
+  on one site's widget only ever spends that site's budget.
+- Concurrency: at most ADMISSION_MAX_PER_SITE of one site's messages are
+  processed at once per worker (by default every slot; lower it so a single
+  site on a shared host never holds every thread).
+- Load level: the worker's share of ADMISSION_MAX_INFLIGHT in use when the
+  message arrives decides how much of the pipeline it gets, cheapest
+  sacrifice first:
+
+      NORMAL          everything
+      SKIP_EMBEDDINGS (>= ADMISSION_SKIP_EMBEDDINGS_AT) token scoring only
+      DEFER_LOGGING   (>= ADMISSION_DEFER_LOGGING_AT) ChatLog rows are queued and
+                      written in bulk once the pressure is gone (services/chat_service.py)
+      SHED            (all slots busy) 429
+
+  ADMISSION_MIN_LEVEL keeps a worker at a degraded level regardless.
+
+Concurrency and levels are per worker process: they measure what this
+process is doing, i.e. messages in flight, whether they came over HTTP or
+a WebSocket. An idle open socket still holds a gthread thread but costs
+nothing, so it does not degrade anyone's answers; the threads sockets may
+take are capped by CHAT_SOCKET_MAX_CONNECTIONS instead. Open sockets
+(open_socket/close_socket) are only reported in stats(). Token buckets are
+per worker too unless
+ADMISSION_BACKEND_URL points at redis, which then holds one bucket per site
+for every worker and node (one script call per message; on errors the local
+bucket answers). LocalBuckets is the in-process stand-in.
+"""
+import math
+import threading
+import time
+from config import (
+    ADMISSION_RATE, ADMISSION_BURST, ADMISSION_BACKEND_URL, ADMISSION_MAX_INFLIGHT, ADMISSION_MAX_PER_SITE,
+    ADMISSION_SKIP_EMBEDDINGS_AT, ADMISSION_DEFER_LOGGING_AT, ADMISSION_MIN_LEVEL
+)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+NORMAL, SKIP_EMBEDDINGS, DEFER_LOGGING, SHED = range(4)
+LEVEL_NAMES = ('normal', 'skip_embeddings', 'defer_logging', 'shed')
+
+# Buckets idle this long are full again and can be forgotten
+_BUCKET_IDLE_SECONDS = ADMISSION_BURST / ADMISSION_RATE if ADMISSION_RATE > 0 else 3600
+_MAX_TRACKED_SITES = 10000
+
+
+class LocalBuckets:
+    """Token buckets per site, in this process only."""
+
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # site_id -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def take(self, site_id: int) -> float:
+        """Take a token: 0.0 if granted, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(site_id)
+            if bucket is None:
+                if len(self._buckets) >= _MAX_TRACKED_SITES:
+                    self._forget_idle(now)
+                bucket = self._buckets[site_id] = [float(self.burst), now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 0.0
+            bucket[0] = tokens
+            return (1.0 - tokens) / self.rate if self.rate > 0 else 60.0
+
+    def _forget_idle(self, now):
+        for site_id in [s for s, b in self._buckets.items() if now - b[1] >= _BUCKET_IDLE_SECONDS]:
+            del self._buckets[site_id]
+
+
+class RedisBuckets(LocalBuckets):
+    """One bucket per site in redis, shared by every worker and node."""
+
+    # Refill and take atomically, on redis' clock
+    SCRIPT = """
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = math.min(burst, (tonumber(state[1]) or burst) + (now - (tonumber(state[2]) or now)) * rate)
+        local granted = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            granted = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return {granted, tostring(tokens)}
+    """
+
+    def __init__(self, url, rate=ADMISSION_RATE, burst=ADMISSION_BURST, prefix='chatbot:admission:'):
+        super().__init__(rate, burst)
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def take(self, site_id: int) -> float:
+        try:
+            granted, tokens = self._script(keys=[f'{self.prefix}{site_id}'], args=[self.rate, self.burst])
+        except Exception as e:
+            print(f"Admission backend unavailable (using the local bucket): {e}")
+            return super().take(site_id)
+        if int(granted):
+            return 0.0
+        return (1.0 - float(tokens)) / self.rate if self.rate > 0 else 60.0
+
+
+class Ticket:
+    __slots__ = ('site_id', 'level', 'admitted', 'reason', 'retry_after', 'released')
+
+    def __init__(self, site_id, level, admitted=True, reason=None, retry_after=0.0):
+        self.site_id = site_id
+        self.level = level
+        self.admitted = admitted
+        self.reason = reason
+        self.retry_after = retry_after
+        self.released = not admitted
+
+    @property
+    def use_embeddings(self) -> bool:
+        return self.level < SKIP_EMBEDDINGS
+
+    @property
+    def defer_logging(self) -> bool:
+        return self.level >= DEFER_LOGGING
+
+
+class AdmissionController:
+    def __init__(self, buckets=None, max_inflight=ADMISSION_MAX_INFLIGHT, max_per_site=ADMISSION_MAX_PER_SITE,
+                 skip_embeddings_at=ADMISSION_SKIP_EMBEDDINGS_AT, defer_logging_at=ADMISSION_DEFER_LOGGING_AT,
+                 min_level=ADMISSION_MIN_LEVEL):
+        self.buckets = buckets or LocalBuckets()
+        self.max_inflight = max(1, max_inflight)
+        self.max_per_site = max(1, max_per_site)
+        self.skip_embeddings_at = skip_embeddings_at
+        self.defer_logging_at = defer_logging_at
+        self.min_level = min_level
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._sockets = 0  # open sockets, for stats only
+        self._per_site = {}
+        self.counters = {'admitted': 0, 'rate_limited': 0, 'site_busy': 0, 'shed': 0}
+        self.degraded = dict.fromkeys(LEVEL_NAMES[1:3], 0)
+
+    def _level(self, inflight: int) -> int:
+        pressure = inflight / self.max_inflight
+        if pressure >= 1.0:
+            level = SHED
+        elif pressure >= self.defer_logging_at:
+            level = DEFER_LOGGING
+        elif pressure >= self.skip_embeddings_at:
+            level = SKIP_EMBEDDINGS
+        else:
+            level = NORMAL
+        return max(level, self.min_level)
+
+    def level(self) -> int:
+        """The level a message arriving now would get."""
+        return self._level(self._inflight)
+
+    def open_socket(self):
+        with self._lock:
+            self._sockets += 1
+
+    def close_socket(self):
+        with self._lock:
+            self._sockets = max(0, self._sockets - 1)
+
+    def admit(self, site_id: int) -> Ticket:
+        """A Ticket for one message of the site; release() it when done (a refused one needs no release)."""
+        with self._lock:
+            level = self._level(self._inflight)
+            if level >= SHED:
+                reason = 'shed'
+            elif self._per_site.get(site_id, 0) >= self.max_per_site:
+                reason = 'site_busy'
+            else:
+                reason = None
+                self._inflight += 1
+                self._per_site[site_id] = self._per_site.get(site_id, 0) + 1
+        if reason is not None:
+            # Busy: try again about when a typical message finishes
+            return self._refuse(site_id, reason, 1.0)
+
+        # The token is taken outside the lock (it may be a redis call), with the slot held
+        ticket = Ticket(site_id, level)
+        wait = self.buckets.take(site_id)
+        if wait > 0:
+            self.release(ticket)
+            return self._refuse(site_id, 'rate_limited', wait)
+        with self._lock:
+            self.counters['admitted'] += 1
+            if level > NORMAL:
+                self.degraded[LEVEL_NAMES[level]] += 1
+        return ticket
+
+    def _refuse(self, site_id, reason, retry_after) -> Ticket:
+        with self._lock:
+            self.counters[reason] += 1
+        return Ticket(site_id, SHED, admitted=False, reason=reason, retry_after=retry_after)
+
+    def release(self, ticket: Ticket):
+        """Give the ticket's slot back; safe to call more than once."""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._inflight -= 1
+            remaining = self._per_site.get(ticket.site_id, 1) - 1
+            if remaining > 0:
+                self._per_site[ticket.site_id] = remaining
+            else:
+                self._per_site.pop(ticket.site_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'level': LEVEL_NAMES[self._level(self._inflight)],
+                'inflight': self._inflight,
+                'open_sockets': self._sockets,
+                'max_inflight': self.max_inflight,
+                'max_per_site': self.max_per_site,
+                'busiest_sites': sorted(self._per_site.items(), key=lambda item: -item[1])[:10],
+                'rate': self.buckets.rate,
+                'burst': self.buckets.burst,
+                'shared_buckets': isinstance(self.buckets, RedisBuckets),
+                'counters': dict(self.counters),
+                'degraded': dict(self.degraded)
+            }
+
+
+def retry_after_header(ticket: Ticket) -> str:
+    return str(max(1, math.ceil(ticket.retry_after)))
+
+
+def _make_buckets():
+    if ADMISSION_BACKEND_URL:
+        if redis is None:
+            print("ADMISSION_BACKEND_URL is set but redis is not installed; rate limits are per worker")
+        else:
+            return RedisBuckets(ADMISSION_BACKEND_URL)
+    return LocalBuckets()
+
+
+admission = AdmissionController(_make_buckets())
@@ -0,0 +1,207 @@
+"""
+Incremental chat analytics.
+
+Every logged chat message bumps six ChatRollup counters (hour / day / total
+buckets, for its intent and for the site-wide '*' row) with a single SQLite
+upsert in the same transaction as the ChatLog insert. Dashboard reads only
+touch rollup rows, so their cost depends on the requested range and the
+number of intents, never on the size of chat_logs.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import db
+from models import ChatLog, ChatRollup
+
+ALL_INTENTS = '*'
+PERIODS = ('hour', 'day', 'total')
+EPOCH = datetime(1970, 1, 1)
+COUNTER_COLUMNS = ['total', 'answered', 'confidence_sum'] + [f'conf_bin_{i}' for i in range(10)]
+
+
+def confidence_bin(confidence) -> int:
+    return min(9, max(0, int((confidence or 0.0) * 10)))
+
+
+def bucket_start(period: str, ts: datetime) -> datetime:
+    if period == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return EPOCH
+
+
+def _upsert(rows):
+    """Add counter deltas to rollup rows, creating them as needed (not committed)."""
+    if not rows:
+        return
+    stmt = sqlite_insert(ChatRollup.__table__).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['site_id', 'period', 'bucket_start', 'intent_name'],
+        set_={col: getattr(ChatRollup.__table__.c, col) + stmt.excluded[col] for col in COUNTER_COLUMNS}
+    )
+    db.session.execute(stmt)
+
+
+def _delta_rows(site_id, intent_name, ts, counters):
+    rows = []
+    for period in PERIODS:
+        start = bucket_start(period, ts)
+        for name in (intent_name or 'UNKNOWN', ALL_INTENTS):
+            row = {'site_id': site_id, 'period': period, 'bucket_start': start, 'intent_name': name}
+            row.update(counters)
+            rows.append(row)
+    return rows
+
+
+def record_chat(site_id: int, intent_name: str, confidence: float, created_at: datetime = None):
+    """Count one chat message in the rollups. Call before committing the ChatLog row."""
+    counters = dict.fromkeys(COUNTER_COLUMNS, 0)
+    counters['total'] = 1
+    counters['answered'] = 0 if intent_name in (None, 'UNKNOWN') else 1
+    counters['confidence_sum'] = confidence or 0.0
+    counters[f'conf_bin_{confidence_bin(confidence)}'] = 1
+    _upsert(_delta_rows(site_id, intent_name, created_at or datetime.utcnow(), counters))
+
+
+def record_chats(site_id: int, chats):
+    """record_chat for many messages at once: chats is [(intent_name, confidence, created_at)].
+
+    Deltas are summed per rollup row first, so the batch costs one upsert.
+    """
+    merged = {}
+    for intent_name, confidence, created_at in chats:
+        counters = dict.fromkeys(COUNTER_COLUMNS, 0)
+        counters['total'] = 1
+        counters['answered'] = 0 if intent_name in (None, 'UNKNOWN') else 1
+        counters['confidence_sum'] = confidence or 0.0
+        counters[f'conf_bin_{confidence_bin(confidence)}'] = 1
+        for row in _delta_rows(site_id, intent_name, created_at, counters):
+            key = (row['period'], row['bucket_start'], row['intent_name'])
+            if key in merged:
+                for col in COUNTER_COLUMNS:
+                    merged[key][col] += row[col]
+            else:
+                merged[key] = row
+    _upsert(list(merged.values()))
+
+
+def backfill_rollups(site_id: int = None, batch_size: int = 50000, verbose: bool = False) -> int:
+    """Rebuild rollups from existing chat_logs, one id range at a time.
+
+    Existing rollups (for site_id, or all sites) are deleted first. Rows
+    logged while the backfill runs have ids above the captured maximum and
+    are counted by record_chat as usual. Returns the number of logs processed.
+    """
+    rollups = ChatRollup.query
+    logs = db.session.query(func.max(ChatLog.id))
+    if site_id is not None:
+        rollups = rollups.filter(ChatRollup.site_id == site_id)
+        logs = logs.filter(ChatLog.site_id == site_id)
+    rollups.delete(synchronize_session=False)
+    max_id = logs.scalar() or 0
+    db.session.commit()
+
+    hour_expr = func.strftime('%Y-%m-%d %H:00:00', ChatLog.created_at)
+    answered_expr = case((ChatLog.detected_intent == 'UNKNOWN', 0), (ChatLog.detected_intent.is_(None), 0), else_=1)
+    bin_expr = func.min(9, func.max(0, func.cast(ChatLog.confidence * 10, db.Integer)))
+    columns = [
+        ChatLog.site_id, hour_expr, ChatLog.detected_intent,
+        func.count(ChatLog.id), func.sum(answered_expr), func.sum(ChatLog.confidence)
+    ] + [func.sum(case((bin_expr == i, 1), else_=0)) for i in range(10)]
+
+    processed = 0
+    lo = 0
+    while lo < max_id:
+        hi = min(lo + batch_size, max_id)
+        q = db.session.query(*columns).filter(ChatLog.id > lo, ChatLog.id <= hi)
+        if site_id is not None:
+            q = q.filter(ChatLog.site_id == site_id)
+        for row in q.group_by(ChatLog.site_id, hour_expr, ChatLog.detected_intent).all():
+            sid, hour, intent_name, total, answered, conf_sum = row[:6]
+            counters = {'total': total, 'answered': answered or 0, 'confidence_sum': conf_sum or 0.0}
+            counters.update({f'conf_bin_{i}': row[6 + i] or 0 for i in range(10)})
+            _upsert(_delta_rows(sid, intent_name, datetime.strptime(hour, '%Y-%m-%d %H:%M:%S'), counters))
+            processed += total
+        db.session.commit()
+        if verbose:
+            print(f'  rolled up ids {lo + 1}..{hi}')
+        lo = hi
+    return processed
+
+
+# --- Read side (rollups only) ---
+
+def _rows(site_id, period, start=None, intent_name=ALL_INTENTS):
+    q = ChatRollup.query.filter_by(site_id=site_id, period=period)
+    if intent_name is not None:
+        q = q.filter_by(intent_name=intent_name)
+    if start is not None:
+        q = q.filter(ChatRollup.bucket_start >= bucket_start(period, start))
+    return q
+
+
+def _totals(rows):
+    total = sum(r.total for r in rows)
+    answered = sum(r.answered for r in rows)
+    conf_sum = sum(r.confidence_sum for r in rows)
+    bins = [sum(b) for b in zip(*[r.confidence_bins for r in rows])] if rows else [0] * 10
+    return {
+        'total_chats': total,
+        'answered': answered,
+        'unanswered': total - answered,
+        'answer_rate': round(100.0 * answered / total, 1) if total else 0.0,
+        'avg_confidence': round(conf_sum / total, 3) if total else 0.0,
+        'confidence_bins': bins
+    }
+
+
+def lifetime_totals(site_id: int) -> dict:
+    return _totals(_rows(site_id, 'total').all())
+
+
+def site_summary(site_id: int, days: int = 7, top: int = 10) -> dict:
+    """Totals, confidence distribution and top intents for the last `days` days."""
+    start = datetime.utcnow() - timedelta(days=days)
+    summary = _totals(_rows(site_id, 'day', start).all())
+
+    per_intent = {}
+    for r in _rows(site_id, 'day', start, intent_name=None).filter(ChatRollup.intent_name != ALL_INTENTS):
+        agg = per_intent.setdefault(r.intent_name, {'intent_name': r.intent_name, 'total': 0, 'answered': 0})
+        agg['total'] += r.total
+        agg['answered'] += r.answered
+    summary['top_intents'] = sorted(per_intent.values(), key=lambda a: a['total'], reverse=True)[:top]
+    summary['days'] = days
+    return summary
+
+
+def intent_volumes(site_id: int, days: int = 7) -> dict:
+    """{intent_name: chats} for the site over the last `days` days."""
+    start = datetime.utcnow() - timedelta(days=days)
+    total = func.sum(ChatRollup.total)
+    q = db.session.query(ChatRollup.intent_name, total) \
+        .filter(ChatRollup.site_id == site_id, ChatRollup.period == 'day', ChatRollup.intent_name != ALL_INTENTS,
+                ChatRollup.bucket_start >= bucket_start('day', start)) \
+        .group_by(ChatRollup.intent_name)
+    return {name: int(chats) for name, chats in q.all()}
+
+
+def site_volumes(days: int = 1, limit: int = None) -> list:
+    """[(site_id, chats)] over the last `days` days, busiest first (e.g. for cache prewarming)."""
+    start = datetime.utcnow() - timedelta(days=days)
+    total = func.sum(ChatRollup.total)
+    q = db.session.query(ChatRollup.site_id, total) \
+        .filter(ChatRollup.period == 'day', ChatRollup.intent_name == ALL_INTENTS,
+                ChatRollup.bucket_start >= bucket_start('day', start)) \
+        .group_by(ChatRollup.site_id).order_by(total.desc())
+    if limit:
+        q = q.limit(limit)
+    return [(site_id, int(chats)) for site_id, chats in q.all()]
+
+
+def timeseries(site_id: int, period: str = 'day', days: int = 7, intent_name: str = ALL_INTENTS) -> list:
+    """One point per bucket: totals, answered/unanswered and average confidence."""
+    start = datetime.utcnow() - timedelta(days=days)
+    rows = _rows(site_id, period, start, intent_name=intent_name).order_by(ChatRollup.bucket_start).all()
+    return [r.to_dict() for r in rows]
+
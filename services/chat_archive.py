@@ -0,0 +1,301 @@
+"""
+ChatLog retention and archival.
+
+Live chat logs sit in the separate 'logs' SQLite database. Rows older than
+a site's hot retention (Site.chat_retention_days, default CHAT_LOG_HOT_DAYS)
+are moved into monthly partitions of gzip-compressed NDJSON under
+CHAT_ARCHIVE_DIR/site_<id>/ and deleted from the live table:
+
+    site_1/manifest.json
+    site_1/2026-03.1-48211.ndjson.gz      <month>.<first id>-<last id>
+
+Each archive run writes at most one segment per month. The manifest records
+the id and timestamp range of every segment, so readers can skip whole
+segments. Until the archived rows are deleted from the live table, a
+segment also lists the exact ids it holds (`ids`, as [first, last] runs):
+a run that crashed after writing but before deleting is finished by the
+next run, which deletes exactly those ids and writes them nowhere else.
+Rows are only ever deleted by id, never by date: created_at does not rise
+with id (edge hits are reported late and backdated, deferred logs are
+written late), so a row with a lower id than an archived one may still be
+live. ChatLog ids are AUTOINCREMENT, so an archived id is never reused.
+
+Segments can overlap in id (one per month, and late rows land in later
+runs), so iter_chat_logs() merges every segment and the live table by id:
+callers get one id-ordered stream whichever place a row is stored in, and
+an id is a safe cursor to resume from.
+"""
+import gzip
+import heapq
+import json
+import os
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from sqlalchemy import text, select
+from database import db
+from models import ChatLog, Site
+from config import (
+    CHAT_ARCHIVE_DIR, CHAT_LOG_HOT_DAYS, CHAT_ARCHIVE_RETENTION_DAYS, CHAT_ARCHIVE_BATCH_SIZE,
+    DATABASE_PATH, CHAT_LOG_DATABASE_PATH
+)
+
+
+def _site_dir(site_id: int) -> str:
+    return os.path.join(CHAT_ARCHIVE_DIR, f'site_{site_id}')
+
+
+def load_manifest(site_id: int) -> dict:
+    path = os.path.join(_site_dir(site_id), 'manifest.json')
+    if not os.path.exists(path):
+        return {'site_id': site_id, 'segments': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(site_id: int, manifest: dict):
+    path = os.path.join(_site_dir(site_id), 'manifest.json')
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+class _SegmentWriter:
+    """Streams one month's rows into <month>.<min>-<max>.ndjson.gz"""
+
+    def __init__(self, site_id, month):
+        self.site_id = site_id
+        self.month = month
+        self.tmp_path = os.path.join(_site_dir(site_id), f'{month}.partial.ndjson.gz')
+        self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+        self.rows = 0
+        self.ids = []
+        self.min_id = self.max_id = None
+        self.min_ts = self.max_ts = None
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.rows += 1
+        self.ids.append(record['id'])
+        self.min_id = record['id'] if self.min_id is None else min(self.min_id, record['id'])
+        self.max_id = record['id'] if self.max_id is None else max(self.max_id, record['id'])
+        ts = record['created_at']
+        self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+        self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+
+    def close(self) -> dict:
+        self.file.close()
+        name = f'{self.month}.{self.min_id}-{self.max_id}.ndjson.gz'
+        os.replace(self.tmp_path, os.path.join(_site_dir(self.site_id), name))
+        return {
+            'file': name, 'month': self.month, 'rows': self.rows,
+            'min_id': self.min_id, 'max_id': self.max_id,
+            'min_ts': self.min_ts, 'max_ts': self.max_ts,
+            'ids': id_runs(self.ids)
+        }
+
+
+def id_runs(ids) -> list:
+    """Sorted ids as [first, last] runs of consecutive ids."""
+    runs = []
+    for i in sorted(ids):
+        if runs and i == runs[-1][1] + 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return runs
+
+
+def _in_runs(starts, runs, i) -> bool:
+    at = bisect_right(starts, i) - 1
+    return at >= 0 and runs[at][1] >= i
+
+
+def archive_site(site_id: int, cutoff: datetime, batch_size: int = CHAT_ARCHIVE_BATCH_SIZE) -> int:
+    """Move a site's chat logs created before `cutoff` into the archive. Returns rows archived."""
+    os.makedirs(_site_dir(site_id), exist_ok=True)
+    manifest = load_manifest(site_id)
+    # Ids an interrupted run archived but did not delete
+    pending = id_runs(i for seg in manifest['segments'] for lo, hi in seg.get('ids', ()) for i in range(lo, hi + 1))
+    starts = [lo for lo, _ in pending]
+
+    writers = {}
+    for record in iter_live_logs(site_id, end=cutoff, batch_size=batch_size):
+        if _in_runs(starts, pending, record['id']):
+            continue
+        month = record['created_at'][:7]
+        if month not in writers:
+            writers[month] = _SegmentWriter(site_id, month)
+        writers[month].write(record)
+
+    if not writers and not pending:
+        return 0
+
+    archived = 0
+    for writer in writers.values():
+        segment = writer.close()
+        manifest['segments'].append(segment)
+        archived += segment['rows']
+    _save_manifest(site_id, manifest)
+
+    # Only now that the segments are durable, drop exactly their rows from the live table
+    ids = [i for seg in manifest['segments'] for lo, hi in seg.get('ids', ()) for i in range(lo, hi + 1)]
+    for at in range(0, len(ids), batch_size):
+        ChatLog.query.filter(ChatLog.site_id == site_id, ChatLog.id.in_(ids[at:at + batch_size])) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+    for seg in manifest['segments']:
+        seg.pop('ids', None)
+    _save_manifest(site_id, manifest)
+    return archived
+
+
+def purge_archive(site_id: int, older_than: datetime) -> int:
+    """Delete archived segments whose newest row is older than `older_than`. Returns rows purged."""
+    manifest = load_manifest(site_id)
+    limit = older_than.isoformat()
+    keep, purged = [], 0
+    for seg in manifest['segments']:
+        if seg['max_ts'] < limit:
+            path = os.path.join(_site_dir(site_id), seg['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            purged += seg['rows']
+        else:
+            keep.append(seg)
+    if purged:
+        manifest['segments'] = keep
+        _save_manifest(site_id, manifest)
+    return purged
+
+
+def apply_retention(site_id: int = None, now: datetime = None, verbose: bool = False) -> dict:
+    """Archive and purge according to each site's retention settings."""
+    now = now or datetime.utcnow()
+    sites = Site.query.filter_by(id=site_id).all() if site_id else Site.query.all()
+    report = {}
+    for site in sites:
+        hot_days = site.chat_retention_days if site.chat_retention_days is not None else CHAT_LOG_HOT_DAYS
+        archived = archive_site(site.id, now - timedelta(days=hot_days))
+        keep_days = site.archive_retention_days if site.archive_retention_days is not None else CHAT_ARCHIVE_RETENTION_DAYS
+        purged = purge_archive(site.id, now - timedelta(days=keep_days)) if keep_days else 0
+        report[site.id] = {'archived': archived, 'purged': purged}
+        if verbose:
+            print(f'  site {site.id}: archived {archived}, purged {purged}')
+    return report
+
+
+LOG_COLUMNS = ['id', 'site_id', 'user_message', 'detected_intent', 'confidence',
+               'bot_response', 'session_id', 'created_at']
+
+
+def log_record(row) -> dict:
+    """ChatLog.to_dict() shape for a plain column row"""
+    return {
+        'id': row.id,
+        'site_id': row.site_id,
+        'user_message': row.user_message,
+        'detected_intent': row.detected_intent,
+        'confidence': round(row.confidence, 3),
+        'bot_response': row.bot_response,
+        'session_id': row.session_id,
+        'created_at': row.created_at.isoformat(),
+        'is_answered': row.detected_intent != 'UNKNOWN'
+    }
+
+
+def _read_segment(path, start_ts, end_ts, after_id):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            ts = record['created_at']
+            if record['id'] <= after_id or (start_ts and ts < start_ts) or (end_ts and ts >= end_ts):
+                continue
+            yield record
+
+
+def iter_archived_logs(site_id: int, start: datetime = None, end: datetime = None, after_id: int = 0):
+    """Yield archived chat logs for a site in id order (segments merged, each is written in id order)."""
+    start_ts = start.isoformat() if start else None
+    end_ts = end.isoformat() if end else None
+
+    readers = []
+    for seg in load_manifest(site_id)['segments']:
+        if seg['max_id'] <= after_id:
+            continue
+        if (start_ts and seg['max_ts'] < start_ts) or (end_ts and seg['min_ts'] >= end_ts):
+            continue
+        readers.append(_read_segment(os.path.join(_site_dir(site_id), seg['file']), start_ts, end_ts, after_id))
+    yield from heapq.merge(*readers, key=lambda record: record['id'])
+
+
+def iter_live_logs(site_id: int, start: datetime = None, end: datetime = None,
+                   after_id: int = 0, batch_size: int = 1000):
+    """Yield live chat logs for a site by keyset pagination on (site_id, id).
+
+    Each page runs on its own short-lived connection, so a long read (e.g. a
+    streaming export) never holds a SQLite read transaction between pages.
+    """
+    table = ChatLog.__table__
+    base = select(*[table.c[name] for name in LOG_COLUMNS]).where(table.c.site_id == site_id)
+    if start:
+        base = base.where(table.c.created_at >= start)
+    if end:
+        base = base.where(table.c.created_at < end)
+    engine = db.engines['logs']
+    last_id = after_id
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(base.where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            return
+        for row in rows:
+            yield log_record(row)
+        last_id = rows[-1].id
+
+
+def iter_chat_logs(site_id: int, start: datetime = None, end: datetime = None,
+                   after_id: int = 0, batch_size: int = 1000):
+    """Yield a site's chat logs (ChatLog.to_dict() shape) in id order, archive and live table merged.
+
+    start/end bound created_at (end exclusive); after_id resumes an earlier read.
+    A row archived by a run that has not deleted it yet is yielded once.
+    """
+    last_id = after_id
+    for record in heapq.merge(iter_archived_logs(site_id, start, end, after_id),
+                              iter_live_logs(site_id, start, end, after_id, batch_size),
+                              key=lambda record: record['id']):
+        if record['id'] != last_id:
+            last_id = record['id']
+            yield record
+
+
+def vacuum_logs_db():
+    """Reclaim space in the logs database after large archive runs."""
+    with db.engines['logs'].connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('VACUUM'))
+
+
+def move_legacy_chat_logs() -> int:
+    """Copy chat_logs rows left in the main database into the logs database and drop the old table."""
+    with db.engines['logs'].connect() as conn:
+        conn.execute(text('ATTACH DATABASE :path AS legacy'), {'path': DATABASE_PATH})
+        exists = conn.execute(text(
+            "SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = 'chat_logs'"
+        )).first()
+        moved = 0
+        if exists:
+            moved = conn.execute(text(
+                'INSERT OR IGNORE INTO chat_logs '
+                '(id, site_id, user_message, detected_intent, confidence, bot_response, session_id, created_at) '
+                'SELECT id, site_id, user_message, detected_intent, confidence, bot_response, session_id, created_at '
+                'FROM legacy.chat_logs'
+            )).rowcount
+            conn.execute(text('DROP TABLE legacy.chat_logs'))
+            conn.execute(text('DROP TABLE IF EXISTS legacy.chat_rollups'))
+        conn.commit()
+        conn.execute(text('DETACH DATABASE legacy'))
+    if moved:
+        print(f'Moved {moved} chat logs from {DATABASE_PATH} to {CHAT_LOG_DATABASE_PATH}')
+    return moved
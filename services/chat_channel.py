@@ -0,0 +1,106 @@
+"""
+Registry of the widget WebSocket connections open on this worker.
+
+Each connection belongs to one site and one chat session, both fixed when
+it is opened (routes/chat_socket.py). The registry enforces
+CHAT_SOCKET_MAX_CONNECTIONS per worker and CHAT_SOCKET_MAX_PER_SITE per site,
+and lets any thread push an event to a session's open connections, e.g.
+handoff status from the CRM (POST /admin/api/client/sessions/<id>/push).
+
+A push is delivered to this worker's connections and published on the
+tenant change pub/sub (services/tenant_changes.py); the other workers and
+nodes deliver it to theirs. Only the redis backend (TENANT_PUBSUB_URL)
+leaves the process: without it a push reaches the sockets of the worker
+that took the call only, so run one worker or set TENANT_PUBSUB_URL.
+"""
+import json
+import threading
+from config import CHAT_SOCKET_MAX_CONNECTIONS, CHAT_SOCKET_MAX_PER_SITE
+from services.tenant_changes import watcher
+
+
+class Connection:
+    """One open socket. send() may be called from any thread."""
+
+    def __init__(self, ws, site_id: int, session_id: str):
+        self.ws = ws
+        self.site_id = site_id
+        self.session_id = session_id
+        self._send_lock = threading.Lock()
+
+    def send(self, frame_type: str, **data):
+        frame = json.dumps({'type': frame_type, **data})
+        # Replies and pushes come from different threads; frames must not interleave
+        with self._send_lock:
+            self.ws.send(frame)
+
+
+class ChannelRegistry:
+    def __init__(self, max_connections: int = CHAT_SOCKET_MAX_CONNECTIONS,
+                 max_per_site: int = CHAT_SOCKET_MAX_PER_SITE):
+        self.max_connections = max_connections
+        self.max_per_site = max_per_site
+        self._lock = threading.Lock()
+        self._sessions = {}   # (site_id, session_id) -> set of Connection
+        self._per_site = {}   # site_id -> open connections
+        self._total = 0
+
+    def register(self, connection: Connection) -> bool:
+        """Admit a connection; False when the worker or the site is at its limit."""
+        with self._lock:
+            site_count = self._per_site.get(connection.site_id, 0)
+            if self._total >= self.max_connections or site_count >= self.max_per_site:
+                return False
+            self._total += 1
+            self._per_site[connection.site_id] = site_count + 1
+            self._sessions.setdefault((connection.site_id, connection.session_id), set()).add(connection)
+            return True
+
+    def unregister(self, connection: Connection):
+        with self._lock:
+            key = (connection.site_id, connection.session_id)
+            connections = self._sessions.get(key)
+            if not connections or connection not in connections:
+                return
+            connections.discard(connection)
+            if not connections:
+                del self._sessions[key]
+            self._total -= 1
+            self._per_site[connection.site_id] -= 1
+            if not self._per_site[connection.site_id]:
+                del self._per_site[connection.site_id]
+
+    def push(self, site_id: int, session_id: str, event: str, data: dict = None) -> int:
+        """Send a `push` frame to the session's connections on every worker. Returns how many here got it."""
+        delivered = self.deliver(site_id, session_id, event, data)
+        watcher.pubsub.publish_push({'site_id': site_id, 'session_id': session_id, 'event': event, 'data': data})
+        return delivered
+
+    def deliver(self, site_id: int, session_id: str, event: str, data: dict = None) -> int:
+        """Send a `push` frame to the session's connections on this worker. Returns how many got it."""
+        with self._lock:
+            connections = list(self._sessions.get((site_id, session_id), ()))
+        delivered = 0
+        for connection in connections:
+            try:
+                connection.send('push', event=event, data=data or {})
+                delivered += 1
+            except Exception as e:
+                # The socket's own thread notices the closed connection and unregisters it
+                print(f"Push to session {session_id} failed: {e}")
+        return delivered
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'connections': self._total, 'max_connections': self.max_connections,
+                    'sites': dict(self._per_site)}
+
+
+channels = ChannelRegistry()
+
+
+def _deliver_published(message):
+    channels.deliver(message['site_id'], message['session_id'], message['event'], message.get('data'))
+
+
+watcher.pubsub.subscribe_pushes(_deliver_published)
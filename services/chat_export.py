@@ -0,0 +1,45 @@
+"""
+Streaming chat log exports (NDJSON / CSV).
+
+Rows come from services.chat_archive.iter_chat_logs: archived partitions
+and the live table (keyset pagination on (site_id, id)) merged by id. Output is
+produced in chunks of `chunk_rows` rows, so worker memory stays flat no
+matter how many rows a tenant has. Every row carries its id; a client that
+loses the connection resumes with ?cursor=<last id received>.
+"""
+import csv
+import io
+import json
+from services.chat_archive import iter_chat_logs
+
+CSV_COLUMNS = ['id', 'created_at', 'session_id', 'user_message', 'detected_intent',
+               'confidence', 'bot_response', 'is_answered']
+
+
+def export_ndjson(site_id: int, cursor: int = 0, chunk_rows: int = 1000):
+    lines = []
+    for record in iter_chat_logs(site_id, after_id=cursor, batch_size=chunk_rows):
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_csv(site_id: int, cursor: int = 0, chunk_rows: int = 1000):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if not cursor:
+        writer.writerow(CSV_COLUMNS)
+    rows = 0
+    for record in iter_chat_logs(site_id, after_id=cursor, batch_size=chunk_rows):
+        writer.writerow([record[col] for col in CSV_COLUMNS])
+        rows += 1
+        if rows >= chunk_rows:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            rows = 0
+    if buf.tell():
+        yield buf.getvalue()
@@ -4,20 +4,31 @@ Wraps core intent engine and implements action handlers for LEAD, HUMAN, AUTO in
 """
 from models.chat_log import ChatLog
 from database import db
-from datetime import datetime
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+import atexit
+import os
+import threading
+import time
 import uuid
-from services.intent_service import handle_message as intent_handle_message
+from flask import current_app
+from config import SESSION_HISTORY_MAX, ADMISSION_DEFERRED_MAX, ADMISSION_DEFERRED_FLUSH_SECONDS
+from services.intent_service import detect as intent_detect, respond as intent_respond
+from services.session_store import session_store, make_turn, is_affirmative
+from services.analytics import record_chat, record_chats
+from services.admission import admission, DEFER_LOGGING
 
 
 class ChatResponse:
     """Standardized chat response object"""
-    def __init__(self, intent_name, intent_type, reply, confidence, handoff=False, lead_capture=False):
+    def __init__(self, intent_name, intent_type, reply, confidence, handoff=False, lead_capture=False, session_id=None):
         self.intent_name = intent_name
         self.intent_type = intent_type
         self.reply = reply
         self.confidence = confidence
         self.handoff = handoff
         self.lead_capture = lead_capture
+        self.session_id = session_id
 
     def to_dict(self):
         return {
@@ -26,49 +37,246 @@ class ChatResponse:
             'intent_type': self.intent_type,
             'confidence': self.confidence,
             'handoff': self.handoff,
-            'lead_capture': self.lead_capture
+            'lead_capture': self.lead_capture,
+            'session_id': self.session_id
         }
 
 
-def process_message(site_id: int, user_message: str, session_id: str = None) -> ChatResponse:
+def process_message(site_id: int, user_message: str, session_id: str = None, ticket=None) -> ChatResponse:
     """
     Process user message for a given site.
     
     Flow:
-    1. Detect intent using core engine
-    2. Log the interaction
+    1. Detect intent using core engine (or resolve a pending confirmation)
+    2. Log the interaction and record the turn in the session store
     3. Handle intent type (AUTO -> reply, LEAD -> capture form, HUMAN -> handoff)
     
-    Returns: ChatResponse object
+    ticket: the services.admission Ticket the message was admitted with; under
+    load it skips embeddings and defers the ChatLog write.
+
+    Returns: ChatResponse object (carries session_id so the widget can keep continuity)
     """
     if not session_id:
         session_id = str(uuid.uuid4())
-    
-    # Use new intent service pipeline (returns dict)
-    intent_result = intent_handle_message(user_message, client_id=site_id, site_id=site_id)
 
-    intent_name = intent_result.get('intent_name', 'UNKNOWN')
-    intent_type = intent_result.get('intent_type', 'UNKNOWN')
-    reply = intent_result.get('text', intent_result.get('response', ''))
-    confidence = intent_result.get('confidence', 0.0)
-    
-    # Log the chat interaction
+    result, intent = _detect(site_id, user_message, session_id, ticket)
+    intent_result = intent_respond(user_message, site_id, site_id, result, intent)
+    _record_turn(site_id, session_id, user_message, intent_result, ticket)
+    return _make_response(intent_result, session_id)
+
+
+def stream_message(site_id: int, user_message: str, session_id: str = None, ticket=None):
+    """
+    The same pipeline as process_message, as a generator of (event, data) pairs
+    for the streaming chat endpoint:
+
+    ack     {session_id}                          before any work
+    intent  {intent, intent_type, confidence, working}
+                                                  once detected; working = an action intent,
+                                                  so a workflow may run before the reply
+    reply   ChatResponse.to_dict()                when the reply is rendered
+
+    The turn is logged when the generator finishes or is closed, i.e. once
+    the client has the reply or has gone away. A client that disconnects
+    before the reply gets its detected intent logged with an empty reply
+    (and no pending confirmation); one gone before detection logs nothing.
+    """
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    result = intent_result = None
+    try:
+        yield 'ack', {'session_id': session_id}
+
+        result, intent = _detect(site_id, user_message, session_id, ticket)
+        yield 'intent', {
+            'intent': result.get('intent_name', 'UNKNOWN'),
+            'intent_type': intent.intent_type if intent else 'UNKNOWN',
+            'confidence': result.get('confidence', 0.0),
+            'working': bool(intent) and (intent.intent_type or '').lower() == 'action'
+        }
+
+        intent_result = intent_respond(user_message, site_id, site_id, result, intent)
+        yield 'reply', _make_response(intent_result, session_id).to_dict()
+    finally:
+        if intent_result is None and result is not None:
+            # Gone before the reply: nothing was answered or asked
+            intent_result = dict(result, text='', confirm=False)
+        if intent_result is not None:
+            _record_turn(site_id, session_id, user_message, intent_result, ticket)
+
+
+def _write_logs(rows):
+    """Bulk-insert ChatLog rows (dicts) and count them in the rollups, with one commit."""
+    db.session.execute(insert(ChatLog), rows)
+    chats = {}
+    for row in rows:
+        chats.setdefault(row['site_id'], []).append((row['detected_intent'], row['confidence'], row['created_at']))
+    for site_id, site_chats in chats.items():
+        record_chats(site_id, site_chats)
+    db.session.commit()
+
+
+class DeferredLogs:
+    """
+    ChatLog rows held back while the worker sheds load (services/admission.py).
+
+    A daemon thread, started per process on first use, writes them in bulk
+    every ADMISSION_DEFERRED_FLUSH_SECONDS once the worker is below the
+    DEFER_LOGGING level again, so the SQLite writer is left to the messages
+    being answered. add() refuses rows beyond ADMISSION_DEFERRED_MAX; the
+    caller then writes them itself. Rows still held when the worker stops
+    are written by flush_at_exit(), from gunicorn's worker_exit hook or,
+    failing that, atexit; only a killed process loses them.
+    """
+
+    def __init__(self, max_rows=ADMISSION_DEFERRED_MAX, interval=ADMISSION_DEFERRED_FLUSH_SECONDS):
+        self.max_rows = max_rows
+        self.interval = interval
+        self._rows = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._app = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row) -> bool:
+        with self._lock:
+            if len(self._rows) >= self.max_rows:
+                return False
+            self._rows.append(row)
+        self._ensure_flusher()
+        return True
+
+    def flush(self) -> int:
+        """Write every held row now (app context required). Returns how many."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        try:
+            _write_logs(rows)
+        except Exception as e:
+            print(f"Error writing deferred chat logs: {e}")
+            db.session.rollback()
+            with self._lock:
+                # keep them for the next attempt, within the cap
+                self._rows = (rows + self._rows)[:self.max_rows]
+            return 0
+        return len(rows)
+
+    def flush_at_exit(self, app=None) -> int:
+        """Write every held row in a fresh app context (`app`, else the one seen on first use)."""
+        app = app or self._app
+        if app is None or not self._rows:
+            return 0
+        with app.app_context():
+            try:
+                return self.flush()
+            finally:
+                db.session.remove()
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so start one per process on first use
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._app = current_app._get_current_object()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='deferred-chat-logs', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._rows or admission.level() >= DEFER_LOGGING:
+                continue
+            with self._app.app_context():
+                self.flush()
+                db.session.remove()
+
+
+deferred_logs = DeferredLogs()
+# Fallback for exits that skip gunicorn's worker_exit (flask run, scripts); inherited across fork
+atexit.register(deferred_logs.flush_at_exit)
+
+
+def _log_row(site_id, session_id, user_message, intent_name, confidence, reply, created_at) -> dict:
+    return {'site_id': site_id, 'user_message': user_message, 'detected_intent': intent_name,
+            'confidence': confidence, 'bot_response': reply, 'session_id': session_id,
+            'created_at': created_at}
+
+
+def record_edge_hits(site_id: int, hits, defer: bool = False) -> int:
+    """
+    Log messages the widget answered from its edge bundle (services/edge_bundle.py).
+
+    hits: [{session_id, message, intent_name, confidence, reply, age_ms}], already
+    validated by the route. One bulk insert, one rollup upsert, one commit
+    (or, with defer, handed to deferred_logs); returns how many.
+    """
+    now = datetime.utcnow()
+    rows, turns = [], []
+    for hit in hits:
+        created_at = now - timedelta(milliseconds=hit['age_ms'])
+        rows.append(_log_row(site_id, hit['session_id'], hit['message'], hit['intent_name'],
+                             hit['confidence'], hit['reply'], created_at))
+        turns.append((hit['session_id'], make_turn(site_id, hit['session_id'], hit['message'],
+                                                   hit['intent_name'], hit['confidence'], hit['reply'],
+                                                   created_at)))
+    if defer:
+        rows = [row for row in rows if not deferred_logs.add(row)]
     try:
-        chat_log = ChatLog(
-            site_id=site_id,
-            user_message=user_message,
-            detected_intent=intent_name,
-            confidence=confidence,
-            bot_response=reply,
-            session_id=session_id,
-            created_at=datetime.utcnow()
-        )
-        db.session.add(chat_log)
-        db.session.commit()
+        if rows:
+            _write_logs(rows)
     except Exception as e:
-        print(f"Error logging chat: {e}")
+        print(f"Error logging edge hits: {e}")
         db.session.rollback()
-    
+        return 0
+
+    for session_id, turn in turns:
+        session_store.append(site_id, session_id, turn)
+    return len(turns)
+
+
+def _detect(site_id, user_message, session_id, ticket=None):
+    # Follow-up context: "I think you're asking about X. Is that right?" -> "yes"
+    pending_intent = session_store.pending_intent(site_id, session_id)
+    if pending_intent and is_affirmative(user_message):
+        return intent_detect(user_message, site_id=site_id, confirmed_intent=pending_intent)
+    return intent_detect(user_message, site_id=site_id, use_embeddings=ticket is None or ticket.use_embeddings)
+
+
+def _record_turn(site_id, session_id, user_message, intent_result, ticket=None):
+    """Log the chat interaction (deferred under load) and append the turn to the session store."""
+    intent_name = intent_result.get('intent_name', 'UNKNOWN')
+    confidence = intent_result.get('confidence', 0.0)
+    reply = intent_result.get('text', intent_result.get('response', ''))
+    row = _log_row(site_id, session_id, user_message, intent_name, confidence, reply, datetime.utcnow())
+    if not (ticket is not None and ticket.defer_logging and deferred_logs.add(row)):
+        try:
+            db.session.add(ChatLog(**row))
+            record_chat(site_id, intent_name, confidence, row['created_at'])
+            db.session.commit()
+        except Exception as e:
+            print(f"Error logging chat: {e}")
+            db.session.rollback()
+
+    session_store.append(
+        site_id, session_id,
+        make_turn(site_id, session_id, user_message, intent_name, confidence, reply),
+        pending_intent=intent_name if intent_result.get('confirm') else None
+    )
+
+
+def _make_response(intent_result, session_id) -> ChatResponse:
+    intent_name = intent_result.get('intent_name', 'UNKNOWN')
+    intent_type = intent_result.get('intent_type', 'UNKNOWN')
+    reply = intent_result.get('text', intent_result.get('response', ''))
+
     # Determine response behavior based on intent type
     handoff = False
     lead_capture = False
@@ -87,17 +295,27 @@ def process_message(site_id: int, user_message: str, session_id: str = None) ->
         intent_name=intent_name,
         intent_type=intent_type,
         reply=reply,
-        confidence=confidence,
+        confidence=intent_result.get('confidence', 0.0),
         handoff=handoff,
-        lead_capture=lead_capture
+        lead_capture=lead_capture,
+        session_id=session_id
     )
 
 
-def get_session_history(site_id: int, session_id: str, limit: int = 10):
-    """Retrieve chat history for a session"""
+def get_session_history(site_id: int, session_id: str, limit: int = SESSION_HISTORY_MAX):
+    """Retrieve chat history for a session from the in-process session store.
+
+    A session this worker has never seen (e.g. after a restart) is seeded once
+    from ChatLog, an unknown one as empty; every later read is served from memory.
+    """
+    history = session_store.history(site_id, session_id, limit)
+    if history is not None:
+        return history
+
     logs = ChatLog.query.filter_by(
         site_id=site_id,
         session_id=session_id
-    ).order_by(ChatLog.created_at.asc()).limit(limit).all()
-    
-    return [log.to_dict() for log in logs]
+    ).order_by(ChatLog.created_at.desc()).limit(SESSION_HISTORY_MAX).all()
+    turns = [log.to_dict() for log in reversed(logs)]
+    session_store.seed(site_id, session_id, turns)
+    return turns[-limit:] if limit else turns
@@ -0,0 +1,181 @@
+"""
+Per-site edge bundle: the site's busiest static intents, answered inside the widget.
+
+GET /api/edge-bundle?site_id=N returns the EDGE_BUNDLE_MAX_INTENTS most asked
+info intents with a fixed response (ranked by chats over EDGE_BUNDLE_DAYS),
+each with its pre-rendered reply and its phrases as stop-word-free, sorted
+token sets. static/widget.js tokenizes a message the same way and answers
+locally only when the message's token set is exactly one of those keys.
+
+A phrase is only shipped if the server itself, scoring that token set,
+picks the same intent (overlay and tie-breaking included) with a confidence
+that gets a direct answer (HIGH_CONFIDENCE), at least EDGE_BUNDLE_MIN_CONFIDENCE
+and the intent's own threshold. When the site's layers carry phrase
+embeddings the key is also scored the way the embedding tier would score it
+(the key text embedded as the message) and must pick the same intent there
+too, so it holds whether or not the worker is skipping embeddings. The
+widget embeds nothing: a message whose token set is a key but whose wording
+embeds closer to another intent's phrase can still get a local answer the
+embedding tier would not have given; for the token tier the local answer is
+exactly the server's. Action, LEAD and HUMAN intents never go into the
+bundle: they have side effects.
+
+Bundles are cached per site for EDGE_BUNDLE_CACHE_TTL seconds and dropped
+when the site's (or the global) intents or config change. `version` moves
+with the tenant versions, the ETag with the content.
+
+Locally answered messages are reported back in batches
+(POST /api/chat/edge-hits, services.chat_service.record_edge_hits) so
+ChatLog and the analytics rollups stay complete.
+"""
+import hashlib
+import json
+import threading
+import time
+from core.embeddings import embeddings_available, get_batcher
+from core.intent_engine import best_phrase_match, scaled_confidence, HIGH_CONFIDENCE
+from core.tenant_index import tenant_layers, GLOBAL_SITE_ID
+from core.tokenizer import STOP_WORDS
+from services.analytics import intent_volumes
+from services.rendered_responses import rendered_response
+from services.tenant_changes import on_tenant_change
+from services.tenant_version import get_versions
+from config import (
+    CONFIDENCE_THRESHOLD, EDGE_BUNDLE_MAX_INTENTS, EDGE_BUNDLE_DAYS,
+    EDGE_BUNDLE_MIN_CONFIDENCE, EDGE_BUNDLE_CACHE_TTL
+)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class EdgeBundle:
+    __slots__ = ('payload', 'body', 'etag', 'expires')
+
+    def __init__(self, payload, ttl):
+        self.payload = payload
+        self.body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        self.etag = hashlib.sha1(self.body.encode('utf-8')).hexdigest()[:16]
+        self.expires = time.monotonic() + ttl
+
+
+def phrase_key(words) -> str:
+    """The bundle key of a token list: its distinct tokens, sorted, space separated."""
+    return ' '.join(sorted(set(words)))
+
+
+def _eligible(record) -> bool:
+    return (record.intent_type or 'info').lower() == 'info' and bool(record.response)
+
+
+def _server_confidence(record, key, layers, embedding=None):
+    """The confidence the server answers the key with `record`, or None if it picks another intent."""
+    best = best_phrase_match(key.split(), layers, embedding)
+    if best['intent'] is None or best['intent'].id != record.id:
+        return None
+    return scaled_confidence(record, best['score'])
+
+
+def _embedding_confidences(record, keys, layers) -> dict:
+    """{key: confidence} for the keys the embedding tier also answers with `record` (one encode call)."""
+    try:
+        embeddings = get_batcher().encode_many(list(keys))
+    except Exception as e:
+        print(f"Edge bundle: cannot embed the phrases of intent {record.id}, leaving it out: {e}")
+        return {}
+    confidences = {}
+    for key, embedding in zip(keys, embeddings):
+        confidence = _server_confidence(record, key, layers, embedding)
+        if confidence is not None:
+            confidences[key] = confidence
+    return confidences
+
+
+def build_bundle(site_id: int) -> dict:
+    layers = tenant_layers(site_id)
+    embedded = embeddings_available() and any(index.embeddings is not None for index, _ in layers)
+    volumes = intent_volumes(site_id, EDGE_BUNDLE_DAYS)
+
+    candidates = []
+    for index, hidden in layers:
+        for position, record in enumerate(index.intents):
+            if record is not None and position not in hidden and _eligible(record):
+                candidates.append((index, position, record))
+    candidates.sort(key=lambda c: (-volumes.get(c[2].intent_name, 0), c[2].intent_name, c[2].id))
+
+    intents, phrases = [], {}
+    for index, position, record in candidates:
+        if len(intents) >= EDGE_BUNDLE_MAX_INTENTS:
+            break
+        # Below HIGH_CONFIDENCE the server asks for confirmation instead of answering
+        threshold = max(HIGH_CONFIDENCE, EDGE_BUNDLE_MIN_CONFIDENCE,
+                        record.confidence_threshold or CONFIDENCE_THRESHOLD)
+        keys = {}
+        for p in range(len(index.phrase_intent)):
+            if index.phrase_intent[p] != position:
+                continue
+            key = phrase_key(index.phrase_words(p))
+            if not key or key in phrases or key in keys:
+                continue
+            # Would the server answer exactly this token set with this intent?
+            confidence = _server_confidence(record, key, layers)
+            if confidence is not None and confidence >= threshold:
+                keys[key] = confidence
+        if keys and embedded:
+            # ... and with embeddings on; the lower of the two confidences is shipped
+            scored = _embedding_confidences(record, keys, layers)
+            keys = {key: min(confidence, scored[key]) for key, confidence in keys.items()
+                    if scored.get(key, 0.0) >= threshold}
+        if not keys:
+            continue
+        intents.append({'id': record.id, 'name': record.intent_name,
+                        'reply': rendered_response(site_id, record)})
+        phrases.update({key: [len(intents) - 1, confidence] for key, confidence in keys.items()})
+
+    intents_version, config_version = get_versions(site_id)
+    global_version = get_versions(GLOBAL_SITE_ID)[0] if site_id != GLOBAL_SITE_ID else intents_version
+    return {
+        'site_id': site_id,
+        'version': f'{intents_version}.{config_version}.{global_version}',
+        'stop_words': sorted(STOP_WORDS),
+        'intents': intents,
+        'phrases': phrases
+    }
+
+
+def edge_replies(site_id: int, intent_ids) -> dict:
+    """{intent id: (intent name, rendered reply)} for the ids the widget may have answered locally."""
+    wanted = set(intent_ids)
+    found = {}
+    for index, hidden in tenant_layers(site_id):
+        for position, record in enumerate(index.intents):
+            if record is not None and record.id in wanted and record.id not in found:
+                found[record.id] = record if position not in hidden and _eligible(record) else None
+    return {intent_id: (record.intent_name, rendered_response(site_id, record))
+            for intent_id, record in found.items() if record is not None}
+
+
+def get_edge_bundle(site_id: int) -> EdgeBundle:
+    entry = _cache.get(site_id)
+    if entry is not None and entry.expires > time.monotonic():
+        return entry
+    entry = EdgeBundle(build_bundle(site_id), EDGE_BUNDLE_CACHE_TTL)
+    with _lock:
+        _cache[site_id] = entry
+    return entry
+
+
+def invalidate(site_id=None):
+    with _lock:
+        if site_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(site_id, None)
+
+
+@on_tenant_change
+def _on_tenant_change(site_id, intents_changed, config_changed):
+    if site_id == GLOBAL_SITE_ID and intents_changed:
+        invalidate()
+    elif intents_changed or config_changed:
+        invalidate(site_id)
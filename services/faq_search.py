@@ -0,0 +1,79 @@
+"""
+Ranked full-text search over FAQs, the second-chance retriever behind intents.
+
+FAQs are indexed in the `faqs_fts` FTS5 table (porter stemming), kept in
+sync with `faqs` by triggers (models.FAQ_FTS_DDL). A message is turned into
+an OR query of its words, restricted to the site's own and the shared
+(site 0) FAQs, and ranked with bm25, questions weighted twice as much as
+answers. bm25 scores are not comparable between corpora, so the best-ranked
+candidates are checked against FAQ_SEARCH_MIN_COVERAGE instead: the share
+of the message's words that the FAQ actually contains.
+
+Databases created before migration 007 have no FTS table; search_faqs then
+returns no candidates and the pipeline behaves as if no FAQ matched.
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from core.tokenizer import tokenize, stem
+from config import FAQ_SEARCH_CANDIDATES, FAQ_SEARCH_MIN_COVERAGE, SCORING_MAX_CHARS, SCORING_MAX_TOKENS
+from database import db
+
+_SEARCH = """
+    SELECT f.id, f.site_id, f.question, f.answer, bm25(faqs_fts, 2.0, 1.0, 0.0) AS rank
+    FROM faqs_fts JOIN faqs f ON f.id = faqs_fts.rowid
+    WHERE faqs_fts MATCH :query {sector_filter}
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+
+def _match_query(words, site_id: int) -> str:
+    terms = ' OR '.join(f'"{w}"' for w in words)
+    scopes = 'site0' if not site_id else f'site0 OR site{int(site_id)}'
+    return f'scope : ({scopes}) AND {{question answer}} : ({terms})'
+
+
+def coverage(words, question: str, answer: str) -> float:
+    """Share of `words` (stemmed) found in the FAQ's question or answer; FTS does the real stemming."""
+    if not words:
+        return 0.0
+    vocabulary = {stem(w) for w in tokenize(f'{question} {answer}')}
+    return sum(stem(w) in vocabulary for w in words) / len(words)
+
+
+def search_faqs(message: str, site_id: int = 0, sector: str = None, limit: int = None) -> list:
+    """Best-ranked FAQs for a message as dicts (id, site_id, question, answer, rank, coverage).
+
+    With `sector`, FAQs tagged with another sector are left out; untagged
+    FAQs always qualify.
+    """
+    # tokenize leaves only \w runs, so every word is safe inside an FTS string;
+    # bounded like intent scoring, so a pasted essay is not a thousand-term OR query
+    words = list(dict.fromkeys(tokenize(message[:SCORING_MAX_CHARS])))[:SCORING_MAX_TOKENS]
+    if not words:
+        return []
+    sql = _SEARCH.format(sector_filter='AND (f.sector IS NULL OR f.sector = :sector)' if sector else '')
+    params = {'query': _match_query(words, site_id), 'limit': limit or FAQ_SEARCH_CANDIDATES}
+    if sector:
+        params['sector'] = sector
+    try:
+        rows = db.session.execute(text(sql), params).all()
+    except OperationalError as e:
+        # no faqs_fts table (migration 007 not applied); sqlite keeps the transaction usable
+        print(f"FAQ search unavailable: {e}")
+        return []
+    return [{'id': row.id, 'site_id': row.site_id, 'question': row.question, 'answer': row.answer, 'rank': row.rank,
+             'coverage': coverage(words, row.question, row.answer)} for row in rows]
+
+
+def best_faq(message: str, site_id: int = 0, sector: str = None):
+    """The best-ranked FAQ covering at least FAQ_SEARCH_MIN_COVERAGE of the message, or None."""
+    candidates = search_faqs(message, site_id, sector)
+    # A site's FAQ replaces a shared one with the same question, as site intents replace global ones
+    own = {c['question'] for c in candidates if c['site_id']}
+    for candidate in candidates:
+        if not candidate['site_id'] and candidate['question'] in own:
+            continue
+        if candidate['coverage'] >= FAQ_SEARCH_MIN_COVERAGE:
+            return candidate
+    return None
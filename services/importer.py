@@ -1,6 +1,8 @@
 import json
 from database import db
 from models import Intent, IntentPhrase, Workflow, ClientConfig
+from services.tenant_version import bump as bump_tenant_version
+from core.tenant_index import write_site_snapshot
 
 def import_sector_template(site_id, json_data):
     """
@@ -63,7 +65,13 @@ def import_sector_template(site_id, json_data):
                 if not exists:
                     db.session.add(ClientConfig(client_id=site_id, key=key, value=''))
 
+        bump_tenant_version(site_id, intents=True, config=True)
         db.session.commit()
+        try:
+            # Compile once here so workers map the snapshot instead of rebuilding
+            write_site_snapshot(site_id)
+        except Exception as e:
+            print(f"Index snapshot for site {site_id} not written: {e}")
         return {"success": True, "message": f"Successfully processed {len(intents)} intents."}
 
     except Exception as e:
@@ -0,0 +1,96 @@
+"""
+Single intent and phrase edits from the admin panel.
+
+Each function commits one change together with a tenant version bump and
+then patches the site's resident TenantIndex in this worker (see
+core.tenant_index.patch_index), so adding a phrase costs one tokenize and
+one embedding instead of recompiling and re-embedding the whole site. New
+phrases are embedded before the patch (encode_phrases), outside its lock;
+if anything fails the resident index is dropped and reloaded.
+Other workers see the version change and reload the snapshot written by
+the patch.
+"""
+from sqlalchemy import insert
+from database import db
+from models import Intent, IntentPhrase, Workflow
+from services.tenant_version import bump as bump_tenant_version, get_versions
+from core.tenant_index import IntentRecord, patch_index, encode_phrases, invalidate
+
+INTENT_FIELDS = ('intent_name', 'intent_type', 'sector', 'response', 'confidence', 'confidence_threshold')
+
+
+def _commit_and_patch(site_id, apply, texts=()):
+    """Commit, then patch: `apply(index, embeddings)` gets {text: embedding} for `texts`."""
+    bump_tenant_version(site_id, intents=True)
+    db.session.flush()
+    new_version = get_versions(site_id)[0]
+    db.session.commit()
+    try:
+        embeddings = encode_phrases(site_id, texts)
+        patch_index(site_id, new_version - 1, new_version, lambda index: apply(index, embeddings))
+    except Exception as e:
+        # The commit stands; drop the index here, the version bump makes other workers reload
+        print(f"Index patch for site {site_id} failed: {e}")
+        invalidate(site_id)
+
+
+def create_intent(site_id: int, data: dict, phrases=()) -> Intent:
+    intent = Intent(site_id=site_id, **{k: data[k] for k in INTENT_FIELDS if k in data})
+    db.session.add(intent)
+    db.session.flush()
+    texts = [p.strip() for p in phrases if p and p.strip()]
+    added = []
+    if texts:
+        # one executemany INSERT and one SELECT, rather than an INSERT ... RETURNING per phrase
+        db.session.execute(insert(IntentPhrase), [{'intent_id': intent.id, 'phrase': text} for text in texts])
+        added = db.session.query(IntentPhrase.id, IntentPhrase.phrase) \
+            .filter(IntentPhrase.intent_id == intent.id).order_by(IntentPhrase.id).all()
+    record = IntentRecord.from_model(intent)
+
+    def apply(index, embeddings):
+        index.upsert_intent(record)
+        for phrase_id, text in added:
+            index.add_phrase(record.id, phrase_id, text, embeddings.get(text))
+
+    _commit_and_patch(site_id, apply, [text for _, text in added])
+    return intent
+
+
+def update_intent(intent: Intent, data: dict) -> Intent:
+    for key in INTENT_FIELDS:
+        if key in data:
+            setattr(intent, key, data[key])
+    record = IntentRecord.from_model(intent)
+    _commit_and_patch(intent.site_id, lambda index, _: index.upsert_intent(record))
+    return intent
+
+
+def delete_intent(intent: Intent):
+    site_id, intent_id = intent.site_id, intent.id
+    Workflow.query.filter_by(intent_id=intent_id).delete(synchronize_session=False)
+    db.session.delete(intent)
+    _commit_and_patch(site_id, lambda index, _: index.remove_intent(intent_id))
+
+
+def add_phrase(intent: Intent, text: str) -> IntentPhrase:
+    phrase = IntentPhrase(intent_id=intent.id, phrase=text.strip())
+    db.session.add(phrase)
+    db.session.flush()
+    phrase_id, intent_id, text = phrase.id, intent.id, phrase.phrase
+    _commit_and_patch(intent.site_id, lambda index, embeddings: index.add_phrase(intent_id, phrase_id, text, embeddings.get(text)),
+                      [text])
+    return phrase
+
+
+def update_phrase(phrase: IntentPhrase, text: str) -> IntentPhrase:
+    phrase.phrase = text = text.strip()
+    phrase_id, intent_id, site_id = phrase.id, phrase.intent_id, phrase.intent.site_id
+    _commit_and_patch(site_id, lambda index, embeddings: index.update_phrase(intent_id, phrase_id, text, embeddings.get(text)),
+                      [text])
+    return phrase
+
+
+def delete_phrase(phrase: IntentPhrase):
+    phrase_id, site_id = phrase.id, phrase.intent.site_id
+    db.session.delete(phrase)
+    _commit_and_patch(site_id, lambda index, _: index.remove_phrase(phrase_id))
@@ -1,39 +1,76 @@
-from core.intent_engine import detect_intent
-from models import Intent, FAQ
-from services.response_builder import build_response
-from workflows import handler as workflow_handler
-from config import CONFIDENCE_THRESHOLD
+from core.intent_engine import detect_intent, log_unanswered
+from core.tenant_index import resolve_intent
+from models import Intent
+from services.faq_search import best_faq
+from services.rendered_responses import rendered_response
+from workflows import handler as workflow_handler  # noqa: F401 (registers workflows)
+from workflows.executor import run_workflow, is_registered, WorkflowBusy, WorkflowTimeout
+from config import CONFIDENCE_THRESHOLD, FALLBACK_MESSAGES
 from database import db
 import random
 
 
-def handle_message(message: str, client_id: int, site_id: int = 0) -> dict:
+def handle_message(message: str, client_id: int, site_id: int = 0, confirmed_intent: str = None) -> dict:
     """Main pipeline entry. Returns a response dict with keys:
        - text
        - intent_name
        - intent_type
        - confidence
        - handoff (optional)
+       - confirm (optional, True when the reply asks the user to confirm the intent)
+
+    confirmed_intent skips detection for a follow-up where the user confirmed
+    the intent suggested on the previous turn.
     """
-    result = detect_intent(message, site_id)
+    result, intent = detect(message, site_id, confirmed_intent)
+    return respond(message, client_id, site_id, result, intent)
+
+
+def detect(message: str, site_id: int = 0, confirmed_intent: str = None, use_embeddings: bool = True):
+    """First half of handle_message: (detect_intent result, detected Intent row or None).
+
+    Split out so the streaming chat endpoint can announce the intent before
+    the reply (which may wait on a workflow) is ready.
+    """
+    if confirmed_intent:
+        result = {'intent_name': confirmed_intent, 'confidence': 1.0, 'response': random.choice(FALLBACK_MESSAGES)}
+    else:
+        result = detect_intent(message, site_id, use_embeddings)
+    intent_name = result.get('intent_name')
+    if intent_name in (None, 'UNKNOWN'):
+        return result, None
+
+    # Fetch the intent that was detected; a confirmed name resolves site-specific first, then global
+    intent_id = result.get('intent_id')
+    if intent_id is None:
+        record = resolve_intent(int(site_id), intent_name)
+        intent_id = record.id if record else None
+    intent = db.session.get(Intent, intent_id) if intent_id is not None else None
+    return result, intent
+
+
+def respond(message: str, client_id: int, site_id: int, result: dict, intent) -> dict:
+    """Second half of handle_message: build the reply for a detection result."""
     intent_name = result.get('intent_name')
     confidence = result.get('confidence', 0.0)
 
-    # If no intent detected return fallback
+    # If no intent detected, try the FAQs before the fallback
     if intent_name in (None, 'UNKNOWN'):
+        faq = best_faq(message, int(site_id))
+        if faq:
+            return {'text': faq['answer'], 'confidence': faq['coverage'], 'intent_name': 'FAQ', 'faq_id': faq['id']}
+        if result.get('unanswered'):
+            log_unanswered(message)
         return {'text': random.choice([]) if False else result.get('response'), 'confidence': confidence, 'intent_name': 'UNKNOWN'}
 
-    # Fetch intent record (prefer site-specific, fallback to global)
-    intent = Intent.query.filter((Intent.site_id == site_id) | (Intent.site_id == 0)).filter_by(intent_name=intent_name).first()
-
     # If intent not in DB, return what detect_intent suggested
     if not intent:
-        return {'text': result.get('response'), 'confidence': confidence, 'intent_name': intent_name}
+        return {'text': result.get('response'), 'confidence': confidence, 'intent_name': intent_name, 'confirm': result.get('confirm', False)}
 
     # If confidence below either global threshold or intent-specific threshold -> escalate
     threshold = getattr(intent, 'confidence_threshold', CONFIDENCE_THRESHOLD)
     if confidence < threshold:
-        # mark unanswered for training (existing system handles logging in detect_intent)
+        # below the intent's own threshold: not logged as unanswered, the intent was recognised
         return {'text': random.choice(['I can connect you with a human for help.', 'Would you like me to connect you with support?']), 'confidence': confidence, 'intent_name': intent_name, 'handoff': 'HUMAN'}
 
     # Route by intent type
@@ -41,39 +78,33 @@ def handle_message(message: str, client_id: int, site_id: int = 0) -> dict:
     if itype == 'action':
         # find workflows for intent
         wf = intent.workflows.first()
-        if wf:
-            func_name = wf.function_name
-            # call workflow handler dynamically
-            func = getattr(workflow_handler, func_name, None)
-            if func:
-                try:
-                    data = func(client_id=client_id, message=message)
-                    # prepare template in intent.response if present
-                    if intent.response:
-                        text = build_response(intent.response, client_id)
-                    else:
-                        # default render based on returned data
-                        text = intent.response or str(data)
-                    return {'text': text, 'confidence': confidence, 'intent_name': intent_name, 'data': data}
-                except Exception as e:
-                    return {'text': 'Sorry, something went wrong while processing your request.', 'confidence': 0.0, 'intent_name': intent_name}
+        if wf and is_registered(wf.function_name):
+            # run through the workflow executor (timeout, concurrency limit, result cache)
+            try:
+                data = run_workflow(wf.function_name, client_id=client_id, message=message)
+                # prepare template in intent.response if present
+                if intent.response:
+                    text = rendered_response(client_id, intent)
+                else:
+                    # default render based on returned data
+                    text = intent.response or str(data)
+                return {'text': text, 'confidence': confidence, 'intent_name': intent_name, 'data': data}
+            except (WorkflowBusy, WorkflowTimeout):
+                return {'text': "That's taking longer than expected. Please try again in a moment.", 'confidence': confidence, 'intent_name': intent_name}
+            except Exception as e:
+                return {'text': 'Sorry, something went wrong while processing your request.', 'confidence': 0.0, 'intent_name': intent_name}
         # no workflow -> fallback
         return {'text': intent.response or 'Action intent configured but no workflow found.', 'confidence': confidence, 'intent_name': intent_name}
 
     else:
         # info intent -> use configured response or FAQ
         if intent.response:
-            text = build_response(intent.response, client_id)
+            text = rendered_response(client_id, intent)
             return {'text': text, 'confidence': confidence, 'intent_name': intent_name}
 
-        # fallback to FAQ search by sector or question match
-        # prefer sector-specific FAQ
-        if intent.sector:
-            faq = FAQ.query.filter_by(sector=intent.sector).first()
-        else:
-            faq = FAQ.query.filter(FAQ.question.ilike(f"%{intent_name}%")).first()
-
+        # fallback to full-text FAQ search, limited to the intent's sector when it has one
+        faq = best_faq(message, int(site_id), sector=intent.sector)
         if faq:
-            return {'text': faq.answer, 'confidence': confidence, 'intent_name': intent_name}
+            return {'text': faq['answer'], 'confidence': confidence, 'intent_name': intent_name}
 
-        return {'text': result.get('response'), 'confidence': confidence, 'intent_name': intent_name}
+        return {'text': result.get('response'), 'confidence': confidence, 'intent_name': intent_name, 'confirm': result.get('confirm', False)}
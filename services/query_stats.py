@@ -0,0 +1,155 @@
+"""
+Per-request SQL accounting.
+
+When QUERY_STATS is on (app config or the QUERY_STATS environment variable;
+off by default), every request
+counts the statements it sends to any engine, the rows they return or
+change, and the time spent in the database:
+
+- the response carries `X-Query-Stats: queries=4; rows=21; time_ms=1.8`
+- requests over their view's @query_budget, or over QUERY_STATS_LOG_QUERIES
+  queries / QUERY_STATS_LOG_MS, are printed with their statements
+- over-budget requests are also recorded in app.extensions['query_stats']
+  so the pytest fixtures in conftest.py can fail the test
+
+Declare a budget directly under the route decorator:
+
+    @chat_bp.route('', methods=['POST'])
+    @query_budget(6)
+    def send_message(): ...
+
+Only statements issued by the request's own thread are counted; work handed
+to the workflow executor runs under its own app context, and process-wide
+housekeeping a request happens to run (the tenant version poll) is wrapped
+in uncounted(), so budgets do not depend on poll timing. Rows returned by
+ORM/session queries are counted by buffering the result (the caching recipe
+from the SQLAlchemy docs), which is why this is off by default.
+"""
+import time
+from contextlib import contextmanager
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from config import QUERY_STATS, QUERY_STATS_LOG_QUERIES, QUERY_STATS_LOG_MS
+
+# Statements kept per request for the log line and test failures
+MAX_STATEMENTS = 50
+
+
+class QueryStats:
+    __slots__ = ('queries', 'rows', 'seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    @property
+    def time_ms(self):
+        return round(self.seconds * 1000, 2)
+
+    def header(self) -> str:
+        return f'queries={self.queries}; rows={self.rows}; time_ms={self.time_ms}'
+
+    def to_dict(self) -> dict:
+        return {'queries': self.queries, 'rows': self.rows, 'time_ms': self.time_ms}
+
+
+def current_stats():
+    """The QueryStats of the request being handled on this thread, or None."""
+    if not has_app_context():
+        return None
+    return g.get('query_stats')
+
+
+@contextmanager
+def uncounted():
+    """Leave the statements issued inside out of the current request's stats."""
+    stats = g.pop('query_stats', None) if has_app_context() else None
+    try:
+        yield
+    finally:
+        if stats is not None:
+            g.query_stats = stats
+
+
+def query_budget(max_queries: int):
+    """Declare the most SQL statements one request to this view may issue."""
+    def decorator(func):
+        func.query_budget = max_queries
+        return func
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    started = conn.info.get('query_started')
+    if stats is None or not started:
+        return
+    stats.seconds += time.perf_counter() - started.pop()
+    stats.queries += 1
+    # SELECT rows are counted in _count_rows; sqlite reports -1 for them here
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    if len(stats.statements) < MAX_STATEMENTS:
+        stats.statements.append(' '.join(statement.split())[:200])
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _count_rows(orm_execute_state):
+    stats = current_stats()
+    if stats is None or not orm_execute_state.is_select:
+        return None
+    options = orm_execute_state.execution_options
+    if options.get('yield_per') or options.get('stream_results'):
+        return None
+    frozen = orm_execute_state.invoke_statement().freeze()
+    stats.rows += len(frozen.data)
+    return frozen()
+
+
+class QueryStatsExtension:
+    def __init__(self):
+        # (endpoint, QueryStats, budget) of requests that went over their view's budget
+        self.violations = []
+
+
+def _start():
+    g.query_stats = QueryStats()
+
+
+def _finish(response):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    response.headers['X-Query-Stats'] = stats.header()
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    over_budget = budget is not None and stats.queries > budget
+    if over_budget:
+        current_app.extensions['query_stats'].violations.append((request.endpoint, stats, budget))
+    if over_budget or stats.queries >= QUERY_STATS_LOG_QUERIES or stats.time_ms >= QUERY_STATS_LOG_MS:
+        label = f' OVER BUDGET ({budget})' if over_budget else ''
+        print(f'[query-stats] {request.method} {request.path} {response.status_code} {stats.header()}{label}')
+        for statement in stats.statements:
+            print(f'    {statement}')
+    return response
+
+
+def init_query_stats(app):
+    """Account SQL per request when app.config['QUERY_STATS'] is set."""
+    if not app.config.setdefault('QUERY_STATS', QUERY_STATS):
+        return
+    app.extensions['query_stats'] = QueryStatsExtension()
+    app.before_request(_start)
+    app.after_request(_finish)
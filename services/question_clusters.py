@@ -0,0 +1,197 @@
+"""
+Offline clustering of near-duplicate unanswered questions (MinHash + LSH).
+
+Each question becomes a set of stemmed words (core.tokenizer), summarised by
+a MinHash signature of NUM_PERM values: the share of equal positions in two
+signatures estimates the Jaccard similarity of the word sets. Signatures are
+cut into BANDS bands of ROWS values; a question is only compared with
+clusters that share at least one band key with it, so the work per question
+does not grow with the number of clusters. With 32 bands of 4 rows, pairs at
+Jaccard 0.5 become candidates with probability 0.87 and pairs at 0.2 with
+0.05.
+
+Clustering is leader-based and incremental: a question joins the most
+similar cluster whose founding signature reaches QUESTION_CLUSTER_THRESHOLD,
+otherwise it founds a new cluster. Only rows with no cluster_id are read, in
+id order and in chunks of QUESTION_CLUSTER_CHUNK_SIZE, each chunk committed
+on its own, so a run over new fallback traffic is cheap and an interrupted
+run simply continues. Band keys of the clusters are stored in
+question_cluster_bands, so nothing but the current chunk is held in memory.
+
+Word hashes are crc32 and the permutations come from a fixed seed, so
+signatures are stable across processes. The NUM_PERM permuted values of a
+word are computed once and cached; a question's signature is then the
+element-wise minimum of its words' vectors.
+
+Run it with `flask cluster-questions`; there must be one run at a time.
+"""
+import random
+import time
+import zlib
+from array import array
+from datetime import datetime
+from operator import eq
+from sqlalchemy import func, insert, update, delete, text
+from core.tokenizer import tokenize, stem
+from config import QUESTION_CLUSTER_THRESHOLD, QUESTION_CLUSTER_CHUNK_SIZE
+from database import db
+from models import UnansweredQuestion, QuestionCluster, QuestionClusterBand
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Permuted vectors kept for this many distinct words (about 5 KiB each)
+WORD_CACHE_SIZE = 20000
+# Keys per IN (...) lookup
+LOOKUP_BATCH = 500
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures are stored, so every process must use the same permutations
+_rng = random.Random(0x5EED)
+PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(NUM_PERM)]
+
+_REFRESH_TOTALS = """
+    UPDATE question_clusters SET
+        size = (SELECT COUNT(*) FROM unanswered_questions q WHERE q.cluster_id = question_clusters.id),
+        times_asked = (SELECT COALESCE(SUM(q.times_asked), 0) FROM unanswered_questions q
+                       WHERE q.cluster_id = question_clusters.id),
+        representative = COALESCE((SELECT q.question FROM unanswered_questions q
+                                   WHERE q.cluster_id = question_clusters.id
+                                   ORDER BY q.times_asked DESC, q.id LIMIT 1), representative),
+        updated_at = :now
+"""
+
+
+def shingles(question: str) -> set:
+    """crc32 hashes of the question's stemmed words (the whole text when it has none)."""
+    words = {stem(w) for w in tokenize(question)}
+    if not words:
+        words = {' '.join((question or '').lower().split())}
+    return {zlib.crc32(w.encode('utf-8')) for w in words}
+
+
+def similarity(a, b) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(map(eq, a, b)) / NUM_PERM
+
+
+def band_keys(signature) -> list:
+    """One key per band: band number in the high bits, crc32 of the band's values below."""
+    return [(band << 32) | zlib.crc32(signature[band * ROWS:(band + 1) * ROWS].tobytes())
+            for band in range(BANDS)]
+
+
+class MinHasher:
+    def __init__(self, cache_size: int = WORD_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._vectors = {}
+
+    def _permuted(self, h):
+        vector = self._vectors.get(h)
+        if vector is None:
+            # a tuple, not an array: min() over array items would box every value again
+            vector = tuple([(a * h + b) % _PRIME for a, b in PERMUTATIONS])
+            if len(self._vectors) >= self.cache_size:
+                self._vectors.clear()
+            self._vectors[h] = vector
+        return vector
+
+    def signature(self, question: str) -> array:
+        vectors = [self._permuted(h) for h in shingles(question)]
+        if len(vectors) == 1:
+            return array('q', vectors[0])
+        return array('q', map(min, *vectors))
+
+
+def _batches(items, size=LOOKUP_BATCH):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _load_candidates(keys):
+    """Stored clusters sharing any of these band keys: ({band key: [cluster ids]}, {cluster id: signature})."""
+    bands, signatures = {}, {}
+    for batch in _batches(keys):
+        rows = db.session.query(QuestionClusterBand.band_key, QuestionClusterBand.cluster_id) \
+            .filter(QuestionClusterBand.band_key.in_(batch)).all()
+        for key, cluster_id in rows:
+            bands.setdefault(key, []).append(cluster_id)
+    cluster_ids = {cid for ids in bands.values() for cid in ids}
+    for batch in _batches(cluster_ids):
+        for cluster_id, blob in db.session.query(QuestionCluster.id, QuestionCluster.signature) \
+                .filter(QuestionCluster.id.in_(batch)):
+            signatures[cluster_id] = array('q', blob)
+    return bands, signatures
+
+
+def reset_clusters():
+    """Drop every cluster so the next run starts over (e.g. after changing the threshold)."""
+    db.session.execute(delete(QuestionClusterBand))
+    db.session.execute(delete(QuestionCluster))
+    db.session.execute(update(UnansweredQuestion).values(cluster_id=None))
+    db.session.commit()
+
+
+def refresh_totals():
+    """Recount cluster sizes and asks, pick the most asked representatives, drop emptied clusters."""
+    db.session.execute(text(_REFRESH_TOTALS), {'now': datetime.utcnow()})
+    empty = db.session.query(QuestionCluster.id).filter(QuestionCluster.size == 0)
+    db.session.execute(delete(QuestionClusterBand).where(QuestionClusterBand.cluster_id.in_(empty.scalar_subquery())))
+    db.session.execute(delete(QuestionCluster).where(QuestionCluster.size == 0))
+    db.session.commit()
+
+
+def cluster_new_questions(threshold: float = None, chunk_size: int = None) -> dict:
+    """Assign every unclustered UnansweredQuestion to a cluster. Returns run counters."""
+    threshold = QUESTION_CLUSTER_THRESHOLD if threshold is None else threshold
+    chunk_size = chunk_size or QUESTION_CLUSTER_CHUNK_SIZE
+    started = time.perf_counter()
+    hasher = MinHasher()
+    stats = {'questions': 0, 'joined': 0, 'new_clusters': 0}
+    next_cluster_id = (db.session.query(func.max(QuestionCluster.id)).scalar() or 0) + 1
+    last_id = 0
+
+    while True:
+        rows = db.session.query(UnansweredQuestion.id, UnansweredQuestion.question) \
+            .filter(UnansweredQuestion.cluster_id.is_(None), UnansweredQuestion.id > last_id) \
+            .order_by(UnansweredQuestion.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        signatures = [hasher.signature(row.question) for row in rows]
+        keys = [band_keys(signature) for signature in signatures]
+        bands, cluster_signatures = _load_candidates({key for row_keys in keys for key in row_keys})
+
+        now = datetime.utcnow()
+        assignments, new_clusters, new_bands = [], [], []
+        for row, signature, row_keys in zip(rows, signatures, keys):
+            best, best_similarity = None, threshold
+            for cluster_id in sorted({cid for key in row_keys for cid in bands.get(key, ())}):
+                score = similarity(signature, cluster_signatures[cluster_id])
+                if score > best_similarity or (best is None and score >= threshold):
+                    best, best_similarity = cluster_id, score
+            if best is None:
+                best = next_cluster_id
+                next_cluster_id += 1
+                cluster_signatures[best] = signature
+                new_clusters.append({'id': best, 'representative': row.question, 'size': 0, 'times_asked': 0,
+                                     'signature': signature.tobytes(), 'created_at': now, 'updated_at': now})
+                for key in row_keys:
+                    bands.setdefault(key, []).append(best)
+                    new_bands.append({'band_key': key, 'cluster_id': best})
+            else:
+                stats['joined'] += 1
+            assignments.append({'id': row.id, 'cluster_id': best})
+
+        if new_clusters:
+            db.session.execute(insert(QuestionCluster), new_clusters)
+            db.session.execute(insert(QuestionClusterBand), new_bands)
+        db.session.execute(update(UnansweredQuestion), assignments)
+        db.session.commit()
+        stats['questions'] += len(rows)
+        stats['new_clusters'] += len(new_clusters)
+
+    refresh_totals()
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
@@ -0,0 +1,148 @@
+"""
+Intent responses rendered once per (site, intent), not once per message.
+
+A response template only depends on the ClientConfig values it references,
+so each site keeps its config and, per intent, the rendered text plus the
+config keys the template names ({key}, {key.attr}, {key[0]}). A reverse map
+{config key: intent ids} makes invalidation exact: when a site's config
+changes (services/tenant_changes.py) its config is reloaded, diffed against
+the copy held here, and only the intents that reference a changed, added
+or removed key are rendered again, right away.
+
+Intent edits need no invalidation: an entry remembers the template it was
+rendered from and is re-rendered (from the held config, no query) the first
+time the intent is used with a different one. Rendering is
+services.response_builder.fill_template, so the text is what build_response
+would produce.
+
+Keys a template references but the site's config lacks (the text keeps the
+{key}) or holds empty are kept per entry and listed by missing_keys() for
+the admin API.
+"""
+import re
+import threading
+from core.tenant_index import tenant_layers
+from services.response_builder import client_config, fill_template
+from services.tenant_changes import on_tenant_change
+
+# Root name of every {field}: also catches what the literal-replace fallback would substitute
+_FIELD = re.compile(r'\{([^{}!:.\[]*)')
+
+_sites = {}
+_lock = threading.Lock()
+
+
+def template_keys(template: str) -> frozenset:
+    """Config keys a response template references."""
+    return frozenset(name for name in _FIELD.findall(template or '') if name)
+
+
+class Rendering:
+    __slots__ = ('intent_name', 'template', 'text', 'keys', 'missing', 'empty')
+
+    def __init__(self, intent_name, template, config):
+        self.intent_name = intent_name
+        self.template = template
+        self.text = fill_template(template, config)
+        self.keys = template_keys(template)
+        self.missing = sorted(self.keys.difference(config))
+        # the importer creates a sector's keys with '' for the admin to fill in
+        self.empty = sorted(key for key in self.keys.intersection(config) if config[key] in ('', None))
+
+
+class SiteRenderings:
+    """One site's config, its rendered responses and the key -> intent dependencies."""
+
+    def __init__(self, config):
+        self.config = config
+        self.entries = {}
+        self.dependents = {}
+
+    def render(self, intent_id, intent_name, template) -> Rendering:
+        entry = Rendering(intent_name, template, self.config)
+        previous = self.entries.get(intent_id)
+        if previous is not None:
+            for key in previous.keys - entry.keys:
+                self.dependents.get(key, set()).discard(intent_id)
+        for key in entry.keys:
+            self.dependents.setdefault(key, set()).add(intent_id)
+        self.entries[intent_id] = entry
+        return entry
+
+    def update_config(self, config) -> int:
+        """Swap in a new config and re-render the intents using a changed key. Returns how many."""
+        changed = {key for key in self.config.keys() | config.keys() if self.config.get(key) != config.get(key)}
+        self.config = config
+        stale = {intent_id for key in changed for intent_id in self.dependents.get(key, ())}
+        for intent_id in stale:
+            entry = self.entries[intent_id]
+            self.render(intent_id, entry.intent_name, entry.template)
+        return len(stale)
+
+
+def _materialize(site_id: int) -> SiteRenderings:
+    """Render every visible intent with a response for the site (one config query)."""
+    site = SiteRenderings(client_config(site_id))
+    for index, hidden in tenant_layers(site_id):
+        for position, record in enumerate(index.intents):
+            if record is not None and position not in hidden and record.response:
+                site.render(record.id, record.intent_name, record.response)
+    return site
+
+
+def _site(site_id: int) -> SiteRenderings:
+    site = _sites.get(site_id)
+    if site is None:
+        with _lock:
+            site = _sites.get(site_id)
+            if site is None:
+                site = _sites[site_id] = _materialize(site_id)
+    return site
+
+
+def _rendering(site_id: int, intent) -> Rendering:
+    site = _site(int(site_id))
+    entry = site.entries.get(intent.id)
+    if entry is None or entry.template != intent.response:
+        with _lock:
+            entry = site.render(intent.id, intent.intent_name, intent.response)
+    return entry
+
+
+def rendered_response(site_id: int, intent) -> str:
+    """The intent's response rendered with the site's config; `intent` needs id, intent_name, response."""
+    if not intent.response:
+        return intent.response
+    return _rendering(site_id, intent).text
+
+
+def missing_keys(site_id: int) -> list:
+    """[{intent_id, intent_name, missing, empty}] for the site's intents whose config keys are absent or blank."""
+    report = []
+    for index, hidden in tenant_layers(int(site_id)):
+        for position, record in enumerate(index.intents):
+            if record is None or position in hidden or not record.response:
+                continue
+            entry = _rendering(site_id, record)
+            if entry.missing or entry.empty:
+                report.append({'intent_id': record.id, 'intent_name': record.intent_name,
+                               'missing': entry.missing, 'empty': entry.empty})
+    return report
+
+
+def invalidate(site_id=None):
+    with _lock:
+        if site_id is None:
+            _sites.clear()
+        else:
+            _sites.pop(site_id, None)
+
+
+@on_tenant_change
+def _on_tenant_change(site_id, intents_changed, config_changed):
+    site = _sites.get(site_id)
+    if site is None or not config_changed:
+        return
+    config = client_config(site_id)
+    with _lock:
+        site.update_config(config)
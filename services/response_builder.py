@@ -1,18 +1,17 @@
 from models import ClientConfig
 
 
-def build_response(template: str, client_id: int):
-    """Render a template replacing {keys} with values from ClientConfig for client_id.
+def client_config(client_id: int) -> dict:
+    """{key: value} of the client's ClientConfig rows."""
+    cfgs = ClientConfig.query.filter_by(client_id=client_id).all()
+    return {c.key: c.value for c in cfgs}
 
-    Safe: missing keys are left as-is.
-    """
+
+def fill_template(template: str, mapping: dict):
+    """Replace {keys} in template with values from mapping. Missing keys are left as-is."""
     if not template:
         return template
 
-    # Load client configs into a dict
-    cfgs = ClientConfig.query.filter_by(client_id=client_id).all()
-    mapping = {c.key: c.value for c in cfgs}
-
     # Simple replacement
     try:
         return template.format(**mapping)
@@ -22,3 +21,13 @@ def build_response(template: str, client_id: int):
         for k, v in mapping.items():
             out = out.replace('{' + k + '}', str(v))
         return out
+
+
+def build_response(template: str, client_id: int):
+    """Render a template replacing {keys} with values from ClientConfig for client_id.
+
+    Safe: missing keys are left as-is.
+    """
+    if not template:
+        return template
+    return fill_template(template, client_config(client_id))
@@ -0,0 +1,167 @@
+"""
+In-process conversation store keyed by (site_id, session_id).
+
+Each session keeps its last SESSION_HISTORY_MAX turns in a fixed-size ring
+buffer (deque with maxlen), so history reads and follow-up context never
+touch the database. Sessions idle for longer than SESSION_IDLE_TTL are
+evicted, and the least recently used sessions are dropped whenever the
+store exceeds SESSION_STORE_MAX_SESSIONS or SESSION_STORE_MAX_BYTES.
+
+The store is per worker process and assumes a session stays on one worker
+(a single worker, or sticky sessions in front of several). Without that,
+a session moving between workers sees only the turns this worker handled
+or seeded from ChatLog when it first saw the session, so history can lag
+behind. A confirmation the bot asked for (pending_intent) therefore only
+counts for SESSION_PENDING_INTENT_TTL seconds: a "yes" arriving here long
+after another worker took newer turns does not confirm a stale intent.
+Chat history itself is always persisted in ChatLog.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from config import (
+    SESSION_HISTORY_MAX, SESSION_IDLE_TTL, SESSION_STORE_MAX_SESSIONS, SESSION_STORE_MAX_BYTES,
+    SESSION_PENDING_INTENT_TTL
+)
+from core.tokenizer import tokenize
+
+# Rough fixed cost of a turn dict and its non-text fields
+TURN_OVERHEAD_BYTES = 240
+
+AFFIRMATIVE_WORDS = {'yes', 'yeah', 'yep', 'yup', 'y', 'correct', 'right', 'sure', 'ok', 'okay', 'exactly'}
+
+
+def is_affirmative(message: str) -> bool:
+    """True for short confirmations such as 'yes', 'yep that's right'."""
+    tokens = tokenize(message)
+    return bool(tokens) and len(tokens) <= 3 and tokens[0] in AFFIRMATIVE_WORDS
+
+
+class SessionState:
+    __slots__ = ('turns', 'pending_intent', 'pending_at', 'last_seen', 'size')
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.pending_intent = None
+        self.pending_at = 0.0
+        self.last_seen = time.monotonic()
+        self.size = 0
+
+
+class SessionStore:
+    """Thread-safe LRU of per-session ring buffers."""
+
+    def __init__(self, max_turns=SESSION_HISTORY_MAX, idle_ttl=SESSION_IDLE_TTL,
+                 max_sessions=SESSION_STORE_MAX_SESSIONS, max_bytes=SESSION_STORE_MAX_BYTES,
+                 pending_ttl=SESSION_PENDING_INTENT_TTL):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.pending_ttl = pending_ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def _touch(self, key, create):
+        state = self._sessions.get(key)
+        if state is None:
+            if not create:
+                return None
+            state = SessionState(self.max_turns)
+            self._sessions[key] = state
+        else:
+            self._sessions.move_to_end(key)
+        state.last_seen = time.monotonic()
+        return state
+
+    def _evict(self):
+        # Oldest-accessed sessions sit at the front of the OrderedDict
+        now = time.monotonic()
+        while self._sessions:
+            key, state = next(iter(self._sessions.items()))
+            expired = now - state.last_seen > self.idle_ttl
+            over = len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            if not (expired or over):
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= state.size
+
+    def contains(self, site_id, session_id):
+        with self._lock:
+            return (site_id, session_id) in self._sessions
+
+    def pending_intent(self, site_id, session_id):
+        """Intent the bot asked the user to confirm on the previous turn, if any and not expired."""
+        with self._lock:
+            state = self._touch((site_id, session_id), create=False)
+            if state is None or time.monotonic() - state.pending_at > self.pending_ttl:
+                return None
+            return state.pending_intent
+
+    def append(self, site_id, session_id, turn: dict, pending_intent=None):
+        """Record a turn; turns beyond max_turns fall off the ring buffer."""
+        size = TURN_OVERHEAD_BYTES + len(turn.get('user_message') or '') + len(turn.get('bot_response') or '')
+        with self._lock:
+            state = self._touch((site_id, session_id), create=True)
+            if len(state.turns) == state.turns.maxlen:
+                dropped = state.turns[0]
+                freed = TURN_OVERHEAD_BYTES + len(dropped.get('user_message') or '') + len(dropped.get('bot_response') or '')
+                state.size -= freed
+                self._bytes -= freed
+            state.turns.append(turn)
+            state.pending_intent = pending_intent
+            state.pending_at = state.last_seen
+            state.size += size
+            self._bytes += size
+            self._evict()
+
+    def seed(self, site_id, session_id, turns):
+        """Fill an unknown session from persisted turns (oldest first); no turns are remembered too."""
+        with self._lock:
+            if (site_id, session_id) in self._sessions:
+                return
+            self._touch((site_id, session_id), create=True)
+            self._evict()
+        for turn in turns:
+            self.append(site_id, session_id, turn)
+
+    def history(self, site_id, session_id, limit=None):
+        with self._lock:
+            state = self._touch((site_id, session_id), create=False)
+            if state is None:
+                return None
+            turns = list(state.turns)
+        return turns[-limit:] if limit else turns
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+
+
+def make_turn(site_id, session_id, user_message, intent_name, confidence, reply, created_at=None):
+    """Turn dict in the same shape as ChatLog.to_dict()."""
+    created_at = created_at or datetime.utcnow()
+    return {
+        'site_id': site_id,
+        'user_message': user_message,
+        'detected_intent': intent_name,
+        'confidence': round(confidence or 0.0, 3),
+        'bot_response': reply,
+        'session_id': session_id,
+        'created_at': created_at.isoformat(),
+        'is_answered': intent_name != 'UNKNOWN'
+    }
+
+
+session_store = SessionStore()
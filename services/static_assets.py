@@ -0,0 +1,122 @@
+"""
+Content-hashed, precompressed widget assets.
+
+The widget files are read once per process, fingerprinted (sha256 prefix)
+and precompressed with gzip and, when the optional `brotli` package is
+installed, brotli. They are served from /assets/<digest>/<name> with
+immutable caching; a changed file gets a new URL.
+
+Customer sites embed the stable /widget.js, which is a tiny loader with a
+short max-age that injects the current versioned bundle. Deploying a new
+widget therefore reaches every site within WIDGET_LOADER_MAX_AGE without
+anyone changing their embed code. Set ASSETS_RELOAD=true while editing the
+widget to pick up changed files without a restart.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from flask import Response, request
+from config import BASE_DIR, ASSETS_RELOAD, WIDGET_LOADER_MAX_AGE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+# Built in order: widget.js references the hashed style.css URL
+WIDGET_ASSETS = ('style.css', 'widget.js')
+MIMETYPES = {'.js': 'application/javascript', '.css': 'text/css'}
+
+LOADER_TEMPLATE = (
+    "(function(){var s=document.currentScript,d=document.createElement('script');"
+    "d.src=(s?new URL(s.src).origin:'')+'%s';d.async=true;"
+    "if(s){for(var i=0;i<s.attributes.length;i++){var a=s.attributes[i];"
+    "if(a.name.indexOf('data-')===0)d.setAttribute(a.name,a.value);}}"
+    "(document.head||document.documentElement).appendChild(d);})();\n"
+)
+
+
+class Asset:
+    __slots__ = ('name', 'mimetype', 'digest', 'encodings', 'mtime')
+
+    def __init__(self, name, body: bytes, mtime=None):
+        self.name = name
+        self.mimetype = MIMETYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.mtime = mtime
+        self.encodings = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=11)
+
+    @property
+    def url(self):
+        return f'/assets/{self.digest}/{self.name}'
+
+
+_assets = {}
+_loader = None
+_lock = threading.Lock()
+
+
+def _stale():
+    for name in WIDGET_ASSETS:
+        asset = _assets.get(name)
+        if asset is None or asset.mtime != os.path.getmtime(os.path.join(STATIC_DIR, name)):
+            return True
+    return False
+
+
+def load_assets(force=False):
+    """Build (or rebuild, with ASSETS_RELOAD when files changed) the asset table."""
+    global _loader
+    if _assets and not force and not (ASSETS_RELOAD and _stale()):
+        return
+    with _lock:
+        built = {}
+        for name in WIDGET_ASSETS:
+            path = os.path.join(STATIC_DIR, name)
+            with open(path, 'rb') as f:
+                body = f.read()
+            for dep, asset in built.items():
+                body = body.replace(f'/static/{dep}'.encode('utf-8'), asset.url.encode('utf-8'))
+            built[name] = Asset(name, body, os.path.getmtime(path))
+        _assets.clear()
+        _assets.update(built)
+        _loader = Asset('widget.js', (LOADER_TEMPLATE % built['widget.js'].url).encode('utf-8'))
+
+
+def get_asset(name):
+    load_assets()
+    return _assets.get(name)
+
+
+def asset_url(name) -> str:
+    asset = get_asset(name)
+    return asset.url if asset else f'/static/{name}'
+
+
+def _negotiate(asset):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.encodings and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+def asset_response(asset, max_age, immutable=False):
+    encoding = _negotiate(asset)
+    response = Response(asset.encodings[encoding], mimetype=asset.mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Cache-Control'] = f'public, max-age={max_age}' + (', immutable' if immutable else '')
+    response.set_etag(f'{asset.digest}-{encoding}')
+    return response.make_conditional(request)
+
+
+def loader_response():
+    load_assets()
+    return asset_response(_loader, WIDGET_LOADER_MAX_AGE)
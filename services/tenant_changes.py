@@ -0,0 +1,237 @@
+"""
+Cross-worker and cross-node change detection for per-site caches.
+
+Every worker keeps caches per site (widget settings, workflow results,
+compiled intent indexes). Writers bump tenant_versions in the same
+transaction as the change (services/tenant_version.bump), which also moves
+the site's row to the next value of a table-wide change_seq.
+
+Each worker runs a VersionWatcher from before_request. At most once per
+TENANT_POLL_INTERVAL seconds it asks for
+
+    SELECT site_id, intents_version, config_version, change_seq
+    FROM tenant_versions WHERE change_seq > :last_seen ORDER BY change_seq
+
+(an index range scan that returns only the sites changed since the last
+poll) and calls the registered listeners for exactly those sites. Caches
+therefore refresh per site within the poll interval and never reload
+everything.
+
+A pub/sub backend only shortens that delay: after a commit that bumped
+versions, the changed site ids are published and subscribers poll on their
+next request. LocalPubSub is the in-process stand-in; set TENANT_PUBSUB_URL
+(and install redis) to notify other processes and nodes. The table stays
+the source of truth, so a lost message costs at most one poll interval.
+
+The same backend carries widget socket pushes (services/chat_channel.py)
+between workers on a second channel: publish_push() hands a message to the
+push subscribers of every other process. Pushes have no table behind them,
+so with LocalPubSub they go nowhere.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from database import db
+from models import TenantVersion
+from config import TENANT_POLL_INTERVAL, TENANT_PUBSUB_URL, TENANT_PUBSUB_CHANNEL
+from services.query_stats import uncounted
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_listeners = []
+
+
+def on_tenant_change(callback):
+    """Register callback(site_id, intents_changed, config_changed). Usable as a decorator."""
+    _listeners.append(callback)
+    return callback
+
+
+def _notify(site_id, intents_changed, config_changed):
+    for callback in list(_listeners):
+        try:
+            callback(site_id, intents_changed, config_changed)
+        except Exception as e:
+            print(f"Tenant change listener {callback.__name__} failed for site {site_id}: {e}")
+
+
+class LocalPubSub:
+    """In-process stand-in for a pub/sub channel: delivers to this process only."""
+
+    def __init__(self):
+        self._subscribers = []
+        self._push_subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def publish(self, site_ids):
+        for callback in list(self._subscribers):
+            callback(site_ids)
+
+    def subscribe_pushes(self, callback):
+        """Register callback(message) for messages publish_push() sent from other processes."""
+        self._push_subscribers.append(callback)
+
+    def publish_push(self, message: dict):
+        """Hand the message to push subscribers in every other process (none here)."""
+
+    def _deliver_push(self, message):
+        for callback in list(self._push_subscribers):
+            callback(message)
+
+    def ensure_listening(self):
+        pass
+
+
+class RedisPubSub(LocalPubSub):
+    """Redis channels carrying comma-separated site ids, and JSON pushes, between processes and nodes."""
+
+    def __init__(self, url, channel):
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self.push_channel = f'{channel}:push'
+        self._thread = None
+        self._pid = None
+
+    @staticmethod
+    def _origin():
+        # Per process: forked workers share everything else
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def publish(self, site_ids):
+        super().publish(site_ids)  # this process does not need the round trip
+        try:
+            self.client.publish(self.channel, ','.join(str(s) for s in sorted(site_ids)))
+        except Exception as e:
+            print(f"Tenant change publish failed (falling back to polling): {e}")
+
+    def publish_push(self, message: dict):
+        try:
+            self.client.publish(self.push_channel, json.dumps({'origin': self._origin(), 'message': message}))
+        except Exception as e:
+            print(f"Push publish failed (delivered on this worker only): {e}")
+
+    def ensure_listening(self):
+        # Listener threads do not survive fork, so start one per process on first use
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._listen, name='tenant-changes', daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        origin = self._origin()
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel, self.push_channel)
+                for message in pubsub.listen():
+                    data = message.get('data') or b''
+                    channel = message.get('channel')
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    if channel == self.push_channel:
+                        push = json.loads(data)
+                        # the publishing process delivered it itself
+                        if push.get('origin') != origin:
+                            self._deliver_push(push['message'])
+                        continue
+                    site_ids = {int(s) for s in data.split(b',') if s}
+                    super().publish(site_ids)
+            except Exception as e:
+                print(f"Tenant change subscriber disconnected: {e}")
+                time.sleep(1)
+
+
+class VersionWatcher:
+    """Polls tenant_versions by change_seq and notifies listeners per changed site."""
+
+    def __init__(self, interval=TENANT_POLL_INTERVAL, pubsub=None):
+        self.interval = interval
+        self.pubsub = pubsub or LocalPubSub()
+        self.pubsub.subscribe(self.poke)
+        self.last_seq = None
+        self.versions = {}
+        self.polls = 0
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def poke(self, site_ids=None):
+        """Poll on the next request instead of waiting for the interval."""
+        self._next_poll = 0.0
+
+    def maybe_poll(self):
+        """before_request hook: cheap time check, at most one poller per process."""
+        if time.monotonic() < self._next_poll:
+            return
+        self.pubsub.ensure_listening()
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_poll = time.monotonic() + self.interval
+            # Work for the whole process, not the request it happens to run in
+            with uncounted():
+                self.poll()
+        except Exception as e:
+            print(f"Tenant version poll failed: {e}")
+        finally:
+            self._lock.release()
+
+    def poll(self) -> list:
+        """Notify listeners for sites changed since the last poll. Returns their ids."""
+        table = TenantVersion.__table__
+        self.polls += 1
+        if self.last_seq is None:
+            # First poll in this process: nothing is cached yet, just take the baseline
+            self.last_seq = db.session.execute(select(func.max(table.c.change_seq))).scalar() or 0
+            return []
+        rows = db.session.execute(
+            select(table.c.site_id, table.c.intents_version, table.c.config_version, table.c.change_seq)
+            .where(table.c.change_seq > self.last_seq)
+            .order_by(table.c.change_seq)
+        ).all()
+        changed = []
+        for site_id, intents_version, config_version, change_seq in rows:
+            previous = self.versions.get(site_id)
+            self.versions[site_id] = (intents_version, config_version)
+            self.last_seq = change_seq
+            changed.append(site_id)
+            _notify(
+                site_id,
+                previous is None or previous[0] != intents_version,
+                previous is None or previous[1] != config_version
+            )
+        return changed
+
+
+def _make_pubsub():
+    if TENANT_PUBSUB_URL:
+        if redis is None:
+            print("TENANT_PUBSUB_URL is set but redis is not installed; using polling only")
+        else:
+            return RedisPubSub(TENANT_PUBSUB_URL, TENANT_PUBSUB_CHANNEL)
+    return LocalPubSub()
+
+
+watcher = VersionWatcher(pubsub=_make_pubsub())
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed_changes(session):
+    site_ids = session.info.pop('changed_sites', None)
+    if site_ids:
+        watcher.pubsub.publish(site_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_changes(session):
+    session.info.pop('changed_sites', None)
@@ -0,0 +1,48 @@
+"""
+Tenant version stamps.
+
+Every writer that changes a site's intents, phrases or config calls bump()
+before committing, so the version moves atomically with the data. Readers
+use get_versions() (one primary-key lookup) to build ETags and to decide
+whether a cached copy of the tenant's data is still current.
+
+bump() also advances the row's change_seq, which is how other workers and
+nodes learn about the change (services/tenant_changes.py), and marks the
+site on the session so a pub/sub notification goes out after the commit.
+"""
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import db
+from models import TenantVersion
+import services.tenant_changes  # noqa: F401 (publishes bumped sites after commit)
+
+
+def bump(site_id: int, intents: bool = False, config: bool = False):
+    """Increment the site's version counters (not committed)."""
+    table = TenantVersion.__table__
+    now = datetime.utcnow()
+    # SQLite serialises writers, so MAX + 1 inside the write is a safe sequence
+    next_seq = select(func.coalesce(func.max(table.c.change_seq), 0) + 1).scalar_subquery()
+    stmt = sqlite_insert(table).values(
+        site_id=site_id, intents_version=int(intents), config_version=int(config),
+        change_seq=next_seq, updated_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['site_id'],
+        set_={
+            'intents_version': table.c.intents_version + int(intents),
+            'config_version': table.c.config_version + int(config),
+            'change_seq': next_seq,
+            'updated_at': now
+        }
+    )
+    db.session.execute(stmt)
+    db.session.info.setdefault('changed_sites', set()).add(site_id)
+
+
+def get_versions(site_id: int) -> tuple:
+    """(intents_version, config_version) for a site; (0, 0) if it never changed."""
+    row = db.session.query(TenantVersion.intents_version, TenantVersion.config_version) \
+        .filter(TenantVersion.site_id == site_id).first()
+    return (row[0], row[1]) if row else (0, 0)
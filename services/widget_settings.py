@@ -0,0 +1,97 @@
+"""
+Per-site widget branding, cached in-process.
+
+/api/widget-settings is fetched on every page view of every customer site,
+so the rendered payload, its ETag and Last-Modified are kept per site_id for
+WIDGET_SETTINGS_CACHE_TTL seconds and the database is hit at most once per
+site per TTL per worker. A config change for the site drops its entry early
+(services/tenant_changes.py).
+
+site_id comes from the page, so any number can arrive: sites without their
+own branding (unknown ids included) share the one default entry, and the
+cache is an LRU of at most WIDGET_SETTINGS_CACHE_MAX_SITES ids.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from models import BrandingSettings
+from services.tenant_changes import on_tenant_change
+from config import WIDGET_SETTINGS_CACHE_TTL, WIDGET_SETTINGS_CACHE_MAX_SITES
+
+_cache = OrderedDict()  # site_id (None: the default branding) -> WidgetSettings
+_lock = threading.Lock()
+
+
+class WidgetSettings:
+    __slots__ = ('payload', 'body', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, payload, last_modified, ttl):
+        self.payload = payload
+        self.body = json.dumps(payload, sort_keys=True)
+        self.etag = hashlib.sha1(self.body.encode('utf-8')).hexdigest()[:16]
+        self.last_modified = last_modified
+        self.expires = time.monotonic() + ttl
+
+
+def _settings(branding) -> WidgetSettings:
+    if branding is None:
+        return WidgetSettings({}, None, WIDGET_SETTINGS_CACHE_TTL)
+    return WidgetSettings(branding.to_dict(), branding.updated_at, WIDGET_SETTINGS_CACHE_TTL)
+
+
+def _cached(site_id):
+    with _lock:
+        entry = _cache.get(site_id)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del _cache[site_id]
+            return None
+        _cache.move_to_end(site_id)
+        return entry
+
+
+def _store(site_id, entry):
+    with _lock:
+        _cache[site_id] = entry
+        _cache.move_to_end(site_id)
+        while len(_cache) > WIDGET_SETTINGS_CACHE_MAX_SITES:
+            _cache.popitem(last=False)
+
+
+def _default() -> WidgetSettings:
+    entry = _cached(None)
+    if entry is None:
+        entry = _settings(BrandingSettings.query.filter(BrandingSettings.site_id.is_(None)).first())
+        _store(None, entry)
+    return entry
+
+
+def get_widget_settings(site_id) -> WidgetSettings:
+    entry = _cached(site_id)
+    if entry is not None:
+        return entry
+    if site_id is None:
+        return _default()
+    branding = BrandingSettings.query.filter_by(site_id=site_id).first()
+    # No branding of its own (or no such site): the shared default entry, not a copy
+    entry = _settings(branding) if branding is not None else _default()
+    _store(site_id, entry)
+    return entry
+
+
+def invalidate(site_id=None):
+    """Drop cached settings for one site, or all sites (e.g. after the default branding changed)."""
+    with _lock:
+        if site_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(site_id, None)
+
+
+@on_tenant_change
+def _on_tenant_change(site_id, intents_changed, config_changed):
+    if config_changed:
+        invalidate(site_id)
@@ -12,6 +12,8 @@
     
     // API CONFIGURATION
     const API_URL = "http://localhost:5000"; 
+    // Session continuity: the server returns a session_id on the first reply
+    const SESSION_KEY = `chatbot_session_${siteId}`;
 
     // 2. Main Initialization Function
     function initWidget() {
@@ -83,6 +85,233 @@
             div.innerHTML = `<div class="message-content">${text}</div>`;
             messages.appendChild(div);
             messages.scrollTop = messages.scrollHeight;
+            return div.firstChild;
+        }
+
+        function chatBody(text) {
+            return JSON.stringify({
+                site_id: siteId,
+                message: text,
+                session_id: localStorage.getItem(SESSION_KEY)
+            });
+        }
+
+        // Edge bundle: the site's busiest static answers (GET /api/edge-bundle). A message whose
+        // token set is exactly one of the bundle's phrase keys is answered here, without a round
+        // trip; the hits are reported in batches so the chat logs and analytics stay complete.
+        let edgeBundle = null;
+        let edgeStopWords = null;
+        let edgeHits = [];
+        let edgeFlushTimer = null;
+        const EDGE_FLUSH_MS = 5000;
+        const EDGE_FLUSH_SIZE = 20;
+
+        fetch(`${apiUrl}/api/edge-bundle?site_id=${encodeURIComponent(siteId)}`)
+            .then(res => res.ok ? res.json() : null)
+            .then(bundle => {
+                if (!bundle) return;
+                edgeStopWords = new Set(bundle.stop_words);
+                edgeBundle = bundle;
+            })
+            .catch(() => {});
+
+        // Same as core/tokenizer.py: lowercase, punctuation to spaces, no stop words
+        function edgeKey(text) {
+            const words = text.toLowerCase().replace(/[^\p{L}\p{N}_\s]/gu, ' ').split(/\s+/)
+                .filter(w => w && !edgeStopWords.has(w));
+            return [...new Set(words)].sort().join(' ');
+        }
+
+        function flushEdgeHits() {
+            clearTimeout(edgeFlushTimer);
+            edgeFlushTimer = null;
+            if (!edgeHits.length) return;
+            const now = Date.now();
+            const hits = edgeHits.map(hit => ({ ...hit, age_ms: now - hit.at, at: undefined }));
+            edgeHits = [];
+            // text/plain keeps this a simple request (no preflight); keepalive lets it outlive the page
+            fetch(`${apiUrl}/api/chat/edge-hits`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'text/plain' },
+                body: JSON.stringify({ site_id: siteId, hits: hits }),
+                keepalive: true
+            }).catch(() => {});
+        }
+        window.addEventListener('pagehide', flushEdgeHits);
+
+        function edgeMessage(text) {
+            if (!edgeBundle) return false;
+            const match = edgeBundle.phrases[edgeKey(text)];
+            if (!match) return false;
+            const intent = edgeBundle.intents[match[0]];
+            let session = localStorage.getItem(SESSION_KEY);
+            if (!session && window.crypto && crypto.randomUUID) {
+                session = crypto.randomUUID();
+                localStorage.setItem(SESSION_KEY, session);
+            }
+            if (!session) return false;
+            appendMessage(intent.reply, false);
+            edgeHits.push({ session_id: session, message: text, intent_id: intent.id,
+                            confidence: match[1], at: Date.now() });
+            if (edgeHits.length >= EDGE_FLUSH_SIZE) flushEdgeHits();
+            else if (!edgeFlushTimer) edgeFlushTimer = setTimeout(flushEdgeHits, EDGE_FLUSH_MS);
+            return true;
+        }
+
+        // Persistent socket, when the server has one: the site is checked and the session kept
+        // server-side once per connection, and the server can push (e.g. handoff status)
+        let socketReady = null;
+        let socketUnavailable = false;
+        let nextFrameId = 1;
+        const pendingFrames = {};
+
+        function openSocket() {
+            if (socketReady) return socketReady;
+            if (socketUnavailable || !window.WebSocket) return Promise.resolve(null);
+            socketReady = new Promise(resolve => {
+                const session = localStorage.getItem(SESSION_KEY);
+                let url = `${apiUrl.replace(/^http/, 'ws')}/ws/chat?site_id=${encodeURIComponent(siteId)}`;
+                if (session) url += `&session_id=${encodeURIComponent(session)}`;
+                let opened = false;
+                let ws;
+                try {
+                    ws = new WebSocket(url);
+                } catch (e) {
+                    socketUnavailable = true;
+                    resolve(null);
+                    return;
+                }
+
+                ws.onmessage = (e) => {
+                    const frame = JSON.parse(e.data);
+                    const entry = pendingFrames[frame.id];
+                    if (frame.type === 'ready') {
+                        opened = true;
+                        localStorage.setItem(SESSION_KEY, frame.session_id);
+                        resolve(ws);
+                    } else if (frame.type === 'push') {
+                        if (frame.data && frame.data.message) appendMessage(frame.data.message, false);
+                    } else if (!entry) {
+                        return;
+                    } else if (frame.type === 'intent' && frame.working) {
+                        entry.bubble.innerHTML = 'Working on it…';
+                    } else if (frame.type === 'reply') {
+                        delete pendingFrames[frame.id];
+                        entry.bubble.innerHTML = frame.reply;
+                        entry.resolve(true);
+                    } else if (frame.type === 'error') {
+                        delete pendingFrames[frame.id];
+                        entry.reject(new Error(frame.error));
+                    }
+                    messages.scrollTop = messages.scrollHeight;
+                };
+
+                ws.onclose = () => {
+                    // Never opened (no socket support, or refused): stop trying for this page
+                    if (!opened) socketUnavailable = true;
+                    socketReady = null;
+                    resolve(null);
+                    Object.keys(pendingFrames).forEach(id => {
+                        pendingFrames[id].reject(new Error('Connection lost'));
+                        delete pendingFrames[id];
+                    });
+                };
+            });
+            return socketReady;
+        }
+
+        async function socketMessage(text) {
+            const ws = await openSocket();
+            if (!ws) return false;
+            const id = nextFrameId++;
+            const bubble = appendMessage('…', false);
+            return new Promise((resolve, reject) => {
+                pendingFrames[id] = {
+                    bubble,
+                    resolve,
+                    reject: (err) => { bubble.parentNode.remove(); reject(err); }
+                };
+                ws.send(JSON.stringify({ type: 'message', id, message: text }));
+            });
+        }
+
+        // Blocking variant: one JSON reply once everything has finished
+        async function postMessage(text) {
+            const res = await fetch(`${apiUrl}/api/chat`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: chatBody(text)
+            });
+
+            if (!res.ok) {
+                const errData = await res.json();
+                throw new Error(errData.error || `Server Error ${res.status}`);
+            }
+
+            const data = await res.json();
+            if (data.session_id) localStorage.setItem(SESSION_KEY, data.session_id);
+            appendMessage(data.reply, false);
+        }
+
+        // Streaming variant (Server-Sent Events over fetch): a typing bubble right away,
+        // filled in when the reply event arrives. Returns false when streaming is unavailable.
+        async function streamMessage(text) {
+            if (!window.ReadableStream || !window.TextDecoder) return false;
+            const res = await fetch(`${apiUrl}/api/chat/stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: chatBody(text)
+            });
+            if (res.status === 404 || res.status === 405) return false;
+            if (!res.ok) {
+                const errData = await res.json();
+                throw new Error(errData.error || `Server Error ${res.status}`);
+            }
+
+            const bubble = appendMessage('…', false);
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let replied = false;
+
+            function handle(block) {
+                let event = 'message', data = '';
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (!data) return;
+                const payload = JSON.parse(data);
+                if (event === 'ack' && payload.session_id) {
+                    localStorage.setItem(SESSION_KEY, payload.session_id);
+                } else if (event === 'intent' && payload.working) {
+                    bubble.innerHTML = 'Working on it…';
+                } else if (event === 'reply') {
+                    bubble.innerHTML = payload.reply;
+                    replied = true;
+                } else if (event === 'error') {
+                    throw new Error(payload.error);
+                }
+                messages.scrollTop = messages.scrollHeight;
+            }
+
+            try {
+                for (;;) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) !== -1) {
+                        handle(buffer.slice(0, end));
+                        buffer = buffer.slice(end + 2);
+                    }
+                }
+                if (!replied) throw new Error('No reply received');
+            } catch (err) {
+                bubble.parentNode.remove();
+                throw err;
+            }
+            return true;
         }
 
         async function sendMessage() {
@@ -93,23 +322,8 @@
             input.value = '';
 
             try {
-                const res = await fetch(`${apiUrl}/api/chat`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        site_id: siteId,
-                        message: text
-                    })
-                });
-
-                if (!res.ok) {
-                    const errData = await res.json();
-                    throw new Error(errData.error || `Server Error ${res.status}`);
-                }
-
-                const data = await res.json();
-                appendMessage(data.reply, false);
-
+                if (edgeMessage(text)) return;
+                if (!(await socketMessage(text)) && !(await streamMessage(text))) await postMessage(text);
             } catch (err) {
                 console.error("Chat Error:", err);
                 appendMessage("⚠️ Error: " + err.message, false);
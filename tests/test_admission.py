@@ -0,0 +1,177 @@
+"""Admission control: token-bucket refill, load-level transitions, deferred chat logs."""
+import time
+from datetime import datetime
+
+import pytest
+
+from services import admission as admission_module
+from services import chat_service
+from services.admission import (
+    AdmissionController, LocalBuckets, NORMAL, SKIP_EMBEDDINGS, DEFER_LOGGING, SHED, retry_after_header
+)
+from services.chat_service import DeferredLogs
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission_module, 'time', clock)
+    return clock
+
+
+def _controller(**kwargs):
+    options = dict(buckets=LocalBuckets(rate=100, burst=100), max_inflight=4, max_per_site=4,
+                   skip_embeddings_at=0.5, defer_logging_at=0.75, min_level=NORMAL)
+    options.update(kwargs)
+    return AdmissionController(**options)
+
+
+def test_bucket_refills_at_the_rate_up_to_the_burst(clock):
+    buckets = LocalBuckets(rate=2, burst=3)
+    assert [buckets.take(1) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take(1) == pytest.approx(0.5)
+    # other sites have their own bucket
+    assert buckets.take(2) == 0.0
+
+    clock.now += 0.25
+    assert buckets.take(1) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert buckets.take(1) == 0.0
+
+    # a long idle spell refills no more than the burst
+    clock.now += 60
+    assert [buckets.take(1) for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_rate_limited_messages_give_their_slot_back(clock):
+    controller = _controller(buckets=LocalBuckets(rate=1, burst=1))
+    first = controller.admit(1)
+    refused = controller.admit(1)
+    assert first.admitted and not refused.admitted
+    assert (refused.reason, retry_after_header(refused)) == ('rate_limited', '1')
+    assert controller.stats()['inflight'] == 1
+    controller.release(first)
+    assert controller.stats()['counters'] == {'admitted': 1, 'rate_limited': 1, 'site_busy': 0, 'shed': 0}
+
+
+def test_levels_follow_the_messages_in_flight():
+    controller = _controller()
+    tickets = [controller.admit(site_id) for site_id in (1, 2, 3, 4)]
+    assert [ticket.level for ticket in tickets] == [NORMAL, NORMAL, SKIP_EMBEDDINGS, DEFER_LOGGING]
+    assert [ticket.use_embeddings for ticket in tickets] == [True, True, False, False]
+    assert [ticket.defer_logging for ticket in tickets] == [False, False, False, True]
+
+    shed = controller.admit(5)
+    assert (shed.admitted, shed.reason, shed.level) == (False, 'shed', SHED)
+    assert controller.level() == SHED
+
+    controller.release(tickets[0])
+    controller.release(tickets[0])  # releasing twice frees one slot
+    assert controller.level() == DEFER_LOGGING
+    for ticket in tickets[1:]:
+        controller.release(ticket)
+    assert controller.level() == NORMAL
+    assert controller.stats()['degraded'] == {'skip_embeddings': 1, 'defer_logging': 1}
+
+
+def test_open_sockets_do_not_raise_the_level():
+    controller = _controller()
+    for _ in range(10):
+        controller.open_socket()
+    assert controller.level() == NORMAL
+    assert controller.admit(1).level == NORMAL
+    assert controller.stats()['open_sockets'] == 10
+
+
+def test_one_site_cannot_take_every_slot():
+    controller = _controller(max_per_site=2)
+    held = [controller.admit(1), controller.admit(1)]
+    busy = controller.admit(1)
+    assert (busy.admitted, busy.reason) == (False, 'site_busy')
+    assert controller.admit(2).admitted
+
+    controller.release(held[0])
+    assert controller.admit(1).admitted
+    assert controller.stats()['busiest_sites'] == [(1, 2), (2, 1)]
+
+
+def test_min_level_degrades_an_idle_worker():
+    controller = _controller(min_level=SKIP_EMBEDDINGS)
+    ticket = controller.admit(1)
+    assert ticket.level == SKIP_EMBEDDINGS and not ticket.use_embeddings
+
+
+def _row(n):
+    return chat_service._log_row(1, 's1', f'message {n}', 'greeting', 0.9, 'Hi!', datetime(2026, 6, 1))
+
+
+def test_deferred_logs_are_capped_and_flushed_in_bulk(app, db_session):
+    from models import ChatLog
+
+    deferred = DeferredLogs(max_rows=2, interval=3600)
+    assert [deferred.add(_row(n)) for n in range(3)] == [True, True, False]
+    assert len(deferred) == 2
+    assert ChatLog.query.count() == 0
+
+    assert deferred.flush() == 2
+    assert len(deferred) == 0
+    assert [row.user_message for row in ChatLog.query.order_by(ChatLog.id)] == ['message 0', 'message 1']
+    assert deferred.flush() == 0
+
+
+def test_failed_flush_keeps_the_rows(app, db_session, monkeypatch):
+    from models import ChatLog
+
+    def fail(rows):
+        raise RuntimeError('database is locked')
+
+    deferred = DeferredLogs(max_rows=3, interval=3600)
+    deferred.add(_row(0))
+    monkeypatch.setattr(chat_service, '_write_logs', fail)
+    assert deferred.flush() == 0
+    assert len(deferred) == 1
+
+    monkeypatch.undo()
+    assert deferred.flush_at_exit(app) == 1
+    assert ChatLog.query.count() == 1
+
+
+def test_flusher_waits_for_the_pressure_to_drop(app, db_session, monkeypatch):
+    from models import ChatLog
+
+    controller = _controller(min_level=DEFER_LOGGING)
+    monkeypatch.setattr(chat_service, 'admission', controller)
+    deferred = DeferredLogs(interval=0.01)
+    deferred.add(_row(0))
+
+    time.sleep(0.1)
+    assert len(deferred) == 1
+
+    controller.min_level = NORMAL
+    # the flusher takes the rows before it commits them, so wait for the table
+    deadline = time.monotonic() + 5
+    while ChatLog.query.count() == 0 and time.monotonic() < deadline:
+        db_session.remove()
+        time.sleep(0.01)
+    assert ChatLog.query.count() == 1
+    assert len(deferred) == 0
+
+
+def test_chat_defers_its_log_under_load(client, app, monkeypatch):
+    from models import ChatLog
+
+    monkeypatch.setattr(admission_module.admission, 'min_level', DEFER_LOGGING)
+    response = client.post('/api/chat', json={'site_id': 1, 'message': 'hello there', 'session_id': 's1'})
+    assert response.status_code == 200
+    with app.app_context():
+        assert ChatLog.query.count() == 0
+        assert chat_service.deferred_logs.flush() == 1
+        assert ChatLog.query.count() == 1
@@ -0,0 +1,115 @@
+"""Chat and admin endpoints through the conftest fixtures (query budgets enforced by `client`)."""
+from pathlib import Path
+
+pytest_plugins = ['pytester']
+
+_CONFTEST = Path(__file__).resolve().parents[1] / 'conftest.py'
+
+
+def _login(client, site_id=1):
+    with client.session_transaction() as s:
+        s['admin_id'] = 1
+        s['site_id'] = site_id
+
+
+def _chat(client, message, site_id=1):
+    return client.post('/api/chat', json={'site_id': site_id, 'message': message, 'session_id': 'test-session'})
+
+
+def test_chat_replies_and_validates(client):
+    response = _chat(client, 'hello there')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['reply'] and body['session_id'] == 'test-session'
+    assert 'queries=' in response.headers['X-Query-Stats']
+
+    assert _chat(client, '').status_code == 400
+    assert _chat(client, 'hello', site_id=999).status_code == 404
+    assert client.post('/api/chat', json={'message': 'hello'}).status_code == 400
+
+
+def test_stream_chat_sends_events_and_releases_its_ticket(client):
+    from services.admission import admission
+
+    response = client.post('/api/chat/stream', json={'site_id': 1, 'message': 'hello there', 'session_id': 's'})
+    assert response.status_code == 200
+    events = [line.split(': ', 1)[1] for line in response.get_data(as_text=True).splitlines()
+              if line.startswith('event: ')]
+    assert events[0] == 'ack' and events[-1] == 'reply'
+    # The server closes the response once the client has it, which gives the ticket back
+    response.close()
+    assert client.post('/api/chat/stream', json={'site_id': 999, 'message': 'hello'}).status_code == 404
+    assert admission.stats()['inflight'] == 0
+
+
+def test_admin_intent_round_trip(client):
+    assert client.get('/admin/api/client/intents').status_code == 401
+    _login(client)
+
+    response = client.post('/admin/api/client/intents', json={
+        'intent_name': 'opening_hours', 'intent_type': 'info', 'confidence': 1.0,
+        'response': 'We open at 9.', 'phrases': ['opening hours', 'when do you open']
+    })
+    assert response.status_code == 201
+    intent_id = response.get_json()['intent']['id']
+    assert _chat(client, 'what are your opening hours').get_json()['reply'] == 'We open at 9.'
+
+    listing = client.get('/admin/api/client/intents').get_json()
+    assert [(i['id'], i['intent_name']) for i in listing['intents']] == [(intent_id, 'opening_hours')]
+    assert sorted(listing['intents'][0]['phrases']) == ['opening hours', 'when do you open']
+
+    # Edits reach the compiled index without a rebuild
+    assert client.put(f'/admin/api/client/intents/{intent_id}', json={'response': 'We open at 8.'}).status_code == 200
+    response = client.post(f'/admin/api/client/intents/{intent_id}/phrases', json={'phrase': 'what time is the door unlocked'})
+    assert response.status_code == 201
+    assert _chat(client, 'what time is the door unlocked').get_json()['reply'] == 'We open at 8.'
+
+    assert client.delete(f'/admin/api/client/intents/{intent_id}').status_code == 200
+    assert client.get('/admin/api/client/intents').get_json()['intents'] == []
+    assert _chat(client, 'what time is the door unlocked').get_json()['intent'] != 'opening_hours'
+    assert client.delete(f'/admin/api/client/intents/{intent_id}').status_code == 404
+
+
+def test_intents_of_other_sites_are_not_editable(client, db_session):
+    from models import Site
+
+    db_session.add(Site(name='Other', domain='other.example', bot_name='Other Bot'))
+    db_session.commit()
+    _login(client, site_id=2)
+    intent_id = client.post('/admin/api/client/intents', json={'intent_name': 'theirs'}).get_json()['intent']['id']
+
+    _login(client, site_id=1)
+    assert client.put(f'/admin/api/client/intents/{intent_id}', json={'response': 'x'}).status_code == 404
+    assert client.delete(f'/admin/api/client/intents/{intent_id}').status_code == 404
+
+
+def test_client_fails_requests_over_their_query_budget(pytester):
+    # A copy of the real fixtures, so the inner run fails exactly the way a real test would
+    pytester.makeconftest(_CONFTEST.read_text())
+    pytester.makepyfile('''
+        from services.query_stats import query_budget
+
+        def test_over_budget(app, client):
+            from models import Site
+
+            @query_budget(1)
+            def three_queries():
+                return str(Site.query.count() + Site.query.count() + Site.query.count())
+
+            app.add_url_rule('/three-queries', 'three_queries', three_queries)
+            assert client.get('/three-queries').status_code == 200
+
+        def test_within_budget(app, client):
+            from models import Site
+
+            @query_budget(3)
+            def one_query():
+                return str(Site.query.count())
+
+            app.add_url_rule('/one-query', 'one_query', one_query)
+            assert client.get('/one-query').status_code == 200
+    ''')
+    result = pytester.runpytest_inprocess('-p', 'no:cacheprovider')
+    # the over-budget test itself passes; the client fixture fails it at teardown
+    result.assert_outcomes(passed=2, errors=1)
+    result.stdout.fnmatch_lines(['*Query budget exceeded:*', '*three_queries: 3 queries, budget 1*'])
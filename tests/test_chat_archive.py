@@ -0,0 +1,101 @@
+"""Chat log archiving: idempotent runs, resuming an interrupted run, rows archived late."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import chat_archive
+from services.chat_archive import archive_site, iter_chat_logs, load_manifest
+
+NOW = datetime(2026, 6, 1)
+
+
+@pytest.fixture
+def logs(app, db_session, tmp_path, monkeypatch):
+    from models import ChatLog
+
+    monkeypatch.setattr(chat_archive, 'CHAT_ARCHIVE_DIR', str(tmp_path / 'archive'))
+
+    def add(days_ago, site_id=1, message='hello'):
+        row = ChatLog(site_id=site_id, user_message=message, detected_intent='greeting', confidence=0.9,
+                      bot_response='Hi!', session_id='s1', created_at=NOW - timedelta(days=days_ago))
+        db_session.add(row)
+        db_session.commit()
+        return row.id
+
+    return add
+
+
+def _live_ids(site_id=1):
+    from models import ChatLog
+    return sorted(row.id for row in ChatLog.query.filter_by(site_id=site_id))
+
+
+def _ids(records):
+    return [record['id'] for record in records]
+
+
+def test_archive_moves_old_rows_and_is_idempotent(logs):
+    old = [logs(days) for days in (100, 70, 40)]
+    recent = logs(1)
+    other_site = logs(100, site_id=2)
+
+    assert archive_site(1, NOW - timedelta(days=30), batch_size=2) == 3
+    assert _live_ids() == [recent]
+    assert _live_ids(2) == [other_site]
+    segments = load_manifest(1)['segments']
+    assert sorted(s['rows'] for s in segments) == [1, 1, 1]
+    assert all('ids' not in s for s in segments)
+
+    assert archive_site(1, NOW - timedelta(days=30)) == 0
+    assert len(load_manifest(1)['segments']) == 3
+    assert _ids(iter_chat_logs(1)) == old + [recent]
+
+
+def test_interrupted_run_is_finished_without_duplicates(logs, monkeypatch):
+    old = [logs(days) for days in (100, 40)]
+    recent = logs(1)
+
+    # Crash after the segments and manifest are written, before anything is deleted
+    def crash(*args, **kwargs):
+        raise RuntimeError('killed')
+    with monkeypatch.context() as m, pytest.raises(RuntimeError):
+        m.setattr(chat_archive.db.session, 'commit', crash)
+        archive_site(1, NOW - timedelta(days=30))
+    chat_archive.db.session.rollback()
+
+    assert sorted(i for s in load_manifest(1)['segments'] for lo, hi in s['ids'] for i in range(lo, hi + 1)) == old
+    # Archived and still live, the rows are read once
+    assert _ids(iter_chat_logs(1)) == old + [recent]
+
+    assert archive_site(1, NOW - timedelta(days=30)) == 0
+    assert _live_ids() == [recent]
+    assert sum(s['rows'] for s in load_manifest(1)['segments']) == 2
+    assert _ids(iter_chat_logs(1)) == old + [recent]
+
+
+def test_rows_with_lower_ids_and_later_dates_are_archived_not_dropped(logs):
+    late = logs(20, message='written late, dated recently')
+    archived = logs(50)
+    # A row with a lower id than an archived one, still within the hot window
+    assert archive_site(1, NOW - timedelta(days=30)) == 1
+    assert _live_ids() == [late]
+
+    backdated = logs(80, message='reported late, backdated')
+    # The next run finds both: the new row below the cutoff, the old one once it ages out
+    assert archive_site(1, NOW - timedelta(days=10)) == 2
+    assert _live_ids() == []
+    assert [r['user_message'] for r in iter_chat_logs(1)] == [
+        'written late, dated recently', 'hello', 'reported late, backdated']
+    assert _ids(iter_chat_logs(1)) == [late, archived, backdated]
+
+
+def test_reads_merge_segments_and_live_rows_by_id(logs):
+    ids = [logs(days) for days in (70, 100, 5, 40, 2)]
+    archive_site(1, NOW - timedelta(days=30))
+    assert _live_ids() == [ids[2], ids[4]]
+
+    assert _ids(iter_chat_logs(1)) == ids
+    for i, after in enumerate(ids):
+        assert _ids(iter_chat_logs(1, after_id=after)) == ids[i + 1:]
+    window = _ids(iter_chat_logs(1, start=NOW - timedelta(days=80), end=NOW - timedelta(days=3)))
+    assert window == [ids[0], ids[2], ids[3]]
@@ -0,0 +1,87 @@
+"""Chat log exports: chunked NDJSON/CSV and resuming with ?cursor=."""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import chat_archive
+from services.chat_export import CSV_COLUMNS, export_csv, export_ndjson
+
+NOW = datetime(2026, 6, 1)
+
+
+@pytest.fixture
+def logs(app, db_session, tmp_path, monkeypatch):
+    from models import ChatLog
+
+    monkeypatch.setattr(chat_archive, 'CHAT_ARCHIVE_DIR', str(tmp_path / 'archive'))
+
+    def add(count, days_ago=1, site_id=1):
+        rows = [ChatLog(site_id=site_id, user_message=f'message {i}', detected_intent='greeting', confidence=0.9,
+                        bot_response='Hi, "there"', session_id='s1', created_at=NOW - timedelta(days=days_ago))
+                for i in range(count)]
+        db_session.add_all(rows)
+        db_session.commit()
+        return [row.id for row in rows]
+
+    return add
+
+
+def _ndjson_ids(body):
+    return [json.loads(line)['id'] for line in body.splitlines()]
+
+
+def test_ndjson_is_chunked_and_resumes_after_the_cursor(logs):
+    ids = logs(7)
+    logs(2, site_id=2)
+
+    chunks = list(export_ndjson(1, chunk_rows=3))
+    assert [len(chunk.splitlines()) for chunk in chunks] == [3, 3, 1]
+    assert _ndjson_ids(''.join(chunks)) == ids
+
+    # a client that received the first chunk resumes after its last id
+    received = _ndjson_ids(chunks[0])
+    rest = ''.join(export_ndjson(1, cursor=received[-1], chunk_rows=3))
+    assert received + _ndjson_ids(rest) == ids
+    assert list(export_ndjson(1, cursor=ids[-1])) == []
+
+
+def test_csv_writes_the_header_only_on_the_first_request(logs):
+    ids = logs(5)
+
+    full = list(csv.reader(io.StringIO(''.join(export_csv(1, chunk_rows=2)))))
+    assert full[0] == CSV_COLUMNS
+    assert [int(row[0]) for row in full[1:]] == ids
+    assert full[1][CSV_COLUMNS.index('bot_response')] == 'Hi, "there"'
+
+    resumed = list(csv.reader(io.StringIO(''.join(export_csv(1, cursor=ids[1], chunk_rows=2)))))
+    assert [int(row[0]) for row in resumed] == ids[2:]
+
+
+def test_resuming_spans_archived_and_live_rows(logs):
+    archived = logs(3, days_ago=100)
+    live = logs(2)
+    assert chat_archive.archive_site(1, NOW - timedelta(days=30)) == 3
+
+    assert _ndjson_ids(''.join(export_ndjson(1, cursor=archived[0], chunk_rows=2))) == archived[1:] + live
+    assert _ndjson_ids(''.join(export_ndjson(1, cursor=archived[-1]))) == live
+
+
+def test_export_route_resumes_from_the_cursor(client, logs):
+    ids = logs(4)
+    with client.session_transaction() as s:
+        s['admin_id'] = 1
+        s['site_id'] = 1
+
+    response = client.get('/admin/api/client/chat-logs/export')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=chat-logs-site-1.ndjson'
+    assert _ndjson_ids(response.get_data(as_text=True)) == ids
+
+    response = client.get(f'/admin/api/client/chat-logs/export?format=csv&cursor={ids[1]}')
+    assert response.headers['Content-Disposition'] == f'attachment; filename=chat-logs-site-1-from-{ids[1]}.csv'
+    assert [int(row[0]) for row in csv.reader(io.StringIO(response.get_data(as_text=True)))] == ids[2:]
+
+    assert client.get('/admin/api/client/chat-logs/export?format=xml').status_code == 400
@@ -0,0 +1,139 @@
+"""FAQ full-text search: FTS5 matching, the fallback in respond, FAQs unique per site."""
+import sqlite3
+from pathlib import Path
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from services.faq_search import best_faq, search_faqs
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / 'scripts' / 'migrations'
+
+
+@pytest.fixture
+def faqs(db_session):
+    from models import FAQ
+
+    def add(question, answer, site_id=0, sector=None):
+        faq = FAQ(question=question, answer=answer, site_id=site_id, sector=sector)
+        db_session.add(faq)
+        db_session.commit()
+        return faq.id
+
+    return add
+
+
+def test_search_matches_stemmed_words_and_ranks_questions_first(faqs):
+    shipping = faqs('How long does shipping take?', 'Orders arrive within five working days.')
+    faqs('Can I pay by card?', 'We accept every major card; shipping is free above 50 euros.')
+
+    results = search_faqs('shipped orders')
+    assert results[0]['id'] == shipping
+    assert results[0]['coverage'] == 1.0
+
+    # question words weigh twice as much as answer words
+    assert [r['id'] for r in search_faqs('shipping')][0] == shipping
+    assert search_faqs('refund') == []
+    assert search_faqs('?!') == []
+
+
+def test_search_sees_edits_and_deletes(faqs, db_session):
+    from models import FAQ
+
+    faq_id = faqs('Where is your shop?', 'In the old town.')
+    faq = db_session.get(FAQ, faq_id)
+    faq.question = 'What are your opening hours?'
+    db_session.commit()
+    assert search_faqs('shop') == []
+    assert [r['id'] for r in search_faqs('opening hours')] == [faq_id]
+
+    db_session.delete(faq)
+    db_session.commit()
+    assert search_faqs('opening hours') == []
+
+
+def test_search_is_scoped_to_the_site_and_the_shared_faqs(faqs):
+    shared = faqs('Do you deliver abroad?', 'Yes, across Europe.')
+    own = faqs('Do you deliver on Sundays?', 'Only in the city centre.', site_id=1)
+    faqs('Do you deliver to islands?', 'Not yet.', site_id=2)
+
+    assert {r['id'] for r in search_faqs('deliver', site_id=1)} == {shared, own}
+    assert {r['id'] for r in search_faqs('deliver')} == {shared}
+
+
+def test_sector_filter_keeps_untagged_faqs(faqs):
+    untagged = faqs('How do I book?', 'Online or by phone.')
+    hotel = faqs('How do I book a room?', 'Pick your dates.', sector='hotel')
+    faqs('How do I book a table?', 'Call the restaurant.', sector='restaurant')
+
+    assert {r['id'] for r in search_faqs('book', sector='hotel')} == {untagged, hotel}
+
+
+def test_best_faq_requires_coverage_and_prefers_the_site_copy(faqs):
+    faqs('What is your return policy?', 'Thirty days, no questions asked.')
+    own = faqs('What is your return policy?', 'Fourteen days with the receipt.', site_id=1)
+
+    assert best_faq('return policy', site_id=1)['id'] == own
+    assert best_faq('return policy')['answer'] == 'Thirty days, no questions asked.'
+    # one word in five is below FAQ_SEARCH_MIN_COVERAGE
+    assert best_faq('return my broken blue bicycle') is None
+
+
+def test_search_without_the_fts_table_finds_nothing(faqs, db_session):
+    faqs('How long does shipping take?', 'Five working days.')
+    for trigger in ('faqs_fts_ai', 'faqs_fts_ad', 'faqs_fts_au'):
+        db_session.execute(text(f'DROP TRIGGER {trigger}'))
+    db_session.execute(text('DROP TABLE faqs_fts'))
+    db_session.commit()
+
+    assert search_faqs('shipping') == []
+    # the session is still usable after the failed search
+    assert best_faq('shipping') is None
+    faqs('Where are you?', 'In the old town.')
+
+
+def test_respond_answers_unknown_messages_from_the_faqs(faqs, db_session):
+    from models import UnansweredQuestion
+    from services.intent_service import respond
+
+    faq_id = faqs('How long does shipping take?', 'Five working days.', site_id=1)
+    unknown = {'intent_name': 'UNKNOWN', 'confidence': 0.1, 'response': 'Sorry?', 'unanswered': True}
+
+    reply = respond('how long is shipping', 1, 1, unknown, None)
+    assert (reply['intent_name'], reply['faq_id'], reply['text']) == ('FAQ', faq_id, 'Five working days.')
+    assert UnansweredQuestion.query.count() == 0
+
+    # another site's FAQ does not answer; the message is then logged as unanswered
+    reply = respond('how long is shipping', 1, 2, unknown, None)
+    assert (reply['intent_name'], reply['text']) == ('UNKNOWN', 'Sorry?')
+    assert [q.question for q in UnansweredQuestion.query] == ['how long is shipping']
+
+
+def test_questions_are_unique_per_site(faqs, db_session):
+    faqs('Are you open today?', 'Until six.')
+    faqs('Are you open today?', 'Until eight.', site_id=1)
+    faqs('Are you open today?', 'Closed on Mondays.', site_id=2)
+
+    with pytest.raises(IntegrityError):
+        faqs('Are you open today?', 'Until nine.', site_id=1)
+    db_session.rollback()
+
+
+def test_migration_009_keeps_ids_and_the_fts_index():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+        CREATE TABLE faqs (id INTEGER NOT NULL PRIMARY KEY, question VARCHAR(500) NOT NULL UNIQUE,
+                           answer TEXT NOT NULL, category VARCHAR(100), created_at DATETIME, updated_at DATETIME);
+        INSERT INTO faqs (id, question, answer) VALUES (7, 'Are you open today?', 'Until six.');
+    """)
+    conn.executescript((MIGRATIONS / '007_faq_fts.sql').read_text())
+    conn.executescript((MIGRATIONS / '009_faq_unique_per_site.sql').read_text())
+
+    conn.execute("INSERT INTO faqs (site_id, question, answer) VALUES (1, 'Are you open today?', 'Until eight.')")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO faqs (site_id, question, answer) VALUES (1, 'Are you open today?', 'Until nine.')")
+    matches = conn.execute("SELECT f.id, f.site_id FROM faqs_fts JOIN faqs f ON f.id = faqs_fts.rowid "
+                           "WHERE faqs_fts MATCH 'open' ORDER BY f.id").fetchall()
+    assert matches == [(7, 0), (8, 1)]
+    conn.close()
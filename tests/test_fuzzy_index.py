@@ -0,0 +1,93 @@
+"""FuzzyVocabulary returns exactly what the pairwise fuzz.ratio scan it replaces returns."""
+import random
+import string
+
+import pytest
+from thefuzz import fuzz
+
+from core.fuzzy_index import FuzzyVocabulary, MAX_DELETES, max_deletes
+from core.tenant_index import FUZZY_TOKEN_THRESHOLD
+
+
+def pairwise(tokens, query, threshold):
+    found = {}
+    for tid, tok in enumerate(tokens):
+        score = fuzz.ratio(tok, query) / 100.0
+        if score * 100 >= threshold:
+            found[tid] = score
+    return found
+
+
+def word(rng, length):
+    return ''.join(rng.choice('abcdefghij') for _ in range(length))
+
+
+def typo(rng, token):
+    chars = list(token)
+    for _ in range(rng.choice((1, 1, 2, 3))):
+        i = rng.randrange(len(chars))
+        op = rng.random()
+        if op < 0.4:
+            chars[i] = rng.choice('abcdefghij')
+        elif op < 0.7 and len(chars) > 1:
+            del chars[i]
+        else:
+            chars.insert(i, rng.choice('abcdefghij'))
+    return ''.join(chars)
+
+
+def vocabulary(rng):
+    # A small alphabet, so many pairs land near the threshold; lengths 1-16 cover
+    # every delete depth up to and past MAX_DELETES
+    return sorted({word(rng, rng.randint(1, 16)) for _ in range(300)})
+
+
+def queries(rng, tokens, threshold):
+    found = [rng.choice(tokens) for _ in range(20)]
+    found += [typo(rng, rng.choice(tokens)) for _ in range(100)]
+    found += [word(rng, length) for length in range(1, 19)]
+    # Tokens scoring exactly at and one point below the threshold against the token they come from
+    boundary = {threshold: [], threshold - 1: []}
+    for _ in range(50000):
+        if all(len(q) >= 5 for q in boundary.values()):
+            break
+        source = rng.choice(tokens)
+        candidate = typo(rng, source)
+        score = fuzz.ratio(source, candidate)
+        if score in boundary and len(boundary[score]) < 5:
+            boundary[score].append(candidate)
+    assert all(boundary.values())
+    return found + boundary[threshold] + boundary[threshold - 1]
+
+
+@pytest.mark.parametrize('threshold', [FUZZY_TOKEN_THRESHOLD, 75, 90])
+def test_neighbours_match_the_pairwise_scan(threshold):
+    rng = random.Random(threshold)
+    tokens = vocabulary(rng)
+    index = FuzzyVocabulary(tokens, threshold)
+    for query in queries(rng, tokens, threshold):
+        assert index.neighbours(query) == pairwise(tokens, query, threshold), query
+
+
+def test_tokens_added_after_the_build_are_found():
+    rng = random.Random(7)
+    tokens = vocabulary(rng)
+    index = FuzzyVocabulary(tokens, FUZZY_TOKEN_THRESHOLD)
+    probes = [typo(rng, rng.choice(tokens)) for _ in range(50)]
+    for query in probes:
+        index.neighbours(query)  # fill the memo, which add() must drop
+
+    for new in [word(rng, length) for length in (2, 5, 9, 14)] + probes[:20]:
+        if new not in tokens:
+            tokens.append(new)
+            index.add(len(tokens) - 1)
+    for query in probes:
+        assert index.neighbours(query) == pairwise(tokens, query, FUZZY_TOKEN_THRESHOLD), query
+
+
+def test_long_tokens_are_compared_directly():
+    assert max_deletes(16, FUZZY_TOKEN_THRESHOLD) > MAX_DELETES
+    tokens = ['abcdefghijabcdef', 'abcdefghijabcdeg', 'ab', string.ascii_lowercase]
+    index = FuzzyVocabulary(tokens, FUZZY_TOKEN_THRESHOLD)
+    for query in ('abcdefghijabcdef', 'abcdefghijabcde', 'bcdefghijabcdefx', string.ascii_lowercase[:-3], 'a'):
+        assert index.neighbours(query) == pairwise(tokens, query, FUZZY_TOKEN_THRESHOLD)
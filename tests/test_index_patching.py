@@ -0,0 +1,128 @@
+"""Patching a resident index (add/remove/update, then compaction) scores like a freshly built one."""
+import pytest
+
+from core import tenant_index
+from core.intent_engine import best_phrase_match
+from core.tenant_index import IntentRecord, compile_index, patch_index, tenant_cache, build_index
+from core.tokenizer import tokenize
+
+MESSAGES = ['what are your opening hours', 'refund', 'i want my money back please', 'human',
+            'oppening hours sunday', 'shipping to canada', 'do you deliver abroad', 'when do you open']
+
+
+def _record(intent_id, name, confidence=1.0):
+    return IntentRecord(intent_id, 1, name, 'info', f'{name} reply', confidence, None)
+
+
+def _results(index):
+    results = []
+    for message in MESSAGES:
+        tokens = tokenize(message)
+        best = best_phrase_match(tokens, [(index, frozenset())], fuzzy_maps=[index.fuzzy_scores(tokens)])
+        results.append((message, best['intent'] and best['intent'].id, best['score']))
+    return results
+
+
+def _phrases(index):
+    return sorted((index.phrase_ids[p], index.intents[index.phrase_intent[p]].id, index.phrase_words(p))
+                  for p in range(index.phrase_count) if index.phrase_intent[p] >= 0)
+
+
+def test_patched_and_compacted_index_scores_like_a_fresh_one():
+    intents = [_record(1, 'opening_hours'), _record(2, 'refunds', 0.9), _record(3, 'human')]
+    phrases = {
+        1: [(10, 'opening hours'), (11, 'when do you open')],
+        2: [(20, 'refund policy'), (21, 'can i get my money back')],
+        3: [(30, 'talk to a human')],
+    }
+    index = compile_index(1, 1, intents, phrases, with_embeddings=False)
+    index.fuzzy_vocabulary()  # patches must keep it in step too
+
+    index.add_phrase(1, 12, 'what time do you open on sunday')
+    index.update_phrase(2, 21, 'i want my money back')
+    index.remove_phrase(10)
+    index.upsert_intent(_record(4, 'shipping'))
+    index.add_phrase(4, 40, 'do you deliver abroad')
+    index.add_phrase(4, 41, 'shipping to canada')
+    index.upsert_intent(_record(2, 'refunds', 0.5))
+    index.remove_intent(3)
+    assert (index.tombstones, index.deleted_intents) == (3, 1)
+
+    fresh = compile_index(1, 1, [_record(1, 'opening_hours'), _record(2, 'refunds', 0.5), _record(4, 'shipping')], {
+        1: [(11, 'when do you open'), (12, 'what time do you open on sunday')],
+        2: [(20, 'refund policy'), (21, 'i want my money back')],
+        4: [(40, 'do you deliver abroad'), (41, 'shipping to canada')],
+    }, with_embeddings=False)
+
+    assert _phrases(index) == _phrases(fresh)
+    assert _results(index) == _results(fresh)
+    compacted = index.compacted()
+    assert (compacted.tombstones, compacted.deleted_intents, compacted.phrase_count) == (0, 0, 6)
+    assert _phrases(compacted) == _phrases(fresh)
+    assert list(compacted.phrase_ids) == list(fresh.phrase_ids)
+    assert _results(compacted) == _results(fresh)
+
+
+def test_a_missing_embedding_leaves_the_arrays_untouched():
+    index = compile_index(1, 1, [_record(1, 'opening_hours')], {1: [(10, 'opening hours')]}, with_embeddings=False)
+    index.embeddings = object()  # stands in for a phrase matrix: add_phrase must not reach it
+    sizes = [len(getattr(index, name)) for name in ('phrase_intent', 'phrase_offsets', 'phrase_tokens', 'phrase_ids')]
+    with pytest.raises(ValueError):
+        index.add_phrase(1, 11, 'when do you open')
+    with pytest.raises(ValueError):
+        index.update_phrase(1, 10, 'opening times')
+    assert [len(getattr(index, name)) for name in
+            ('phrase_intent', 'phrase_offsets', 'phrase_tokens', 'phrase_ids')] == sizes
+    assert index.tombstones == 0
+
+
+def test_scoring_skips_an_intent_being_removed():
+    index = compile_index(1, 1, [_record(1, 'opening_hours'), _record(2, 'opening_times')],
+                          {1: [(10, 'opening hours')], 2: [(20, 'opening times')]}, with_embeddings=False)
+    # A scorer that read phrase 10's position just before remove_intent cleared the record
+    index.intents[0] = None
+    best = best_phrase_match(tokenize('opening hours'), [(index, frozenset())])
+    assert best['intent'].id == 2
+
+
+def _create(client, name, phrases):
+    response = client.post('/admin/api/client/intents', json={
+        'intent_name': name, 'intent_type': 'info', 'confidence': 1.0, 'response': name, 'phrases': phrases})
+    return response.get_json()['intent']['id']
+
+
+def test_admin_edits_patch_and_compact_the_resident_index(app, client, monkeypatch):
+    from models import IntentPhrase
+
+    monkeypatch.setattr(tenant_index, 'COMPACT_MIN_TOMBSTONES', 2)
+    with client.session_transaction() as s:
+        s['admin_id'] = 1
+        s['site_id'] = 1
+    with app.app_context():
+        resident = tenant_cache.get(1)
+        hours = _create(client, 'opening_hours', ['opening hours', 'when do you open'])
+        refunds = _create(client, 'refunds', ['refund policy', 'can i get my money back'])
+        assert tenant_cache.peek(1) is resident
+        client.post(f'/admin/api/client/intents/{hours}/phrases', json={'phrase': 'what time do you open'})
+        assert tenant_cache.peek(1) is resident  # patched in place, not reloaded
+        phrase_id = IntentPhrase.query.filter_by(intent_id=refunds, phrase='refund policy').one().id
+        client.put(f'/admin/api/client/phrases/{phrase_id}', json={'phrase': 'refunds and returns'})
+        client.delete(f'/admin/api/client/intents/{refunds}')
+
+        patched = tenant_cache.peek(1)
+        assert patched is not resident and patched.tombstones == 0  # compacted
+        fresh = build_index(1)
+        assert patched.version == fresh.version
+        assert _phrases(patched) == _phrases(fresh)
+        assert _results(patched) == _results(fresh)
+
+
+def test_a_failed_patch_drops_the_resident_index(app):
+    with app.app_context():
+        index = tenant_cache.get(1)
+
+        def broken(index):
+            raise RuntimeError('boom')
+        with pytest.raises(RuntimeError):
+            patch_index(1, index.version, index.version + 1, broken)
+        assert tenant_cache.peek(1) is None
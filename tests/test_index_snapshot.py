@@ -0,0 +1,130 @@
+"""Index snapshots: write -> mmap load round trip, and files the reader must reject."""
+import pytest
+
+from core.index_snapshot import (
+    HEADER, FORMAT_VERSION, FLAG_EMBEDDINGS, FLAG_EMBEDDINGS_FAILED, read_snapshot, write_snapshot
+)
+from core.intent_engine import best_phrase_match
+from core.tenant_index import IntentRecord, compile_index, snapshot_path, tenant_cache
+from core.tokenizer import tokenize
+
+INTENTS = [
+    IntentRecord(1, 1, 'opening_hours', 'info', 'We open at 9.', 1.0, None),
+    IntentRecord(2, 1, 'refunds', 'info', 'Refunds take {refund_days} days.', 0.9, 0.5),
+    IntentRecord(3, 1, 'human', 'HUMAN', None, None, None),
+]
+PHRASES = {
+    1: [(10, 'opening hours'), (11, 'when do you open'), (12, 'what time do you close on sundays')],
+    2: [(20, 'refund policy'), (21, 'can i get my money back'), (22, '')],
+    3: [(30, 'talk to a human please'), (31, 'real person')],
+}
+MESSAGES = ['what are your opening hours', 'refund', 'i want my money back', 'human',
+            'oppening hours sunday', 'nothing relevant here']
+
+
+@pytest.fixture
+def index():
+    return compile_index(1, 7, INTENTS, PHRASES, with_embeddings=False)
+
+
+def _rewrite_header(path, **fields):
+    names = ('magic', 'fmt', 'flags', 'site_id', 'version', 'n_tokens', 'n_intents',
+             'n_phrases', 'n_phrase_tokens', 'emb_dim')
+    with open(path, 'r+b') as f:
+        values = dict(zip(names, HEADER.unpack(f.read(HEADER.size))))
+        values.update(fields)
+        f.seek(0)
+        f.write(HEADER.pack(*(values[name] for name in names)))
+
+
+def test_round_trip_maps_the_arrays_and_scores_the_same(index, tmp_path):
+    path = str(tmp_path / 'site_1.idx')
+    write_snapshot(index, path)
+    loaded = read_snapshot(path)
+
+    assert (loaded.site_id, loaded.version, loaded.embeddings, loaded.embeddings_failed) == (1, 7, None, False)
+    assert loaded.tokens == index.tokens
+    assert [r.to_list() for r in loaded.intents] == [r.to_list() for r in index.intents]
+    for name in ('canon', 'phrase_intent', 'phrase_offsets', 'phrase_tokens',
+                 'phrase_weights', 'phrase_totals', 'phrase_ids'):
+        assert isinstance(getattr(loaded, name), memoryview), name
+        assert list(getattr(loaded, name)) == list(getattr(index, name)), name
+    assert loaded.memory_usage()['mapped_bytes'] > 0
+
+    for message in MESSAGES:
+        tokens = tokenize(message)
+        fuzzy = [loaded.fuzzy_scores(tokens, None)]
+        assert loaded.phrase_scores(tokens, fuzzy_scores=fuzzy[0]) == \
+            index.phrase_scores(tokens, fuzzy_scores=index.fuzzy_scores(tokens, None))
+        ours, theirs = best_phrase_match(tokens, [(loaded, frozenset())], fuzzy_maps=fuzzy), \
+            best_phrase_match(tokens, [(index, frozenset())], fuzzy_maps=[index.fuzzy_scores(tokens, None)])
+        assert (ours['intent'] and ours['intent'].id, ours['score']) == \
+            (theirs['intent'] and theirs['intent'].id, theirs['score'])
+
+
+def test_patched_indexes_are_written_compacted(index, tmp_path):
+    index.remove_phrase(11)
+    index.remove_intent(3)
+    path = str(tmp_path / 'site_1.idx')
+    write_snapshot(index, path)
+    loaded = read_snapshot(path)
+    assert list(loaded.phrase_ids) == [10, 12, 20, 21]
+    assert [r.id for r in loaded.intents] == [1, 2]
+    assert (loaded.tombstones, loaded.deleted_intents) == (0, 0)
+
+
+def test_embeddings_round_trip(index, tmp_path):
+    pytest.importorskip('sentence_transformers')
+    import torch
+
+    index.embeddings = torch.rand(index.phrase_count, 8)
+    path = str(tmp_path / 'site_1.idx')
+    write_snapshot(index, path)
+    loaded = read_snapshot(path)
+    assert torch.equal(loaded.embeddings, index.embeddings)
+    assert not loaded.embeddings_failed
+
+
+def test_failed_embeddings_are_remembered(index, tmp_path):
+    index.embeddings_failed = True
+    path = str(tmp_path / 'site_1.idx')
+    write_snapshot(index, path)
+    assert read_snapshot(path).embeddings_failed
+
+
+@pytest.mark.parametrize('fields', [
+    {'fmt': FORMAT_VERSION - 1},
+    {'fmt': FORMAT_VERSION + 1},
+    {'magic': b'CBTIDX\x00\x02'},
+    {'flags': 4},
+    {'flags': FLAG_EMBEDDINGS | FLAG_EMBEDDINGS_FAILED},
+    # Claims embeddings the file does not hold
+    {'flags': FLAG_EMBEDDINGS, 'emb_dim': 384},
+    {'flags': FLAG_EMBEDDINGS},
+    {'n_phrases': 99},
+])
+def test_mismatched_headers_are_rejected(index, tmp_path, fields):
+    path = str(tmp_path / 'site_1.idx')
+    write_snapshot(index, path)
+    _rewrite_header(path, **fields)
+    assert read_snapshot(path) is None
+
+
+def test_truncated_and_missing_files_are_rejected(index, tmp_path):
+    path = tmp_path / 'site_1.idx'
+    assert read_snapshot(str(path)) is None
+    write_snapshot(index, str(path))
+    data = path.read_bytes()
+    for size in (10, HEADER.size + 8, len(data) // 2):
+        path.write_bytes(data[:size])
+        assert read_snapshot(str(path)) is None
+
+
+def test_rejected_snapshots_are_rebuilt_from_the_database(app):
+    with app.app_context():
+        path = snapshot_path(1)
+        write_snapshot(compile_index(1, 0, [], {}, with_embeddings=False), path)
+        _rewrite_header(path, fmt=FORMAT_VERSION + 1)
+        assert read_snapshot(path) is None
+        tenant_cache.get(1)
+        assert read_snapshot(path).version == tenant_cache.get(1).version
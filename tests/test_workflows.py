@@ -0,0 +1,200 @@
+"""Workflow executor: timeouts, per-workflow concurrency, result cache, pool sizing and URL checks."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from workflows import executor
+from workflows.executor import (
+    REGISTRY, workflow, run_workflow, submit_workflow, invalidate_cache, pool_size,
+    WorkflowBusy, WorkflowTimeout
+)
+from workflows import handler
+from workflows.handler import track_order, TRACK_ORDER_TIMEOUT
+from workflows.http import fit_timeout, check_public_url, UnsafeURL, RETRIES
+
+calls = []
+release = threading.Event()
+
+
+@workflow(name='test_slow', timeout=0.05, max_concurrency=1)
+def slow_workflow(client_id, **kwargs):
+    release.wait(5)
+    return {'done': True}
+
+
+@workflow(name='test_cached', timeout=1.0, max_concurrency=2, cache_ttl=60,
+          parse_args=lambda message: {'key': message})
+def cached_workflow(client_id, key=None, **kwargs):
+    calls.append((client_id, key))
+    return {'client_id': client_id, 'key': key} if key != 'none' else None
+
+
+def _cached(count):
+    # The pool thread fills the cache in a done-callback, just after result() returns here
+    deadline = time.monotonic() + 2
+    while len(executor._cache) < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    calls.clear()
+    release.clear()
+    invalidate_cache()
+    yield
+    release.set()
+
+
+def test_timeout_keeps_the_slot_until_the_handler_returns(app):
+    with app.app_context():
+        with pytest.raises(WorkflowTimeout):
+            run_workflow('test_slow', 1)
+        # The timed-out call still runs, so the only slot is taken
+        with pytest.raises(WorkflowBusy):
+            run_workflow('test_slow', 1)
+        release.set()
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            try:
+                future, _ = submit_workflow('test_slow', 1)
+                break
+            except WorkflowBusy:
+                time.sleep(0.01)
+        else:
+            pytest.fail('slot was not released after the handler returned')
+        assert future.result(timeout=1) == {'done': True}
+
+
+def test_cache_is_per_client_and_args_and_dropped_on_invalidate(app):
+    with app.app_context():
+        assert run_workflow('test_cached', 1, 'a') == {'client_id': 1, 'key': 'a'}
+        _cached(1)
+        assert run_workflow('test_cached', 1, 'a') == {'client_id': 1, 'key': 'a'}
+        run_workflow('test_cached', 2, 'a')
+        run_workflow('test_cached', 1, 'b')
+        _cached(3)
+        assert calls == [(1, 'a'), (2, 'a'), (1, 'b')]
+
+        invalidate_cache(1)
+        run_workflow('test_cached', 1, 'a')
+        run_workflow('test_cached', 2, 'a')
+        assert calls[3:] == [(1, 'a')]
+
+
+def test_none_results_are_not_cached(app):
+    with app.app_context():
+        assert run_workflow('test_cached', 1, 'none') is None
+        assert run_workflow('test_cached', 1, 'none') is None
+    assert len(calls) == 2
+
+
+def test_pool_fits_every_workflow_at_its_limit():
+    assert pool_size() >= sum(spec.max_concurrency for spec in REGISTRY.values())
+
+
+@pytest.mark.parametrize('budget', [0.5, 1.0, TRACK_ORDER_TIMEOUT])
+def test_http_attempts_fit_the_workflow_timeout(budget):
+    connect, read = fit_timeout(budget)
+    assert connect > 0 and read > 0
+    assert (RETRIES + 1) * (connect + read) < budget
+
+
+class _SlowOrders(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(TRACK_ORDER_TIMEOUT * 2)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _RedirectingOrders(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(302)
+        self.send_header('Location', 'http://169.254.169.254/latest/meta-data/')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def order_server(app, monkeypatch):
+    """Start a local order API as the site's order_api_url (its host allowlisted)."""
+    from database import db
+    from models import ClientConfig
+
+    servers = []
+    monkeypatch.setattr(handler, 'ORDER_API_ALLOWED_HOSTS', {'127.0.0.1'})
+
+    def start(handler_class):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        server.daemon_threads = True
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        with app.app_context():
+            db.session.add(ClientConfig(client_id=1, key='order_api_url',
+                                        value=f'http://127.0.0.1:{server.server_port}'))
+            db.session.commit()
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_track_order_gives_up_within_its_timeout(app, order_server):
+    order_server(_SlowOrders)
+    with app.app_context():
+        start = time.monotonic()
+        with pytest.raises(requests.RequestException):
+            track_order(1, order_id='A1234')
+        assert time.monotonic() - start < TRACK_ORDER_TIMEOUT
+
+
+def test_track_order_does_not_follow_redirects(app, order_server):
+    order_server(_RedirectingOrders)
+    with app.app_context():
+        with pytest.raises(UnsafeURL):
+            track_order(1, order_id='A1234')
+
+
+@pytest.mark.parametrize('url', [
+    'http://93.184.216.34/api',  # not https
+    'https://127.0.0.1/api',
+    'https://localhost:8443/api',
+    'https://10.0.0.5/api',
+    'https://192.168.1.10/api',
+    'https://169.254.169.254/latest',  # cloud metadata
+    'https://[::1]/api',
+    'https://[fe80::1]/api',
+    'https://0.0.0.0/api',
+    'file:///etc/passwd',
+])
+def test_unsafe_urls_are_refused(url):
+    with pytest.raises(UnsafeURL):
+        check_public_url(url)
+
+
+def test_public_and_allowlisted_urls_pass():
+    assert check_public_url('https://93.184.216.34/api') == 'https://93.184.216.34/api'
+    assert check_public_url('http://orders.internal:8080', {'orders.internal'}) == 'http://orders.internal:8080'
+
+
+def test_track_order_refuses_a_private_site_url(app, monkeypatch):
+    from database import db
+    from models import ClientConfig
+
+    def no_requests():
+        raise AssertionError('track_order made a request')
+
+    monkeypatch.setattr(handler, 'http_session', no_requests)
+    with app.app_context():
+        db.session.add(ClientConfig(client_id=1, key='order_api_url', value='https://169.254.169.254'))
+        db.session.commit()
+        with pytest.raises(UnsafeURL):
+            track_order(1, order_id='A1234')
@@ -0,0 +1,193 @@
+"""Workflow execution: declared registry, timeouts, concurrency limits, result cache.
+
+Handlers register themselves with the @workflow decorator (see handler.py):
+
+    @workflow(timeout=3.0, max_concurrency=8, cache_ttl=60, parse_args=parse_order_id)
+    def track_order(client_id, order_id=None, **kwargs): ...
+
+run_workflow() executes a handler on a shared, bounded thread pool inside an
+app context and waits at most `timeout` seconds. The pool has at least as
+many threads as all workflows' max_concurrency together, so an admitted
+call never queues behind another workflow's calls. Each workflow may only have
+`max_concurrency` calls in flight; a call that times out keeps its slot
+until the handler really returns, so a slow upstream can saturate its own
+workflow but never the whole pool or the request workers. Results can be
+cached for `cache_ttl` seconds keyed by (workflow, client_id, parsed args);
+a config change for the client drops its cached results.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app
+from services.tenant_changes import on_tenant_change
+from config import (
+    WORKFLOW_MAX_WORKERS, WORKFLOW_DEFAULT_TIMEOUT, WORKFLOW_DEFAULT_CONCURRENCY, WORKFLOW_CACHE_MAX_ENTRIES
+)
+
+
+class WorkflowError(Exception):
+    """Base class for workflow execution failures"""
+
+
+class UnknownWorkflow(WorkflowError):
+    pass
+
+
+class WorkflowBusy(WorkflowError):
+    """The workflow already has max_concurrency calls in flight"""
+
+
+class WorkflowTimeout(WorkflowError):
+    pass
+
+
+class WorkflowSpec:
+    __slots__ = ('name', 'func', 'timeout', 'max_concurrency', 'cache_ttl', 'parse_args', 'slots')
+
+    def __init__(self, name, func, timeout, max_concurrency, cache_ttl, parse_args):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+        self.parse_args = parse_args
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+
+REGISTRY = {}
+
+
+def workflow(name=None, timeout=WORKFLOW_DEFAULT_TIMEOUT, max_concurrency=WORKFLOW_DEFAULT_CONCURRENCY,
+             cache_ttl=0, parse_args=None):
+    """Register a handler. parse_args(message) -> dict of keyword args for the handler."""
+    def decorator(func):
+        key = name or func.__name__
+        REGISTRY[key] = WorkflowSpec(key, func, timeout, max_concurrency, cache_ttl, parse_args)
+        return func
+    return decorator
+
+
+def is_registered(name) -> bool:
+    return name in REGISTRY
+
+
+# --- result cache ---
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _cache[key]
+            return None
+        return entry[1]
+
+
+def _cache_put(key, value, ttl):
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + ttl, value)
+        _cache.move_to_end(key)
+        while len(_cache) > WORKFLOW_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def invalidate_cache(client_id=None):
+    """Drop cached results (for one client, or all)."""
+    with _cache_lock:
+        if client_id is None:
+            _cache.clear()
+        else:
+            for key in [k for k in _cache if k[1] == client_id]:
+                del _cache[key]
+
+
+@on_tenant_change
+def _on_tenant_change(site_id, intents_changed, config_changed):
+    if config_changed:
+        invalidate_cache(site_id)
+
+
+# --- executor ---
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def pool_size() -> int:
+    """WORKFLOW_MAX_WORKERS, raised to the sum of the registered workflows' max_concurrency."""
+    return max(WORKFLOW_MAX_WORKERS, sum(spec.max_concurrency for spec in REGISTRY.values()))
+
+
+def _get_pool():
+    # Thread pools do not survive fork (gunicorn preload), so build one per process
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=pool_size(), thread_name_prefix='workflow')
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _call(app, spec, kwargs):
+    try:
+        with app.app_context():
+            return spec.func(**kwargs)
+    finally:
+        spec.slots.release()
+
+
+def submit_workflow(name: str, client_id: int, message: str = None):
+    """Start a workflow and return (future, cache_hit_value).
+
+    The future is None when the result came from the cache.
+    """
+    spec = REGISTRY.get(name)
+    if spec is None:
+        raise UnknownWorkflow(name)
+
+    args = spec.parse_args(message or '') if spec.parse_args else {}
+    cache_key = (name, client_id, tuple(sorted(args.items())))
+    if spec.cache_ttl:
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return None, cached
+
+    if not spec.slots.acquire(blocking=False):
+        raise WorkflowBusy(name)
+    kwargs = dict(args, client_id=client_id, message=message)
+    try:
+        future = _get_pool().submit(_call, current_app._get_current_object(), spec, kwargs)
+    except Exception:
+        spec.slots.release()
+        raise
+    if spec.cache_ttl:
+        future.add_done_callback(
+            lambda f: f.exception() is None and f.result() is not None and _cache_put(cache_key, f.result(), spec.cache_ttl)
+        )
+    return future, None
+
+
+def wait_workflow(name: str, future, timeout: float = None):
+    """Wait for a submitted workflow, raising WorkflowTimeout after its timeout."""
+    spec = REGISTRY[name]
+    try:
+        return future.result(timeout=timeout if timeout is not None else spec.timeout)
+    except FutureTimeout:
+        raise WorkflowTimeout(name)
+
+
+def run_workflow(name: str, client_id: int, message: str = None):
+    """Run a registered workflow with its timeout, concurrency limit and cache."""
+    future, cached = submit_workflow(name, client_id, message)
+    if future is None:
+        return cached
+    return wait_workflow(name, future)
@@ -1,7 +1,23 @@
+import re
+from config import ORDER_API_URL, ORDER_API_ALLOWED_HOSTS
 from models import ClientConfig
+from workflows.executor import workflow
+from workflows.http import http_session, fit_timeout, check_public_url, UnsafeURL
 
-# Example workflow handlers. Each receives contextual parameters and returns a dict
+# Example workflow handlers. Each receives contextual parameters and returns a dict.
+# Register handlers with @workflow so the executor can enforce timeouts,
+# concurrency limits and result caching (see workflows/executor.py).
 
+ORDER_ID_RE = re.compile(r'#?\b([A-Za-z]{0,4}-?\d[\w-]{2,})\b')
+
+
+def parse_order_id(message: str) -> dict:
+    """Pull an order reference such as '#A1234' or 'ORD-5521' out of the message."""
+    match = ORDER_ID_RE.search(message or '')
+    return {'order_id': match.group(1).upper() if match else None}
+
+
+@workflow(timeout=1.0, max_concurrency=16, cache_ttl=30)
 def get_price(client_id: int, **kwargs):
     """Return pricing info from ClientConfig for a client_id."""
     cfg = ClientConfig.query.filter_by(client_id=client_id, key='consultation_price').first()
@@ -9,7 +25,30 @@ def get_price(client_id: int, **kwargs):
     return {'consultation_price': price}
 
 
+TRACK_ORDER_TIMEOUT = 3.0
+
+
+@workflow(timeout=TRACK_ORDER_TIMEOUT, max_concurrency=8, cache_ttl=60, parse_args=parse_order_id)
 def track_order(client_id: int, order_id: str = None, **kwargs):
-    """Placeholder: in a real system this would call an external API to fetch order status."""
-    # Demo response
-    return {'order_id': order_id, 'status': 'processing', 'eta': '2 days'}
+    """Fetch order status from the client's order API (ClientConfig 'order_api_url' or ORDER_API_URL).
+
+    A site's own URL must be https on a public host (or in ORDER_API_ALLOWED_HOSTS);
+    ORDER_API_URL is the operator's and is trusted.
+    """
+    cfg = ClientConfig.query.filter_by(client_id=client_id, key='order_api_url').first()
+    if cfg and cfg.value:
+        base_url = check_public_url(cfg.value.rstrip('/'), ORDER_API_ALLOWED_HOSTS)
+    else:
+        base_url = ORDER_API_URL.rstrip('/')
+    if not base_url or not order_id:
+        # Demo response
+        return {'order_id': order_id, 'status': 'processing', 'eta': '2 days'}
+
+    resp = http_session().get(f'{base_url}/orders/{order_id}', timeout=fit_timeout(TRACK_ORDER_TIMEOUT),
+                              allow_redirects=False)
+    if resp.status_code == 404:
+        return {'order_id': order_id, 'status': 'not_found'}
+    if resp.is_redirect:
+        raise UnsafeURL(f'{base_url} redirected to {resp.headers.get("Location")}')
+    resp.raise_for_status()
+    return resp.json()
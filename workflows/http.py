@@ -0,0 +1,89 @@
+"""Pooled HTTP client for workflows that call external APIs.
+
+One requests.Session per worker process keeps connections alive across
+workflow calls instead of opening a new TCP/TLS connection every time.
+Always pass an explicit timeout: requests applies it to every attempt, and
+a failed GET is retried RETRIES times, so use fit_timeout(workflow timeout)
+to keep all attempts inside the workflow's own timeout.
+
+URLs that tenants configure go through check_public_url() first, so a site
+cannot point a workflow at the server's own network.
+"""
+import ipaddress
+import os
+import socket
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import WORKFLOW_HTTP_POOL_SIZE
+
+RETRIES = 1
+BACKOFF_FACTOR = 0.05
+# Share of the workflow timeout left for the handler's own work (config lookups, parsing)
+_HANDLER_SHARE = 0.1
+
+_session = None
+_pid = None
+_lock = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    global _session, _pid
+    if _session is not None and _pid == os.getpid():
+        return _session
+    with _lock:
+        if _session is None or _pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=8,
+                pool_maxsize=WORKFLOW_HTTP_POOL_SIZE,
+                max_retries=Retry(total=RETRIES, backoff_factor=BACKOFF_FACTOR, allowed_methods=['GET'],
+                                  status_forcelist=[502, 503, 504])
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session, _pid = session, os.getpid()
+    return _session
+
+
+def fit_timeout(budget: float, connect: float = 0.5) -> tuple:
+    """(connect, read) timeouts with which every attempt, retries and backoff included, fits in `budget` seconds."""
+    attempts = RETRIES + 1
+    backoff = sum(BACKOFF_FACTOR * 2 ** i for i in range(RETRIES))
+    per_attempt = max(0.01, (budget * (1 - _HANDLER_SHARE) - backoff) / attempts)
+    connect = min(connect, per_attempt / 2)
+    return connect, per_attempt - connect
+
+
+class UnsafeURL(ValueError):
+    """A URL a workflow refuses to call: not https, or a host that is not on the public internet"""
+
+
+def check_public_url(url: str, allowed_hosts=()) -> str:
+    """Return `url` if it is https and its host resolves only to public addresses, else raise UnsafeURL.
+
+    Private, loopback, link-local (cloud metadata) and reserved addresses are
+    refused. Hosts in `allowed_hosts` pass as they are, e.g. an internal API
+    the operator trusts. Call it with redirects off, or a public host could
+    forward the request anywhere.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if not host:
+        raise UnsafeURL(f'No host in {url!r}')
+    if host in allowed_hosts:
+        return url
+    if parts.scheme != 'https':
+        raise UnsafeURL(f'{url!r} is not https')
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise UnsafeURL(f'Cannot resolve {host}: {e}')
+    for address in addresses:
+        # drop an IPv6 zone id ('fe80::1%eth0')
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global:
+            raise UnsafeURL(f'{host} resolves to {ip}, which is not a public address')
+    return url